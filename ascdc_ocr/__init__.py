@@ -0,0 +1,70 @@
+"""
+Client library for the ASCDC OCR platform (https://ocr.ascdc.tw).
+
+Importing the package is cheap: submodules (and requests / Pillow) are only imported when one of
+the names below is first used, and nothing touches the network or the disk until then.
+
+    from ascdc_ocr import ASCDCOCRClient, Book, File, GUID
+    python -m ascdc_ocr --help
+"""
+import importlib
+
+_EXPORTS = {
+    "ASCDCOCRClient": "client",
+    "CircuitBreaker": "client",
+    "OCRAPIError": "client",
+    "Book": "models",
+    "File": "models",
+    "GUID": "models",
+    "Settings": "config",
+    "Workflow": "workflow",
+    "scan_upload_folder": "workflow",
+    "is_uploadable": "workflow",
+    "FolderWatcher": "watch",
+    "WatchState": "watch",
+    "Metrics": "metrics",
+    "ResultCache": "cache",
+    "MultipartFileStream": "multipart",
+    "UploadProgress": "multipart",
+    "TokenBucket": "ratelimit",
+    "AdaptiveConcurrency": "concurrency",
+    "ConcurrentUploader": "upload",
+    "QueuePoller": "poller",
+    "OCRPipeline": "pipeline",
+    "JobLedger": "ledger",
+    "ContentIndex": "dedup",
+    "ImageOptimizer": "preprocess",
+    "optimize_image": "preprocess",
+    "ZipBatcher": "batching",
+    "PdfSplitter": "split",
+    "ResultWriter": "writer",
+    "read_shard": "writer",
+    "read_result_file": "writer",
+    "PageResult": "columnar",
+    "ColumnarWriter": "columnar",
+    "BookColumns": "columnar",
+    "SearchIndex": "search",
+    "RangeExporter": "export",
+    "BulkRenamer": "rename",
+    "rollback_renames": "rename",
+    "sanitize_filename": "naming",
+    "ensure_unique_path": "naming",
+    "load_rename_map": "naming",
+    "render_result_basename": "naming",
+    "find_existing_files_for_guid": "naming",
+}
+
+__all__ = sorted(_EXPORTS)
+
+
+def __getattr__(name):
+    module = _EXPORTS.get(name)
+    if module is None:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    value = getattr(importlib.import_module(f".{module}", __name__), name)
+    globals()[name] = value
+    return value
+
+
+def __dir__():
+    return sorted(set(globals()) | set(_EXPORTS))
@@ -0,0 +1,123 @@
+"""
+On-disk result cache.
+"""
+import json
+import os
+import threading
+import time
+import zlib
+from collections import OrderedDict
+
+# a temporary file this old was left by a crashed write (a live one is renamed within moments)
+_STALE_TMP_SECONDS = 3600
+
+
+class ResultCache:
+    """
+    Persistent on-disk cache for get_result / get_image, keyed by GUID.
+    OCR results never change once final, so a hit skips the network entirely.
+
+    Entries are compact JSON, zlib-compressed, one file per (kind, guid), written atomically.
+    Least-recently-used entries are evicted once the total size exceeds max_bytes;
+    recency survives restarts through the files' mtime. Temporary files left by a crash are
+    removed when the cache is opened.
+    """
+    def __init__(self, directory="result_cache", max_bytes=2 * 1024**3):
+        self.directory = directory
+        self.max_bytes = int(max_bytes)
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()  # path -> size, least recently used first
+        self._total = 0
+        os.makedirs(directory, exist_ok=True)
+        found = []
+        stale = time.time() - _STALE_TMP_SECONDS
+        for entry in os.scandir(directory):
+            if not entry.is_file():
+                continue
+            st = entry.stat()
+            if entry.name.endswith(".json.z"):
+                found.append((st.st_mtime, entry.path, st.st_size))
+            elif entry.name.endswith(".tmp") and st.st_mtime < stale:
+                try:
+                    os.remove(entry.path)
+                except OSError:
+                    pass
+        for _, path, size in sorted(found):
+            self._entries[path] = size
+            self._total += size
+
+    def _path(self, guid, kind):
+        return os.path.join(self.directory, f"{kind}_{int(guid)}.json.z")
+
+    def contains(self, guid, kind="result"):
+        with self._lock:
+            return self._path(guid, kind) in self._entries
+
+    def get(self, guid, kind="result"):
+        """
+        Returns the cached value, or None on a miss.
+        """
+        path = self._path(guid, kind)
+        with self._lock:
+            hit = path in self._entries
+            if hit:
+                self._entries.move_to_end(path)
+        if hit:
+            try:
+                with open(path, "rb") as f:
+                    value = json.loads(zlib.decompress(f.read()).decode("utf-8"))
+                os.utime(path)
+                with self._lock:
+                    self.hits += 1
+                return value
+            except (OSError, ValueError, zlib.error):
+                self._forget(path)
+        with self._lock:
+            self.misses += 1
+        return None
+
+    def put(self, guid, value, kind="result"):
+        path = self._path(guid, kind)
+        blob = zlib.compress(json.dumps(value, ensure_ascii=False, separators=(",", ":")).encode("utf-8"))
+        tmp = f"{path}.{threading.get_ident()}.tmp"
+        try:
+            with open(tmp, "wb") as f:
+                f.write(blob)
+            os.replace(tmp, path)
+        except BaseException:
+            try:
+                os.remove(tmp)
+            except OSError:
+                pass
+            raise
+        with self._lock:
+            self._total += len(blob) - self._entries.pop(path, 0)
+            self._entries[path] = len(blob)
+            victims = []
+            while self._total > self.max_bytes and len(self._entries) > 1:
+                victim, size = self._entries.popitem(last=False)
+                self._total -= size
+                victims.append(victim)
+            self.evictions += len(victims)
+        for victim in victims:
+            try:
+                os.remove(victim)
+            except OSError:
+                pass
+
+    def _forget(self, path):
+        with self._lock:
+            self._total -= self._entries.pop(path, 0)
+
+    def stats(self):
+        with self._lock:
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "entries": len(self._entries),
+                "bytes": self._total,
+            }
@@ -0,0 +1,205 @@
+"""
+Command line entry point: python -m ascdc_ocr <command> [options]
+
+Every setting of ascdc_ocr.config.Settings is an option (--upload-workers 8, --no-resume, ...)
+and can also come from a JSON file given with --config; options on the command line win.
+Account and password default to the ASCDC_ACCOUNT / ASCDC_PASSWORD environment variables.
+Only the modules a command needs are imported, so starting a worker takes milliseconds.
+"""
+import argparse
+import json
+import os
+import signal
+import sys
+import threading
+
+from .config import Settings
+
+_TYPES = {"book_id": int, "book_title": str, "book_author": str, "optimize_dpi": int}
+
+_HELP = {
+    "account": "OCR platform account (default: $ASCDC_ACCOUNT)",
+    "password": "OCR platform password (default: $ASCDC_PASSWORD)",
+    "book_id": "existing book ID; without it a book is created (or reused) from --book-title/--book-author",
+    "upload_workers": "files uploaded at once",
+    "upload_rate_limit": "max upload requests per second",
+    "poll_rate_limit": "max queue status requests per second",
+    "pipeline_mode": "stream upload -> OCR -> download per file instead of in phases",
+    "fixed_waits": "the script's old 10 s / 30 s pauses before downloading (not needed: queues are "
+                   "polled until their GUIDs are out)",
+    "adaptive_concurrency": "let request concurrency follow server latency and errors (AIMD) instead of "
+                            "fixed waits and rate limits",
+    "adaptive_max_concurrency": "upper bound for --adaptive-concurrency",
+    "download_results": "download results after upload",
+    "download_rate_limit": "max result requests per second",
+    "use_ledger": "record uploads, queues and saved GUIDs in --ledger-file",
+    "resume": "only do the work the ledger records as unfinished",
+    "deduplicate": "reuse the GUIDs of identical files already OCR'd",
+    "zip_batching": "pack small images into ZIP uploads",
+    "optimize_images": "downscale and re-encode images before upload (requires Pillow)",
+    "split_pdfs": "upload large PDFs as page ranges OCR'd in parallel (requires pypdf)",
+    "split_pdf_pages": "pages per uploaded range of a split PDF",
+    "split_pdf_min_pages": "only split PDFs with more pages than this",
+    "result_format": "pretty, compact, gzip or zstd (zstd requires zstandard)",
+    "result_layout": "files (.txt + .json per GUID) or jsonl (one shard per book)",
+    "writer_queue_size": "results waiting for the background writer before downloads block",
+    "result_fsync": "flush every result to the disk before it counts as saved (survives a power loss)",
+    "search_index": "add every saved result to the full-text index in --search-index-dir",
+    "watch_interval": "seconds between scans of the watched folder",
+    "watch_settle_seconds": "a file is uploaded once its size and mtime are unchanged this long",
+    "watch_batch_size": "files handed to one upload run",
+    "watch_max_attempts": "passes a file whose upload or OCR fails is retried before the watcher gives up on it",
+    "metrics_trace_file": "JSON-lines trace of every request ('' to disable)",
+    "metrics_file": "Prometheus snapshot written at the end ('' to disable)",
+}
+
+
+def _add_settings(parser):
+    parser.add_argument("--config", help="JSON file with settings (keys as in ascdc_ocr.config.Settings)")
+    group = parser.add_argument_group("settings")
+    for name, default in Settings.DEFAULTS.items():
+        flag = "--" + name.replace("_", "-")
+        kwargs = {"dest": name, "default": argparse.SUPPRESS, "help": _HELP.get(name, "")}
+        if isinstance(default, bool):
+            kwargs["action"] = argparse.BooleanOptionalAction
+        else:
+            kwargs["type"] = _TYPES.get(name) or type(default)
+            kwargs["metavar"] = name.upper()
+        if default is not None and not isinstance(default, bool):
+            kwargs["help"] = f"{kwargs['help']} (default: {default})".lstrip()
+        group.add_argument(flag, **kwargs)
+
+
+def build_parser():
+    settings = argparse.ArgumentParser(add_help=False)
+    _add_settings(settings)
+
+    parser = argparse.ArgumentParser(prog="python -m ascdc_ocr", description="ASCDC OCR platform client")
+    commands = parser.add_subparsers(dest="command", required=True, metavar="command")
+
+    p = commands.add_parser("upload", parents=[settings], help="upload files and folders, wait for OCR, download results")
+    p.add_argument("paths", nargs="+", help="files, or folders whose uploadable files are all sent")
+
+    p = commands.add_parser("watch", parents=[settings], help="keep uploading new files that land in a folder tree")
+    p.add_argument("folder", help="folder to watch (recursively)")
+    p.add_argument("--once", action="store_true", help="handle what is there now, then exit")
+
+    p = commands.add_parser("poll", parents=[settings], help="wait for open queues and record their GUIDs")
+    p.add_argument("queue_ids", nargs="*", type=int, help="queue IDs (default: every open queue in the ledger)")
+
+    p = commands.add_parser("download", parents=[settings], help="download results of GUIDs")
+    p.add_argument("guids", nargs="*", type=int, help="GUIDs (default: GUIDs in the ledger not saved yet)")
+
+    p = commands.add_parser("export-range", parents=[settings], help="download results of a consecutive GUID range")
+    p.add_argument("start", type=int, help="first GUID")
+    p.add_argument("end", type=int, help="last GUID (inclusive)")
+    p.add_argument("--manifest", help="outcome manifest (default: export_manifest.jsonl in the download dir)")
+    p.add_argument("--retry-missing", action="store_true", help="probe GUIDs recorded as not_found / forbidden again")
+
+    p = commands.add_parser("export-book", parents=[settings],
+                            help="merge downloaded results into one memory-mappable columnar file")
+    p.add_argument("output", nargs="?", help="output file (default: book_<id>.ocrcol in the download dir)")
+    p.add_argument("--guids", nargs="+", type=int, help="only these GUIDs (default: everything downloaded)")
+
+    p = commands.add_parser("index", parents=[settings], help="add downloaded results to the full-text search index")
+    p.add_argument("--rebuild", action="store_true", help="drop the index and index everything again")
+    p.add_argument("--optimize", action="store_true", help="merge the index segments into one")
+
+    p = commands.add_parser("search", parents=[settings], help="find text in the indexed results")
+    p.add_argument("query", help="text to find (matched exactly, including CJK)")
+    p.add_argument("--limit", type=int, default=50, help="max hits (default: 50)")
+    p.add_argument("--json", action="store_true", help="print hits as JSON lines")
+
+    p = commands.add_parser("rename", parents=[settings], help="rename downloaded results to the current naming scheme")
+    p.add_argument("guids", nargs="*", type=int, help="GUIDs to rename (default: every GUID on disk the ledger knows)")
+    p.add_argument("--range", nargs=2, type=int, metavar=("START", "END"), help="a consecutive GUID range (inclusive)")
+    p.add_argument("--dry-run", action="store_true", help="only print what would be renamed")
+    p.add_argument("--rollback", nargs="?", const="", metavar="JOURNAL",
+                   help="undo a rename run (default: the latest journal in the download dir)")
+    return parser
+
+
+def load_settings(args):
+    overrides = {name: getattr(args, name) for name in Settings.DEFAULTS if hasattr(args, name)}
+    settings = Settings.from_file(args.config) if args.config else Settings()
+    settings.update(**overrides)
+    if not settings.account:
+        settings.account = os.environ.get("ASCDC_ACCOUNT", "")
+    if not settings.password:
+        settings.password = os.environ.get("ASCDC_PASSWORD", "")
+    return settings
+
+
+def _expand_paths(paths):
+    from .workflow import scan_upload_folder
+    files = []
+    for path in paths:
+        if os.path.isdir(path):
+            files.extend(scan_upload_folder(path))
+        elif os.path.isfile(path):
+            files.append(path)
+        else:
+            print(f"⚠️ Not found: {path}")
+    return files
+
+
+def run(args, settings):
+    from .workflow import Workflow
+    workflow = Workflow(settings)
+    try:
+        if args.command == "upload":
+            guids = workflow.upload(_expand_paths(args.paths))
+            if workflow.settings.download_results:
+                workflow.download(guids)
+        elif args.command == "watch":
+            stop = threading.Event()
+            signal.signal(signal.SIGTERM, lambda *_: stop.set())
+            workflow.watch(args.folder, stop=stop, once=args.once)
+        elif args.command == "poll":
+            guids = workflow.poll(args.queue_ids)
+            print(f"GUIDs: {[g.guid for g in guids]}")
+        elif args.command == "download":
+            guids = workflow.guids(args.guids) if args.guids else workflow.pending_guids()
+            if not guids:
+                print("No GUIDs to download.")
+            workflow.download(guids)
+        elif args.command == "export-range":
+            summary = workflow.export(range(args.start, args.end + 1), args.manifest, args.retry_missing)
+            return 1 if summary.get("error") or summary.get("not_ready") else 0
+        elif args.command == "export-book":
+            workflow.export_book(args.output, args.guids)
+        elif args.command == "index":
+            workflow.index_results(rebuild=args.rebuild, optimize=args.optimize)
+        elif args.command == "search":
+            hits = workflow.search(args.query, args.limit)
+            for hit in hits:
+                if args.json:
+                    print(json.dumps(hit, ensure_ascii=False))
+                else:
+                    print(f"{hit['guid']}\t{hit['original'] or ''}\tline {hit['line_id']}\t{hit['bbox']}\t{hit['text']}")
+            if not args.json:
+                print(f"{len(hits)} hits")
+            return 0 if hits else 1
+        elif args.command == "rename":
+            if args.rollback is not None:
+                workflow.rollback_rename(args.rollback or None)
+                return 0
+            numbers = list(args.guids) + (list(range(args.range[0], args.range[1] + 1)) if args.range else [])
+            workflow.rename(workflow.guids(numbers) if numbers else None, dry_run=args.dry_run)
+    finally:
+        workflow.close()
+    return 0
+
+
+def main(argv=None):
+    parser = build_parser()
+    args = parser.parse_args(argv)
+    try:
+        settings = load_settings(args)
+    except (OSError, ValueError) as e:
+        parser.error(f"--config: {e}")
+    try:
+        return run(args, settings)
+    except KeyboardInterrupt:
+        print("Interrupted.", file=sys.stderr)
+        return 130
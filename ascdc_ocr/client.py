@@ -0,0 +1,416 @@
+"""
+HTTP client for the ASCDC OCR web API.
+"""
+import json
+import os
+import random
+import threading
+import time
+
+import requests
+import urllib3
+
+from .config import (ALLOWED_MIME_TYPES, API_BASE_URL, FILENAME_PATTERN, TOKEN_EXPIRES_IN, TOKEN_FILE,
+                     guess_mime_type)
+from .metrics import Metrics
+from .multipart import MultipartFileStream
+
+
+class OCRAPIError(Exception):
+    """
+    The API answered, but not with status 200. `status` is the API status code from the JSON body
+    (102 no such GUID / queue, 103 processing, 108 unexpected, ...), `http_status` the HTTP code.
+    """
+    def __init__(self, message, status=None, http_status=None):
+        super().__init__(message)
+        self.status = status
+        self.http_status = http_status
+
+
+class CircuitBreaker:
+    """
+    Global back-off shared by every request of a client. After `threshold` consecutive failures
+    (timeouts, connection errors, 429/5xx) all requests pause for `cooldown` seconds; each time it
+    trips again the pause doubles, up to max_cooldown. One success closes it again.
+    """
+    def __init__(self, threshold=5, cooldown=30.0, max_cooldown=300.0):
+        self.threshold = int(threshold)
+        self.cooldown = float(cooldown)
+        self.max_cooldown = float(max_cooldown)
+        self.trips = 0
+        self._current = self.cooldown
+        self._failures = 0
+        self._open_until = 0.0
+        self._lock = threading.Lock()
+
+    def wait(self):
+        """
+        Block while the breaker is open. Returns the seconds waited.
+        """
+        with self._lock:
+            delay = self._open_until - time.monotonic()
+        if delay > 0:
+            time.sleep(delay)
+            return delay
+        return 0.0
+
+    def record_success(self):
+        with self._lock:
+            self._failures = 0
+            self._current = self.cooldown
+
+    def record_failure(self):
+        with self._lock:
+            self._failures += 1
+            if self._failures < self.threshold:
+                return
+            self._failures = 0
+            self._open_until = time.monotonic() + self._current
+            self.trips += 1
+            print(f"⚠️ Server struggling: pausing all requests for {self._current:.0f}s")
+            self._current = min(self.max_cooldown, self._current * 2)
+
+
+class ASCDCOCRClient:
+    """
+    Client for the OCR web API. Creating one does no I/O: the cached token is loaded (or a login
+    is made) on the first request that needs it, so cache hits never touch the network.
+    """
+    RETRY_STATUS = {429, 500, 502, 503, 504}
+    AUTH_STATUS = {401, 403}
+    # A 403 saying this, and nothing about the token, rejects the resource (e.g. another account's
+    # GUID), not the token: logging in again would not change the answer
+    DENIED_MESSAGES = ("permission", "denied", "forbidden", "not allowed")
+
+    def __init__(self, account, password, result_cache=None, pool_size=10, max_retries=4,
+                 backoff=1.0, max_backoff=60.0, timeout=(10, 300), breaker=None, base_url=API_BASE_URL,
+                 metrics=None, token_file=TOKEN_FILE, concurrency=None):
+        self.account = account
+        self.password = password
+        self.base_url = base_url.rstrip("/")
+        self.session = requests.Session()
+        # One connection per worker thread; retries are handled in _post, not by urllib3
+        adapter = requests.adapters.HTTPAdapter(pool_connections=2, pool_maxsize=max(1, int(pool_size)), max_retries=0)
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+        self.result_cache = result_cache
+        self.max_retries = int(max_retries)
+        self.backoff = float(backoff)
+        self.max_backoff = float(max_backoff)
+        self.timeout = timeout
+        self.breaker = breaker or CircuitBreaker()
+        self.metrics = metrics or Metrics()
+        self.token_file = token_file
+        self.concurrency = concurrency  # AdaptiveConcurrency shared by all requests, or None
+        self._auth_lock = threading.Lock()
+        self.token = None
+        self.token_expires_at = 0
+        self.no_auth_headers = self._make_headers(auth=False)
+
+    def _make_headers(self, auth=True):
+        headers = {
+            "User-Agent": "Mozilla/5.0",
+            "Accept": "application/json",
+            "Referer": "https://ocr.ascdc.tw/",
+            "Origin": "https://ocr.ascdc.tw",
+        }
+        if auth and self.token:
+            headers["Authorization"] = f"Bearer {self.token}"
+        return headers
+
+    def wait_random(self, min_sec=0.5, max_sec=1.5, label=""):
+        if self.concurrency is not None:
+            return  # paced by the adaptive concurrency limit instead
+        delay = random.uniform(min_sec, max_sec)
+        print(f"Waiting {delay:.2f}s {label}...")
+        time.sleep(delay)
+        self.metrics.sleep("wait_random", delay, label=label)
+
+    def safe_json(self, response, context=""):
+        try:
+            return response.json()
+        except Exception as e:
+            print(f"[{context}] JSON parse error. Status {response.status_code}")
+            try:
+                print(response.content.decode("utf-8"))
+            except:
+                print(response.content)
+            raise e
+
+    def _backoff_delay(self, attempt, response=None):
+        retry_after = response.headers.get("Retry-After") if response is not None else None
+        if retry_after and retry_after.isdigit():
+            return min(self.max_backoff, float(retry_after))
+        return min(self.max_backoff, self.backoff * 2 ** attempt) * random.uniform(0.5, 1.5)
+
+    @staticmethod
+    def _not_sent(error):
+        """
+        True if the request certainly never reached the server (safe to retry even for uploads).
+        """
+        if isinstance(error, requests.exceptions.ConnectTimeout):
+            return True
+        reason = getattr(error.args[0], "reason", None) if error.args else None
+        return isinstance(reason, urllib3.exceptions.NewConnectionError)
+
+    def _is_auth_failure(self, response):
+        """
+        True if the token was rejected. A 403 that only denies permission is not an auth failure.
+        """
+        if response.status_code != 200 and response.status_code not in self.AUTH_STATUS:
+            return False
+        try:
+            data = response.json()
+        except ValueError:
+            data = None
+        if not isinstance(data, dict):
+            data = {}
+        status = response.status_code if response.status_code != 200 else data.get("status")
+        if status == 200:
+            return False
+        message = str(data.get("message", "")).lower()
+        if "token" in message:
+            return True
+        if status == 403 and any(word in message for word in self.DENIED_MESSAGES):
+            return False
+        return status in self.AUTH_STATUS
+
+    def ensure_token(self):
+        """
+        Load the cached token or log in, once, before the first authenticated request.
+        """
+        if self.token is not None:
+            return self.token
+        with self._auth_lock:
+            if self.token is None:
+                self.token = self.load_or_login()
+                self.session.headers.update(self._make_headers(auth=True))
+            return self.token
+
+    def refresh_token(self, stale_token=None):
+        """
+        Log in again unless another thread already replaced `stale_token`.
+        """
+        with self._auth_lock:
+            if stale_token is not None and self.token != stale_token:
+                return self.token
+            self.token = self.login()
+            self.session.headers.update(self._make_headers(auth=True))
+            return self.token
+
+    def _post(self, url, build, context="", idempotent=True, relogin=True, trace=None):
+        """
+        POST with retries. `build()` returns the keyword arguments for session.post and is called
+        again for every attempt, so a refreshed token or a fresh upload stream is picked up.
+
+        - timeouts / connection errors / 429 / 5xx: retried with jittered exponential backoff
+          (non-idempotent calls such as upload only when the request never reached the server)
+        - auth failures: re-login once, then retry; if the fresh token is rejected too, the response
+          is returned (the resource is refused to this account). A 403 that only denies
+          permission is returned as it is.
+        - consecutive failures trip the shared CircuitBreaker
+        - with an AdaptiveConcurrency, every attempt holds one of its slots and reports back
+        `trace` holds keys (file, guid, queue_id, ...) added to every metrics event of this call.
+        """
+        endpoint = url.rsplit("/", 1)[-1].replace(".php", "")
+        trace = trace or {}
+        if relogin:
+            self.ensure_token()
+        if relogin and self.token_expires_at and time.time() > self.token_expires_at - 300:
+            self.refresh_token(self.token)
+
+        relogged = False
+        attempt = 0
+        while True:
+            self.metrics.sleep("circuit_breaker", self.breaker.wait(), endpoint=endpoint, **trace)
+            token = self.token
+            kwargs = build()
+            body = kwargs.get("data")
+            if self.concurrency is not None:
+                self.metrics.sleep("concurrency_limit", self.concurrency.acquire(), endpoint=endpoint, **trace)
+            start = time.monotonic()
+            try:
+                response = self.session.post(url, timeout=self.timeout, **kwargs)
+            except (requests.exceptions.ConnectionError, requests.exceptions.Timeout) as e:
+                self.metrics.request(endpoint, time.monotonic() - start, type(e).__name__, attempt=attempt, **trace)
+                self._feedback(endpoint, start, type(e).__name__)
+                self.breaker.record_failure()
+                if attempt >= self.max_retries or not (idempotent or self._not_sent(e)):
+                    raise
+                delay = self._backoff_delay(attempt)
+                print(f"[{context}] {type(e).__name__}; retry {attempt + 1}/{self.max_retries} in {delay:.1f}s")
+                self.metrics.retry(endpoint, type(e).__name__, attempt=attempt, **trace)
+                time.sleep(delay)
+                self.metrics.sleep("retry_backoff", delay, endpoint=endpoint, **trace)
+                attempt += 1
+                continue
+            except BaseException:
+                if self.concurrency is not None:
+                    self.concurrency.release()
+                raise
+            finally:
+                if hasattr(body, "close"):
+                    body.close()
+
+            sent = int(response.request.headers.get("Content-Length") or 0)
+            self.metrics.request(
+                endpoint, time.monotonic() - start, response.status_code,
+                sent=sent, received=len(response.content), attempt=attempt, **trace,
+            )
+            self._feedback(endpoint, start, "ok" if response.status_code not in self.RETRY_STATUS
+                           else f"http_{response.status_code}", sent)
+            if response.status_code in self.RETRY_STATUS:
+                self.breaker.record_failure()
+                # 429 / 503 mean the request was not processed, so even uploads can be repeated
+                if attempt < self.max_retries and (idempotent or response.status_code in (429, 503)):
+                    delay = self._backoff_delay(attempt, response)
+                    print(f"[{context}] HTTP {response.status_code}; retry {attempt + 1}/{self.max_retries} in {delay:.1f}s")
+                    self.metrics.retry(endpoint, f"http_{response.status_code}", attempt=attempt, **trace)
+                    time.sleep(delay)
+                    self.metrics.sleep("retry_backoff", delay, endpoint=endpoint, **trace)
+                    attempt += 1
+                    continue
+                return response
+
+            self.breaker.record_success()
+            if relogin and not relogged and self._is_auth_failure(response):
+                print(f"[{context}] Token rejected; logging in again.")
+                self.metrics.retry(endpoint, "auth", attempt=attempt, **trace)
+                self.refresh_token(token)
+                relogged = True
+                continue
+            return response
+
+    def _feedback(self, endpoint, start, outcome, sent=0):
+        if self.concurrency is not None:
+            self.concurrency.record(endpoint, time.monotonic() - start, outcome, sent)
+            self.concurrency.release()
+
+    def debug_response(self, response):
+        print("Response Debug Info")
+        print("=" * 40)
+        print(f"Status Code: {response.status_code}")
+        print(f"Headers:\n{json.dumps(dict(response.headers), indent=2)}")
+        print(f"Content Length: {len(response.content)} bytes")
+        try:
+            print(response.content.decode("utf-8")[:1000])
+        except UnicodeDecodeError:
+            print(response.content[:100])
+        print("=" * 40)
+
+    def load_or_login(self):
+        if os.path.exists(self.token_file):
+            with open(self.token_file, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+                if time.time() < data.get("expires_at", 0):
+                    print("Using cached token.")
+                    self.token_expires_at = data["expires_at"]
+                    return data["token"]
+        return self.login()
+
+    def login(self):
+        url = f"{self.base_url}/auth.php"
+        payload = {"account": self.account, "password": self.password}
+        response = self._post(url, lambda: {"data": payload, "headers": self.no_auth_headers}, "Login", relogin=False)
+        data = self.safe_json(response, "Login")
+        if data.get("status") == 200:
+            token = data["access_token"]
+            self.token_expires_at = int(time.time()) + TOKEN_EXPIRES_IN
+            with open(self.token_file, 'w', encoding='utf-8') as f:
+                json.dump({"token": token, "expires_at": self.token_expires_at}, f)
+            print("Login successful.")
+            return token
+        raise Exception(f"Login failed: {data.get('message')}")
+
+    def create_book(self, title, author, is_public=0, orientation=2):
+        url = f"{self.base_url}/create_book.php"
+
+        def build():
+            payload = {
+                "token": self.token,
+                "title": title,
+                "author": author,
+                "public": is_public,
+                "orientation": orientation
+            }
+            return {"data": payload, "headers": self.no_auth_headers}
+
+        response = self._post(url, build, "Create Book", idempotent=False, trace={"title": title})
+        return self.safe_json(response, "Create Book")
+
+    def get_result(self, guid):
+        if self.result_cache:
+            cached = self.result_cache.get(guid, "result")
+            self.metrics.inc("ocr_result_cache_total", labels={"kind": "result", "result": "miss" if cached is None else "hit"})
+            if cached is not None:
+                return cached
+        url = f"{self.base_url}/query.php"
+        response = self._post(url, lambda: {"data": {"guid": int(guid)}}, "Get Result", trace={"guid": int(guid)})
+        data = self.safe_json(response, "Get Result")
+        if data.get("status") == 200:
+            if self.result_cache:
+                self.result_cache.put(guid, data["result"], "result")
+            return data["result"]
+        raise OCRAPIError(f"Result error: {data.get('message')}", data.get("status"), response.status_code)
+
+    def get_image(self, guid):
+        if self.result_cache:
+            cached = self.result_cache.get(guid, "image")
+            self.metrics.inc("ocr_result_cache_total", labels={"kind": "image", "result": "miss" if cached is None else "hit"})
+            if cached is not None:
+                return cached
+        url = f"{self.base_url}/get_image.php"
+        response = self._post(url, lambda: {"data": {"guid": int(guid)}}, "Get Image", trace={"guid": int(guid)})
+        data = self.safe_json(response, "Get Image")
+        if data.get("status") == 200:
+            if self.result_cache:
+                self.result_cache.put(guid, data["result"], "image")
+            return data["result"]
+        raise OCRAPIError(f"Result error:\n{json.dumps(data, indent=2, ensure_ascii=False)}",
+                          data.get("status"), response.status_code)
+
+
+    def upload_file(self, file_name, bookid, block_order="TBRL", progress=None):
+        url = f"{self.base_url}/upload.php"
+
+        base_name = os.path.basename(file_name)
+        # Check if file name is allowed
+        if not FILENAME_PATTERN.match(base_name):
+            raise ValueError(f"❌ Illegal file name: {base_name}. Only A-Z, a-z, 0-9, '_', '-', and '.' are allowed.")
+
+        mime_type = guess_mime_type(base_name)
+        # Check if MIME type is allowed
+        if mime_type not in ALLOWED_MIME_TYPES:
+            raise ValueError(f"❌ Unsupported MIME type: {mime_type}. Allowed types are: {', '.join(ALLOWED_MIME_TYPES)}")
+
+        def build():
+            data = {
+                'token': self.token,
+                'bookid': bookid,
+                'block_order': str(block_order).upper()
+            }
+            # Stream the multipart body from disk instead of building it in memory
+            body = MultipartFileStream(data, 'page', file_name, mime_type, progress=progress)
+            return {"data": body, "headers": dict(self.no_auth_headers, **{"Content-Type": body.content_type})}
+
+        response = self._post(url, build, "Upload", idempotent=False, trace={"file": base_name})
+        return self.safe_json(response, "Upload")
+
+    def check_ocr_queue(self, queue_id):
+        """
+        Single status request for a queue (103 = processing, 200 = finished).
+        """
+        url = f"{self.base_url}/queue.php"
+        response = self._post(url, lambda: {"data": {"queue_id": queue_id}}, "Queue", trace={"queue_id": queue_id})
+        return self.safe_json(response, "Queue")
+
+    def poll_ocr_queue(self, queue_id):
+        while True:
+            data = self.check_ocr_queue(queue_id)
+            if data.get("status") == 103:
+                print("OCR processing...")
+                time.sleep(60)
+            elif data.get("status") == 200:
+                return data["guids"]
+            else:
+                raise Exception(f"OCR queue failed: {data.get('message')}")
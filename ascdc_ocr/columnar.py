@@ -0,0 +1,436 @@
+"""
+Compact result model and a columnar, memory-mappable file for the results of a whole book.
+"""
+import array
+import json
+import mmap
+import os
+import struct
+import sys
+import tempfile
+
+MAGIC = b"OCRCOL01"
+FILE_SUFFIX = ".ocrcol"
+
+# Per-box integer fields of a result entry, all stored as int32
+BOX_FIELDS = ("id", "line_id", "line_group_id", "block_id", "x", "y", "width", "height")
+
+# name -> array typecode. *_offsets columns have one entry more than the rows they index.
+COLUMNS = {
+    "page_guid": "q", "page_index": "i", "page_start": "q", "page_original_offsets": "q", "page_original": "B",
+    **{field: "i" for field in BOX_FIELDS}, "vertical": "b",
+    "text_offsets": "q", "text": "B",
+    "option_start": "q", "option_text_offsets": "q", "option_text": "B", "option_score": "f",
+}
+
+
+class Box:
+    """
+    One entry of a result (a character box), built on access from a PageResult or BookColumns.
+    """
+    __slots__ = BOX_FIELDS + ("vertical", "text", "options")
+
+    def __init__(self, text, options, vertical, *values):
+        self.text = text
+        self.options = options
+        self.vertical = vertical
+        for field, value in zip(BOX_FIELDS, values):
+            setattr(self, field, value)
+
+    def as_dict(self):
+        entry = {"id": self.id, "text": self.text}
+        for field in ("line_id", "line_group_id", "block_id", "vertical", "x", "y", "width", "height"):
+            entry[field] = getattr(self, field)
+        entry["options"] = [list(option) for option in self.options]
+        return entry
+
+    def __repr__(self):
+        return f"Box({self.text!r}, x={self.x}, y={self.y}, width={self.width}, height={self.height})"
+
+
+class PageResult:
+    """
+    The result of one GUID held as columns: one int32 array per coordinate / ID field, interned
+    strings for the text, and flat arrays for the candidate options. A 500-box page takes a few
+    kilobytes instead of 500 dicts.
+    """
+    __slots__ = ("guid", "original", "index", "columns", "text", "option_start", "option_text", "option_score")
+
+    def __init__(self, guid=None, original=None, index=None):
+        self.guid = guid
+        self.original = original
+        self.index = index
+        self.columns = {field: array.array("i") for field in BOX_FIELDS}
+        self.columns["vertical"] = array.array("b")
+        self.text = []
+        self.option_start = array.array("q", [0])
+        self.option_text = []
+        self.option_score = array.array("f")
+
+    @classmethod
+    def from_json(cls, result, guid=None, original=None, index=None):
+        """
+        Build from a get_result payload (a list of entry dicts).
+        """
+        page = cls(guid, original, index)
+        intern = sys.intern
+        columns = page.columns
+        for entry in result:
+            for field in BOX_FIELDS:
+                columns[field].append(int(entry.get(field, -1)))
+            columns["vertical"].append(int(entry.get("vertical", 0)))
+            page.text.append(intern(entry.get("text", "")))
+            for option in entry.get("options") or ():
+                page.option_text.append(intern(option[0]))
+                page.option_score.append(float(option[1]))
+            page.option_start.append(len(page.option_score))
+        return page
+
+    def __len__(self):
+        return len(self.text)
+
+    def __getitem__(self, i):
+        start, end = self.option_start[i], self.option_start[i + 1]
+        options = [(self.option_text[k], round(self.option_score[k], 6)) for k in range(start, end)]
+        return Box(self.text[i], options, self.columns["vertical"][i],
+                   *(self.columns[field][i] for field in BOX_FIELDS))
+
+    def __iter__(self):
+        return (self[i] for i in range(len(self)))
+
+    def to_json(self):
+        """
+        The entries as get_result returns them (scores rounded to float32 precision).
+        """
+        return [box.as_dict() for box in self]
+
+    def lines(self):
+        """
+        The text joined per line_id, in reading order.
+        """
+        return _join_lines(self.text, self.columns["line_id"])
+
+    @property
+    def nbytes(self):
+        """
+        Bytes held by the arrays (the interned strings are shared and not counted).
+        """
+        arrays = list(self.columns.values()) + [self.option_start, self.option_score]
+        return sum(a.itemsize * len(a) for a in arrays) + 8 * (len(self.text) + len(self.option_text))
+
+    def __repr__(self):
+        return f"PageResult(guid={self.guid}, boxes={len(self)})"
+
+
+def _join_lines(texts, line_ids):
+    lines, current, last = [], [], None
+    for text, line_id in zip(texts, line_ids):
+        if line_id != last and current:
+            lines.append("".join(current))
+            current = []
+        current.append(text)
+        last = line_id
+    if current:
+        lines.append("".join(current))
+    return lines
+
+
+class _Spill:
+    """
+    One column being written: appended to a temp file so a book never has to fit in memory.
+    """
+    def __init__(self, directory, typecode):
+        self.typecode = typecode
+        self.file = tempfile.TemporaryFile(dir=directory)
+        self.length = 0
+
+    def extend(self, values):
+        if isinstance(values, bytes):
+            self.file.write(values)
+        else:
+            data = array.array(self.typecode, values)
+            if sys.byteorder != "little":
+                data.byteswap()
+            data.tofile(self.file)
+        self.length += len(values)
+
+
+class ColumnarWriter:
+    """
+    Merge the results of many GUIDs into one columnar file:
+
+      MAGIC, uint64 header length, JSON header (page / box / option counts and the byte offset,
+      type and length of every column), then each column as a little-endian array aligned to 8 bytes.
+
+    Pages are stored in the order they are added. Boxes of all pages are concatenated;
+    page_start[i]:page_start[i + 1] are the boxes of page i. Text and option characters are UTF-8 blobs
+    with offset tables. Columns are spilled to temp files while adding, and the file is written to a
+    temp name and renamed into place on close().
+    """
+    def __init__(self, path, metadata=None):
+        self.path = path
+        self.metadata = metadata or {}
+        directory = os.path.dirname(os.path.abspath(path))
+        os.makedirs(directory, exist_ok=True)
+        self._columns = {name: _Spill(directory, typecode) for name, typecode in COLUMNS.items()}
+        for name in ("page_start", "page_original_offsets", "text_offsets", "option_start", "option_text_offsets"):
+            self._columns[name].extend([0])
+        self._counts = {"page_original": 0, "boxes": 0, "text": 0, "options": 0, "option_text": 0}
+        self.pages = 0
+
+    def add(self, guid, result, original=None, index=None):
+        """
+        Append one page: `result` is a get_result payload or a PageResult.
+        """
+        if not isinstance(result, PageResult):
+            result = PageResult.from_json(result)
+        columns, counts = self._columns, self._counts
+        columns["page_guid"].extend([int(guid)])
+        columns["page_index"].extend([int(index) if index is not None else -1])
+        name = (original or "").encode("utf-8")
+        columns["page_original"].extend(name)
+        counts["page_original"] += len(name)
+        columns["page_original_offsets"].extend([counts["page_original"]])
+
+        for field, values in result.columns.items():
+            columns[field].extend(values)
+        self._add_strings("text", result.text)
+        self._add_strings("option_text", result.option_text)
+        columns["option_score"].extend(result.option_score)
+        columns["option_start"].extend([counts["options"] + start for start in result.option_start[1:]])
+        counts["options"] += len(result.option_score)
+
+        counts["boxes"] += len(result)
+        columns["page_start"].extend([counts["boxes"]])
+        self.pages += 1
+
+    def _add_strings(self, name, strings):
+        # one blob write and one offsets write per page
+        encoded = [s.encode("utf-8") for s in strings]
+        offsets, total = [], self._counts[name]
+        for data in encoded:
+            total += len(data)
+            offsets.append(total)
+        self._columns[name].extend(b"".join(encoded))
+        self._columns[f"{name}_offsets"].extend(offsets)
+        self._counts[name] = total
+
+    def close(self):
+        """
+        Write the file and return its path.
+        """
+        header = _write_columns(self.path, self._columns, {
+            "pages": self.pages, "boxes": self._counts["boxes"], "options": self._counts["options"],
+            "metadata": self.metadata,
+        })
+        self._columns = {}
+        print(f"Saved book columns: {self.path} ({self.pages} pages, {header['boxes']} boxes)")
+        return self.path
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        if exc[0] is None:
+            self.close()
+        else:
+            for spill in self._columns.values():
+                spill.file.close()
+
+
+def _aligned(n):
+    return (n + 7) & ~7
+
+
+def _write_columns(path, spills, header, magic=MAGIC):
+    """
+    Write {name: _Spill} as magic, uint64 header length, JSON header, aligned columns, to a temp
+    file renamed into place. Returns the header with the column layout added.
+    """
+    layout, offset = {}, 0
+    for name, spill in spills.items():
+        itemsize = array.array(spill.typecode).itemsize
+        layout[name] = {"type": spill.typecode, "length": spill.length, "offset": offset}
+        offset += _aligned(spill.length * itemsize)
+    header = dict(header, version=1, columns=layout)
+    header_bytes = json.dumps(header, ensure_ascii=False).encode("utf-8")
+    data_start = _aligned(len(magic) + 8 + len(header_bytes))
+
+    tmp = f"{path}.tmp-{os.getpid()}"
+    with open(tmp, "wb") as f:
+        f.write(magic + struct.pack("<Q", len(header_bytes)) + header_bytes)
+        for name, spill in spills.items():
+            f.seek(data_start + layout[name]["offset"])
+            spill.file.seek(0)
+            while True:
+                chunk = spill.file.read(1 << 20)
+                if not chunk:
+                    break
+                f.write(chunk)
+            spill.file.close()
+        f.truncate(data_start + offset)
+    os.replace(tmp, path)
+    return header
+
+
+class _ArrayFile:
+    """
+    A file written by _write_columns, opened with mmap: opening costs one header parse, and columns
+    are zero-copy memoryviews (or NumPy arrays with numpy()) that the OS pages in on access.
+    """
+    MAGIC = MAGIC
+    KIND = "columnar book"
+
+    def __init__(self, path):
+        self.path = path
+        self._file = open(path, "rb")
+        try:
+            self._mmap = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        except ValueError:  # empty file
+            self._file.close()
+            raise ValueError(f"❌ Not a {self.KIND} file: {path}") from None
+        if self._mmap[:len(self.MAGIC)] != self.MAGIC:
+            self.close()
+            raise ValueError(f"❌ Not a {self.KIND} file: {path}")
+        (header_length,) = struct.unpack_from("<Q", self._mmap, len(self.MAGIC))
+        start = len(self.MAGIC) + 8
+        self.header = json.loads(self._mmap[start:start + header_length].decode("utf-8"))
+        self._data_start = _aligned(start + header_length)
+        self.metadata = self.header.get("metadata", {})
+        self._views = {}
+
+    def column(self, name):
+        """
+        A column as a read-only memoryview of its typecode (an array copy on big-endian hosts).
+        """
+        view = self._views.get(name)
+        if view is None:
+            info = self.header["columns"][name]
+            itemsize = array.array(info["type"]).itemsize
+            start = self._data_start + info["offset"]
+            raw = memoryview(self._mmap)[start:start + info["length"] * itemsize]
+            if sys.byteorder == "little" or itemsize == 1:
+                view = raw.cast(info["type"])
+            else:
+                view = array.array(info["type"], raw.tobytes())
+                view.byteswap()
+            self._views[name] = view
+        return view
+
+    def numpy(self, name):
+        """
+        A column as a NumPy array sharing the mapped memory (requires numpy).
+        """
+        try:
+            import numpy
+        except ImportError:
+            raise RuntimeError("Reading columns as NumPy arrays requires numpy: pip install numpy") from None
+        info = self.header["columns"][name]
+        dtype = numpy.dtype(info["type"]).newbyteorder("<")
+        return numpy.frombuffer(self._mmap, dtype=dtype, count=info["length"],
+                                offset=self._data_start + info["offset"])
+
+    def _strings(self, name, i, j):
+        # strings i..j-1 of a blob column, with one copy out of the mapping
+        offsets = self.column(f"{name}_offsets")[i:j + 1].tolist()
+        base = offsets[0]
+        data = bytes(self.column(name)[base:offsets[-1]])
+        return [data[start - base:end - base].decode("utf-8") for start, end in zip(offsets, offsets[1:])]
+
+    def close(self):
+        self._views = {}
+        if getattr(self, "_mmap", None) is not None:
+            try:
+                self._mmap.close()
+            except BufferError:
+                pass  # a NumPy array still uses the mapping; it is closed when that is released
+            self._mmap = None
+        self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+class BookColumns(_ArrayFile):
+    """
+    A columnar book file written by ColumnarWriter, opened with mmap.
+
+        with BookColumns("downloads/book_123.ocrcol") as book:
+            book.page_lines(book.page_of(1162900))
+            xs = book.numpy("x")[book.page_slice(0)]
+    """
+    def __init__(self, path):
+        super().__init__(path)
+        self._page_numbers = None
+
+    def __len__(self):
+        return self.header["pages"]
+
+    @property
+    def boxes(self):
+        return self.header["boxes"]
+
+    def _blob(self, name, offsets, i, j):
+        offsets = self.column(offsets)
+        return bytes(self.column(name)[offsets[i]:offsets[j]]).decode("utf-8")
+
+    def guid(self, page):
+        return self.column("page_guid")[page]
+
+    def original(self, page):
+        return self._blob("page_original", "page_original_offsets", page, page + 1) or None
+
+    def index(self, page):
+        value = self.column("page_index")[page]
+        return value if value >= 0 else None
+
+    def page_of(self, guid):
+        """
+        The page number of a GUID (KeyError if the book does not have it).
+        """
+        if self._page_numbers is None:
+            self._page_numbers = {guid: page for page, guid in enumerate(self.column("page_guid"))}
+        return self._page_numbers[int(guid)]
+
+    def page_slice(self, page):
+        """
+        slice of the box columns that belong to `page`.
+        """
+        starts = self.column("page_start")
+        return slice(starts[page], starts[page + 1])
+
+    def page_chars(self, page):
+        """
+        The text of every box of the page.
+        """
+        rows = self.page_slice(page)
+        return self._strings("text", rows.start, rows.stop)
+
+    def page_lines(self, page):
+        """
+        The text of the page joined per line_id.
+        """
+        return _join_lines(self.page_chars(page), self.column("line_id")[self.page_slice(page)].tolist())
+
+    def page(self, page):
+        """
+        Copy one page out as a PageResult.
+        """
+        rows = self.page_slice(page)
+        result = PageResult(self.guid(page), self.original(page), self.index(page))
+        for field in BOX_FIELDS + ("vertical",):
+            result.columns[field] = array.array(COLUMNS[field], self.column(field)[rows])
+        intern = sys.intern
+        result.text = [intern(text) for text in self.page_chars(page)]
+        option_start = self.column("option_start")
+        first, last = option_start[rows.start], option_start[rows.stop]
+        result.option_start = array.array("q", (start - first for start in option_start[rows.start:rows.stop + 1]))
+        result.option_score = array.array("f", self.column("option_score")[first:last])
+        result.option_text = [intern(text) for text in self._strings("option_text", first, last)]
+        return result
+
+    def __iter__(self):
+        return (self.page(page) for page in range(len(self)))
@@ -0,0 +1,160 @@
+"""
+Adaptive (AIMD) limit on the number of API requests in flight.
+"""
+import collections
+import threading
+import time
+from contextlib import contextmanager
+
+
+class AdaptiveConcurrency:
+    """
+    Additive-increase / multiplicative-decrease limit on requests in flight, shared by every
+    request of a client (uploads, queue checks, results), in place of fixed pauses.
+
+    - increase: +1 after `limit` successful requests in a row while the limit was actually
+      reached, as long as latency stays below latency_factor x its baseline
+    - decrease x backoff (sharp): a timeout / connection error, HTTP 429 / 5xx, or OCR queues
+      taking more than queue_factor x their baseline time per page
+    - decrease x 0.8: latency of small requests above latency_factor x baseline (upload times
+      mostly measure the file size, so only their errors count)
+
+    Decreases happen at most once per min_interval seconds, so one overload event is one cut.
+    Baselines are the lowest smoothed latency / queue time seen, drifting slowly upwards.
+    `limit` is the current concurrency; `changes` keeps the last `history` changes as
+    (time, old, new, reason), and stats() summarizes them.
+    """
+    SMALL_REQUEST_BYTES = 64 * 1024
+    EWMA_ALPHA = 0.2
+    BASELINE_DRIFT = 0.01
+
+    def __init__(self, initial=4, min_limit=1, max_limit=32, backoff=0.5, latency_factor=2.0,
+                 queue_factor=3.0, min_interval=1.0, history=100, metrics=None, clock=time.monotonic):
+        self.min_limit = max(1, int(min_limit))
+        self.max_limit = max(self.min_limit, int(max_limit))
+        self.backoff = float(backoff)
+        self.latency_factor = float(latency_factor)
+        self.queue_factor = float(queue_factor)
+        self.min_interval = float(min_interval)
+        self.metrics = metrics
+        self.clock = clock
+        self.changes = collections.deque(maxlen=history)
+        self.reasons = collections.Counter()
+        self._limit = min(self.max_limit, max(self.min_limit, int(initial)))
+        self._in_flight = 0
+        self._peak = 0
+        self._successes = 0
+        self._saturated = False
+        self._last_decrease = float("-inf")
+        self._latency = {}  # endpoint -> [ewma, baseline]
+        self._queue = None  # [ewma, baseline] of queue seconds per page
+        self._cond = threading.Condition()
+        self._gauge()
+
+    @property
+    def limit(self):
+        return self._limit
+
+    @property
+    def in_flight(self):
+        return self._in_flight
+
+    # --- slots ---
+    def acquire(self):
+        """
+        Block until a request may start. Returns the seconds waited.
+        """
+        start = self.clock()
+        with self._cond:
+            while self._in_flight >= self._limit:
+                self._saturated = True
+                self._cond.wait()
+            self._in_flight += 1
+            self._peak = max(self._peak, self._in_flight)
+            if self._in_flight >= self._limit:
+                self._saturated = True
+        return self.clock() - start
+
+    def release(self):
+        with self._cond:
+            self._in_flight -= 1
+            self._cond.notify()
+
+    @contextmanager
+    def slot(self):
+        waited = self.acquire()
+        try:
+            yield waited
+        finally:
+            self.release()
+
+    # --- feedback ---
+    def _track(self, stats, value):
+        if stats is None:
+            return [value, value]
+        stats[0] += self.EWMA_ALPHA * (value - stats[0])
+        if stats[0] < stats[1]:
+            stats[1] = stats[0]
+        else:
+            stats[1] += self.BASELINE_DRIFT * (stats[0] - stats[1])
+        return stats
+
+    def record(self, endpoint, seconds, outcome="ok", sent=0):
+        """
+        Feed back one finished request: outcome "ok", or the failure ("Timeout", "http_503", ...).
+        """
+        with self._cond:
+            if outcome != "ok":
+                self._decrease(self.backoff, outcome)
+                return
+            if sent <= self.SMALL_REQUEST_BYTES:
+                stats = self._latency[endpoint] = self._track(self._latency.get(endpoint), seconds)
+                if stats[0] > self.latency_factor * stats[1] and stats[1] > 0:
+                    self._decrease(0.8, f"latency_{endpoint}")
+                    return
+            self._successes += 1
+            if self._saturated and self._successes >= self._limit and self._limit < self.max_limit:
+                self._change(self._limit + 1, "healthy")
+                self._saturated = False
+
+    def record_queue(self, seconds, pages=1):
+        """
+        Feed back the time an OCR queue took from upload to done.
+        """
+        with self._cond:
+            self._queue = self._track(self._queue, seconds / max(1, pages))
+            if self._queue[0] > self.queue_factor * self._queue[1] and self._queue[1] > 0:
+                self._decrease(self.backoff, "slow_queue")
+
+    def _decrease(self, factor, reason):
+        now = self.clock()
+        if now - self._last_decrease < self.min_interval:
+            return
+        self._last_decrease = now
+        self._change(max(self.min_limit, int(self._limit * factor)), reason)
+
+    def _change(self, new, reason):
+        old = self._limit
+        self._successes = 0
+        if new == old:
+            return
+        self._limit = new
+        self.changes.append((time.time(), old, new, reason))
+        self.reasons[reason] += 1
+        print(f"{'⚠️ ' if new < old else ''}[concurrency] {old} -> {new} ({reason})")
+        if self.metrics:
+            self.metrics.inc("ocr_concurrency_changes_total", labels={"reason": reason}, trace=True, old=old, new=new)
+        self._gauge()
+        self._cond.notify_all()
+
+    def _gauge(self):
+        if self.metrics:
+            self.metrics.gauge("ocr_concurrency_limit", self._limit)
+
+    def stats(self):
+        with self._cond:
+            return {
+                "limit": self._limit, "in_flight": self._in_flight, "peak_in_flight": self._peak,
+                "changes": dict(self.reasons),
+                "latency": {endpoint: round(stats[0], 3) for endpoint, stats in self._latency.items()},
+            }
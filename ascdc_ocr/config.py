@@ -0,0 +1,135 @@
+"""
+Defaults shared by the library, the settings script and the command line.
+Importing this module does no I/O.
+"""
+import json
+import mimetypes
+import re
+
+TOKEN_FILE = "token_cache.json"
+BOOK_CACHE_FILE = "book_cache.json"
+LEDGER_FILE = "job_ledger.sqlite3"
+TOKEN_EXPIRES_IN = 86400
+API_BASE_URL = "https://ocr.ascdc.tw/web_api"
+ALLOWED_MIME_TYPES = {
+    'image/jpeg',      # JPG / JPEG
+    'image/png',       # PNG
+    'application/pdf', # PDF
+    'application/x-zip-compressed'  # ZIP
+}
+# Platforms name the ZIP type differently (application/zip on Linux and macOS); the API takes this one
+_MIME_ALIASES = {'application/zip': 'application/x-zip-compressed'}
+FILENAME_PATTERN = re.compile(r'^[A-Za-z0-9_\-\.]+$')  # 僅允許英數、底線、減號、點
+UPLOAD_CHUNK_SIZE = 256 * 1024  # Uploads are read from disk and sent in blocks of this size
+DOWNLOAD_DIR = "downloads"
+
+# Template for output basenames (without extension)
+# Available fields:
+#   {original}  -> original uploaded filename without extension (if known)
+#   {guid}      -> guid integer
+#   {index}     -> 1-based index within the uploaded file's returned guid list (if known)
+RESULT_NAME_TEMPLATE = "{original}_guid{guid}"
+
+
+def guess_mime_type(name):
+    """
+    MIME type of a file name as the upload API expects it (None if unknown).
+    """
+    mime_type = mimetypes.guess_type(name)[0]
+    return _MIME_ALIASES.get(mime_type, mime_type)
+
+
+class Settings:
+    """
+    Every setting of a run, with the same defaults as the settings cell of sinica_apitest.py
+    (lower-case names). Built from keyword arguments, a JSON config file, or both:
+
+        settings = Settings.from_file("ocr.json", upload_workers=8)
+    """
+    DEFAULTS = {
+        # Account
+        "account": "",
+        "password": "",
+        "base_url": API_BASE_URL,
+        "token_file": TOKEN_FILE,
+        # Book
+        "book_id": None,
+        "book_title": None,
+        "book_author": None,
+        "book_cache_file": BOOK_CACHE_FILE,
+        # Upload and polling
+        "upload_workers": 1,
+        "upload_rate_limit": 2.0,
+        "poll_initial_delay": 5,
+        "poll_max_delay": 60,
+        "poll_rate_limit": 2.0,
+        "pipeline_mode": False,
+        "fixed_waits": False,
+        "max_retries": 4,
+        "adaptive_concurrency": False,
+        "adaptive_initial_concurrency": 4,
+        "adaptive_max_concurrency": 16,
+        # Download
+        "download_results": True,
+        "download_workers": 4,
+        "download_rate_limit": 4.0,
+        "download_dir": DOWNLOAD_DIR,
+        "result_name_template": RESULT_NAME_TEMPLATE,
+        "rename_map_file": "rename_map.json",
+        "result_format": "pretty",
+        "result_layout": "files",
+        "writer_queue_size": 256,
+        "result_fsync": True,
+        "search_index": False,
+        "search_index_dir": "search_index",
+        # State
+        "use_ledger": True,
+        "ledger_file": LEDGER_FILE,
+        "resume": False,
+        "use_result_cache": True,
+        "result_cache_dir": "result_cache",
+        "result_cache_max_bytes": 2 * 1024**3,
+        "deduplicate": True,
+        # Pre-processing
+        "zip_batching": False,
+        "zip_batch_max_bytes": 50 * 1024**2,
+        "zip_batch_max_files": 100,
+        "zip_batch_dir": "zip_batches",
+        "optimize_images": False,
+        "optimize_long_edge": 3000,
+        "optimize_dpi": None,
+        "optimize_quality": 85,
+        "optimized_dir": "optimized",
+        "split_pdfs": False,
+        "split_pdf_pages": 50,
+        "split_pdf_min_pages": 100,
+        "split_pdf_dir": "pdf_chunks",
+        # Watch mode
+        "watch_interval": 5.0,
+        "watch_settle_seconds": 10.0,
+        "watch_batch_size": 50,
+        "watch_max_attempts": 3,
+        # Metrics
+        "metrics_trace_file": "metrics_trace.jsonl",
+        "metrics_file": "metrics.prom",
+    }
+
+    def __init__(self, **overrides):
+        self.__dict__.update(self.DEFAULTS)
+        self.update(**overrides)
+
+    def update(self, **overrides):
+        unknown = set(overrides) - set(self.DEFAULTS)
+        if unknown:
+            raise ValueError(f"❌ Unknown setting(s): {', '.join(sorted(unknown))}")
+        self.__dict__.update(overrides)
+        return self
+
+    @classmethod
+    def from_file(cls, path, **overrides):
+        with open(path, "r", encoding="utf-8") as f:
+            data = json.load(f)
+        return cls(**data).update(**overrides)
+
+    def as_dict(self):
+        return {key: getattr(self, key) for key in self.DEFAULTS}
@@ -0,0 +1,130 @@
+"""
+Content-hash deduplication.
+"""
+import hashlib
+import json
+import os
+import time
+
+from .config import LEDGER_FILE
+from .ledger import _SQLiteStore
+
+
+HASH_CHUNK_SIZE = 1024 * 1024
+
+
+class ContentIndex(_SQLiteStore):
+    """
+    Content-addressed index: (sha256 of the file bytes, book + OCR parameters) -> GUIDs already
+    returned. A byte-identical file for the same book with the same settings reuses those GUIDs
+    instead of being uploaded again.
+
+    Hashes are streamed in HASH_CHUNK_SIZE blocks and memoized by (path, size, mtime), so rescanning
+    an unchanged folder only costs one stat() per file.
+    """
+    _SCHEMA = """
+        CREATE TABLE IF NOT EXISTS file_hashes (
+            path     TEXT PRIMARY KEY,
+            size     INTEGER NOT NULL,
+            mtime_ns INTEGER NOT NULL,
+            sha256   TEXT NOT NULL
+        );
+        CREATE TABLE IF NOT EXISTS content_results (
+            sha256     TEXT NOT NULL,
+            params     TEXT NOT NULL,
+            guids      TEXT NOT NULL,
+            created_at REAL NOT NULL,
+            PRIMARY KEY (sha256, params)
+        );
+    """
+
+    def __init__(self, path=LEDGER_FILE, timeout=30.0):
+        super().__init__(path, timeout)
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def hash_file(path):
+        h = hashlib.sha256()
+        buf = bytearray(HASH_CHUNK_SIZE)
+        view = memoryview(buf)
+        with open(path, "rb", buffering=0) as f:
+            while True:
+                n = f.readinto(buf)
+                if not n:
+                    break
+                h.update(view[:n])
+        return h.hexdigest()
+
+    def file_hash(self, path):
+        path = os.path.abspath(path)
+        st = os.stat(path)
+        row = self._conn().execute(
+            "SELECT sha256 FROM file_hashes WHERE path=? AND size=? AND mtime_ns=?",
+            (path, st.st_size, st.st_mtime_ns),
+        ).fetchone()
+        if row:
+            return row[0]
+        digest = self.hash_file(path)
+        with self._tx() as conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO file_hashes (path, size, mtime_ns, sha256) VALUES (?, ?, ?, ?)",
+                (path, st.st_size, st.st_mtime_ns, digest),
+            )
+        return digest
+
+    @staticmethod
+    def _params_key(file):
+        return json.dumps({"bookid": file.bookid, **file.ocr_params()}, sort_keys=True, separators=(",", ":"))
+
+    def key(self, file):
+        """
+        (content hash, book + parameters) of a File. Hashes the file unless its hash is memoized.
+        """
+        return self.file_hash(file.file_name), self._params_key(file)
+
+    def lookup(self, file, key=None):
+        """
+        Returns the stored guid list (same shape as queue.php's "guids") or None. Pass the key
+        if it was computed already.
+        """
+        row = self._conn().execute(
+            "SELECT guids FROM content_results WHERE sha256=? AND params=?", key or self.key(file)
+        ).fetchone()
+        if row is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        return [{"guid": g} for g in json.loads(row[0])]
+
+    def record(self, file, key=None):
+        if not file.guids:
+            return
+        with self._tx() as conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO content_results (sha256, params, guids, created_at) VALUES (?, ?, ?, ?)",
+                (*(key or self.key(file)), json.dumps([g.guid for g in file.guids]), time.time()),
+            )
+
+    def plan(self, files):
+        """
+        Split a batch of File objects into
+          reused:     files whose content was OCR'd before (their GUIDs are already set)
+          unique:     files that still need uploading, one per distinct content
+          duplicates: (file, first_identical_file) pairs within the batch; call
+                      file.adopt_guids(first_identical_file) once the latter is done
+        """
+        reused, unique, duplicates = [], [], []
+        first = {}
+        for file in files:
+            key = self.key(file)
+            if key in first:
+                duplicates.append((file, first[key]))
+            elif file.reuse_results(self, key):
+                reused.append(file)
+            else:
+                first[key] = file
+                unique.append(file)
+        if reused or duplicates:
+            print(f"Deduplicated {len(reused) + len(duplicates)} of {len(files)} files.")
+        return reused, unique, duplicates
@@ -0,0 +1,164 @@
+"""
+Parallel export of GUID ranges, with a manifest of outcomes so re-runs only retry failures.
+"""
+import json
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from .client import OCRAPIError
+from .config import DOWNLOAD_DIR, RESULT_NAME_TEMPLATE
+from .models import GUID
+from .ratelimit import TokenBucket
+from .rename import BulkRenamer
+
+
+class RangeExporter:
+    """
+    Download the results of many GUIDs (e.g. GUID_START..GUID_END) with `workers` threads, at most
+    `rate_limit` requests per second, without waits between GUIDs. Each GUID ends up as one of
+
+      ok         results saved (or already in download_dir)
+      not_found  the platform has no such GUID (API status 102), e.g. a gap in the range; a GUID
+                 in `known` (returned to this account, e.g. by the ledger) counts as not_ready instead
+      forbidden  the GUID exists but belongs to someone else (HTTP / API status 401 or 403)
+      not_ready  OCR is still running (API status 103)
+      error      anything else (network, unexpected status); the message is kept
+
+    and no outcome stops the run. Outcomes are appended to a JSON-lines manifest as they happen.
+    GUIDs already on disk, and GUIDs whose manifest outcome is final (ok, not_found, forbidden), are
+    skipped on the next run, so it only retries not_ready and error (pass retry_missing=True to
+    probe not_found / forbidden GUIDs again).
+    """
+    FINAL = {"ok", "not_found", "forbidden"}
+    FORBIDDEN_STATUS = {401, 403}
+
+    def __init__(self, client, download_dir=DOWNLOAD_DIR, workers=8, rate_limit=4.0, manifest_path=None,
+                 rename_map=None, template=RESULT_NAME_TEMPLATE, retry_missing=False, progress_every=500,
+                 writer=None, known=None, ledger=None):
+        self.client = client
+        self.download_dir = download_dir
+        self.workers = max(1, int(workers))
+        self.limiter = TokenBucket(rate_limit)
+        self.manifest_path = manifest_path or os.path.join(download_dir, "export_manifest.jsonl")
+        self.rename_map = rename_map
+        self.template = template
+        self.retry_missing = retry_missing
+        self.progress_every = progress_every
+        self.writer = writer  # ResultWriter; None writes each result on the fetching thread
+        self.known = set(known or ())  # GUID numbers known to exist, so 102 only means "not yet"
+        self.ledger = ledger  # names the results of known GUIDs on disk (see BulkRenamer.index)
+        self.counts = {}
+        self._lock = threading.Lock()
+        self._manifest = None
+        self._total = 0
+
+    def load_manifest(self):
+        """
+        {guid: last recorded outcome} from the manifest (empty if there is none yet).
+        """
+        outcomes = {}
+        if os.path.exists(self.manifest_path):
+            with open(self.manifest_path, "r", encoding="utf-8") as f:
+                for line in f:
+                    try:
+                        entry = json.loads(line)
+                    except ValueError:
+                        continue  # torn last line after a crash
+                    outcomes[int(entry["guid"])] = entry
+        return outcomes
+
+    def plan(self, numbers):
+        """
+        Split GUID numbers into (to_fetch, skipped): skipped GUIDs are on disk already or have a final
+        outcome in the manifest.
+        """
+        on_disk = {
+            guid for guid, names in BulkRenamer(self.download_dir, rename_map=self.rename_map, template=self.template,
+                                                ledger=self.ledger).index().items()
+            if any(name.endswith((".json", ".json.gz", ".json.zst")) for name in names)
+        }
+        final = self.FINAL if not self.retry_missing else {"ok"}
+        manifest = self.load_manifest()
+        to_fetch, skipped = [], 0
+        for number in numbers:
+            number = int(number)
+            entry = manifest.get(number)
+            status = entry["status"] if entry else None
+            if status == "not_found" and number in self.known:
+                status = "not_ready"  # recorded before the GUID was known to exist
+            if number in on_disk or status in final:
+                skipped += 1
+            else:
+                to_fetch.append(number)
+        return to_fetch, skipped
+
+    def classify(self, error, number=None):
+        if isinstance(error, OCRAPIError):
+            if error.http_status in self.FORBIDDEN_STATUS or error.status in self.FORBIDDEN_STATUS:
+                return "forbidden"
+            if error.status == 102:
+                return "not_ready" if number in self.known else "not_found"
+            if error.status == 103:
+                return "not_ready"
+        return "error"
+
+    def _record(self, guid, status, message=None):
+        entry = {"guid": guid, "status": status, "time": round(time.time(), 3)}
+        if message:
+            entry["message"] = message
+        with self._lock:
+            self._manifest.write(json.dumps(entry, ensure_ascii=False) + "\n")
+            self._manifest.flush()
+            self.counts[status] = self.counts.get(status, 0) + 1
+            done = sum(self.counts.values())
+        self.client.metrics.inc("ocr_export_total", labels={"outcome": status})
+        if self.progress_every and done % self.progress_every == 0:
+            print(f"Export: {done}/{self._total} {self.counts}")
+
+    def export_one(self, number):
+        guid = GUID(self.client, number)
+        cache = self.client.result_cache
+        if not (cache and cache.contains(number)):
+            self.client.metrics.sleep("export_rate_limit", self.limiter.acquire(), guid=number)
+        try:
+            guid.save_results(rename_map=self.rename_map, download_dir=self.download_dir, template=self.template,
+                              writer=self.writer, done=self._written)
+        except Exception as e:  # classified and recorded; one bad GUID never stops the export
+            status = self.classify(e, number)
+            self._record(number, status, self._message(e))
+            return status
+        return "ok"
+
+    @staticmethod
+    def _message(error):
+        return (str(error).splitlines() or [type(error).__name__])[0][:200]
+
+    def _written(self, guid, error):
+        # "ok" is only recorded once the files are on disk
+        if error is None:
+            self._record(guid.guid, "ok")
+        else:
+            self._record(guid.guid, "error", self._message(error))
+
+    def run(self, numbers):
+        """
+        Export every GUID in `numbers` (any iterable, e.g. range(start, end + 1)). Returns a summary dict.
+        """
+        start = time.monotonic()
+        to_fetch, skipped = self.plan(numbers)
+        self._total = len(to_fetch)
+        print(f"Export: {len(to_fetch)} GUIDs to fetch, {skipped} skipped (on disk or final in {self.manifest_path}).")
+        os.makedirs(self.download_dir, exist_ok=True)
+        self.counts = {}
+        with open(self.manifest_path, "a", encoding="utf-8") as self._manifest:
+            with ThreadPoolExecutor(max_workers=self.workers) as pool:
+                for _ in pool.map(self.export_one, to_fetch):
+                    pass
+            if self.writer:
+                self.writer.flush()  # the manifest stays open until every "ok" is recorded
+        self._manifest = None
+        summary = dict(self.counts, skipped=skipped, elapsed=round(time.monotonic() - start, 1))
+        print(f"Export finished: {json.dumps(summary)}")
+        return summary
@@ -0,0 +1,295 @@
+"""
+Job ledger (crash-safe resume).
+"""
+import os
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+
+from .config import LEDGER_FILE
+from .models import GUID, File
+
+
+class _SQLiteStore:
+    """
+    Shared plumbing for the SQLite-backed stores: one connection per thread, WAL mode,
+    a busy timeout and short BEGIN IMMEDIATE transactions, so several threads or processes
+    can write to the same database file. close() closes the connections of every thread;
+    those of threads that ended are closed whenever a new one is opened.
+    """
+    _SCHEMA = ""
+
+    _COLUMNS = {}  # table -> {column: declaration} added to databases created before them
+
+    def __init__(self, path=LEDGER_FILE, timeout=30.0):
+        self.path = path
+        self.timeout = timeout
+        self._local = threading.local()
+        self._conns = {}  # thread -> its connection
+        self._conns_lock = threading.Lock()
+        self._conn().executescript(self._SCHEMA)
+        for table, columns in self._COLUMNS.items():
+            existing = {row[1] for row in self._conn().execute(f"PRAGMA table_info({table})")}
+            for column, declaration in columns.items():
+                if column not in existing:
+                    with self._tx() as conn:
+                        conn.execute(f"ALTER TABLE {table} ADD COLUMN {column} {declaration}")
+
+    def _conn(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            # check_same_thread=False only so close() can close it; no other thread uses it
+            conn = sqlite3.connect(self.path, timeout=self.timeout, isolation_level=None, check_same_thread=False)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.execute(f"PRAGMA busy_timeout={int(self.timeout * 1000)}")
+            self._local.conn = conn
+            with self._conns_lock:
+                ended = [thread for thread in self._conns if not thread.is_alive()]
+                for thread in ended:
+                    self._conns.pop(thread).close()
+                self._conns[threading.current_thread()] = conn
+        return conn
+
+    @contextmanager
+    def _tx(self):
+        conn = self._conn()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            yield conn
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        conn.execute("COMMIT")
+
+    def close(self):
+        """
+        Close the connection of every thread. A thread using the store afterwards opens a new one.
+        """
+        with self._conns_lock:
+            conns, self._conns = self._conns, {}
+        for conn in conns.values():
+            conn.close()
+        self._local = threading.local()
+
+
+class JobLedger(_SQLiteStore):
+    """
+    Transactional SQLite record of every file, queue_id and GUID in a batch.
+
+    files: one row per (path, bookid) with status 'uploaded', 'ocr_done' or 'failed', and the
+           size and mtime the file had when it was uploaded (a replaced file is uploaded again)
+    guids: one row per GUID with its source file, index and whether results were saved
+    guid_copies: the same for every other file that got a GUID already in guids (an identical
+                 file, see ContentIndex), whose results are written under its own name too
+
+    Every update is its own short transaction, committed before the next stage starts, so a crash
+    loses at most the step in flight.
+    """
+    _SCHEMA = """
+        CREATE TABLE IF NOT EXISTS files (
+            path       TEXT NOT NULL,
+            bookid     INTEGER NOT NULL,
+            status     TEXT NOT NULL,
+            queue_id   INTEGER,
+            error      TEXT,
+            size       INTEGER,
+            mtime_ns   INTEGER,
+            updated_at REAL NOT NULL,
+            PRIMARY KEY (path, bookid)
+        );
+        CREATE TABLE IF NOT EXISTS guids (
+            guid       INTEGER PRIMARY KEY,
+            path       TEXT,
+            bookid     INTEGER,
+            original   TEXT,
+            idx        INTEGER,
+            saved      INTEGER NOT NULL DEFAULT 0,
+            updated_at REAL NOT NULL
+        );
+        CREATE INDEX IF NOT EXISTS guids_unsaved ON guids (bookid, saved);
+        CREATE INDEX IF NOT EXISTS guids_path ON guids (path);
+        CREATE TABLE IF NOT EXISTS guid_copies (
+            guid       INTEGER NOT NULL,
+            path       TEXT NOT NULL,
+            bookid     INTEGER,
+            original   TEXT,
+            idx        INTEGER,
+            saved      INTEGER NOT NULL DEFAULT 0,
+            updated_at REAL NOT NULL,
+            PRIMARY KEY (guid, path)
+        );
+        CREATE INDEX IF NOT EXISTS guid_copies_path ON guid_copies (path);
+    """
+    _COLUMNS = {"files": {"size": "INTEGER", "mtime_ns": "INTEGER"}}
+
+    @staticmethod
+    def _stat(path):
+        try:
+            st = os.stat(path)
+        except OSError:
+            return None, None
+        return st.st_size, st.st_mtime_ns
+
+    def _set_file(self, file, status, queue_id=None, error=None):
+        size, mtime_ns = self._stat(file.file_name)
+        with self._tx() as conn:
+            conn.execute(
+                "INSERT INTO files (path, bookid, status, queue_id, error, size, mtime_ns, updated_at) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?) "
+                "ON CONFLICT (path, bookid) DO UPDATE SET status=excluded.status, "
+                "queue_id=COALESCE(excluded.queue_id, files.queue_id), error=excluded.error, "
+                "size=excluded.size, mtime_ns=excluded.mtime_ns, updated_at=excluded.updated_at",
+                (os.path.abspath(file.file_name), file.bookid, status, queue_id, error, size, mtime_ns, time.time()),
+            )
+
+    def record_upload(self, file):
+        self._set_file(file, "uploaded", queue_id=file.queue_id)
+
+    def record_upload_result(self, result):
+        # ConcurrentUploader on_result callback
+        if result["ok"]:
+            self.record_upload(result["file"])
+        else:
+            self._set_file(result["file"], "failed", error=result["error"])
+
+    def record_queue_failed(self, file, message):
+        self._set_file(file, "failed", error=message)
+
+    def record_guids(self, file):
+        now = time.time()
+        size, mtime_ns = self._stat(file.file_name)
+        with self._tx() as conn:
+            # the size and mtime recorded at upload stay: the file may have been replaced since
+            conn.execute(
+                "INSERT INTO files (path, bookid, status, queue_id, error, size, mtime_ns, updated_at) "
+                "VALUES (?, ?, 'ocr_done', ?, NULL, ?, ?, ?) "
+                "ON CONFLICT (path, bookid) DO UPDATE SET status='ocr_done', error=NULL, "
+                "size=COALESCE(files.size, excluded.size), mtime_ns=COALESCE(files.mtime_ns, excluded.mtime_ns), "
+                "updated_at=excluded.updated_at",
+                (os.path.abspath(file.file_name), file.bookid, file.queue_id, size, mtime_ns, now),
+            )
+            rows = [(g.guid, os.path.abspath(file.file_name), file.bookid, g.original_filename, g.index, now)
+                    for g in file.guids]
+            conn.executemany(
+                "INSERT INTO guids (guid, path, bookid, original, idx, updated_at) VALUES (?, ?, ?, ?, ?, ?) "
+                "ON CONFLICT (guid) DO NOTHING",
+                rows,
+            )
+            # a GUID another file has already: record this file's name for it as well
+            conn.executemany(
+                "INSERT INTO guid_copies (guid, path, bookid, original, idx, updated_at) "
+                "SELECT ?, ?, ?, ?, ?, ? WHERE (SELECT path FROM guids WHERE guid=?) <> ? "
+                "ON CONFLICT (guid, path) DO NOTHING",
+                [row + (row[0], row[1]) for row in rows],
+            )
+
+    def record_saved(self, guid):
+        # a copy is told apart from the GUID it copies by its name (GUIDs fetched by number have none)
+        now = time.time()
+        with self._tx() as conn:
+            conn.execute("UPDATE guids SET saved=1, updated_at=? WHERE guid=? AND (? IS NULL OR original IS ?)",
+                         (now, guid.guid, guid.original_filename, guid.original_filename))
+            conn.execute("UPDATE guid_copies SET saved=1, updated_at=? WHERE guid=? AND original IS ? AND idx IS ?",
+                         (now, guid.guid, guid.original_filename, guid.index))
+
+    def file_status(self, path, bookid):
+        row = self._conn().execute(
+            "SELECT status, queue_id, error FROM files WHERE path=? AND bookid=?",
+            (os.path.abspath(path), int(bookid)),
+        ).fetchone()
+        return None if row is None else {"status": row[0], "queue_id": row[1], "error": row[2]}
+
+    def unsaved_guids(self, client, bookid=None, paths=None):
+        """
+        GUIDs whose results were not saved yet (copies included), of one book (or all), and of the
+        given paths only.
+        """
+        conn = self._conn()
+        rows = []
+        for table in ("guids", "guid_copies"):
+            sql = f"SELECT guid, original, idx FROM {table} WHERE saved=0"
+            args = ()
+            if bookid is not None:
+                sql += " AND bookid=?"
+                args = (int(bookid),)
+            if paths is None:
+                rows.extend(conn.execute(sql + " ORDER BY path, idx", args))
+                continue
+            paths = sorted(os.path.abspath(p) for p in paths)
+            for i in range(0, len(paths), 500):
+                chunk = paths[i:i + 500]
+                rows.extend(conn.execute(f"{sql} AND path IN ({','.join('?' * len(chunk))}) ORDER BY path, idx",
+                                         args + tuple(chunk)))
+        return [GUID(client, guid, original, index=idx) for guid, original, idx in rows]
+
+    def known_guids(self, client, numbers=None):
+        """
+        GUID objects (with original name and index) for the given GUID numbers that the ledger
+        knows, or for every GUID in the ledger.
+        """
+        conn = self._conn()
+        if numbers is None:
+            rows = conn.execute("SELECT guid, original, idx FROM guids").fetchall()
+        else:
+            numbers = [int(n) for n in numbers]
+            rows = []
+            for i in range(0, len(numbers), 500):
+                chunk = numbers[i:i + 500]
+                rows.extend(conn.execute(
+                    f"SELECT guid, original, idx FROM guids WHERE guid IN ({','.join('?' * len(chunk))})", chunk))
+        return [GUID(client, guid, original, index=idx) for guid, original, idx in rows]
+
+    def open_queues(self, client, bookid=None, queue_ids=None):
+        """
+        File objects for uploads whose queue has not finished yet (optionally one book or
+        specific queue_ids), ready for a QueuePoller.
+        """
+        sql = "SELECT path, bookid, queue_id FROM files WHERE status='uploaded' AND queue_id IS NOT NULL"
+        args = []
+        if bookid is not None:
+            sql += " AND bookid=?"
+            args.append(int(bookid))
+        if queue_ids:
+            sql += f" AND queue_id IN ({','.join('?' * len(queue_ids))})"
+            args.extend(int(q) for q in queue_ids)
+        files = []
+        for path, file_bookid, queue_id in self._conn().execute(sql + " ORDER BY updated_at", args):
+            file = File(client, file_bookid, path)
+            file.queue_id = queue_id
+            files.append(file)
+        return files
+
+    def plan_resume(self, client, items, bookid, file_kwargs=None):
+        """
+        Split a batch (paths or File objects) into the work that is still unfinished:
+          to_upload: items never uploaded, whose upload / OCR failed, or that were replaced (other
+                     size or mtime) since they were uploaded
+          to_poll:   File objects with a pending queue_id
+          to_download: GUID objects of the finished items whose results were not saved yet
+        """
+        bookid = int(bookid)
+        rows = {
+            path: (status, queue_id, size, mtime_ns)
+            for path, status, queue_id, size, mtime_ns in self._conn().execute(
+                "SELECT path, status, queue_id, size, mtime_ns FROM files WHERE bookid=?", (bookid,)
+            )
+        }
+        to_upload, to_poll, done = [], [], []
+        for item in items:
+            path = item.file_name if isinstance(item, File) else item
+            status, queue_id, size, mtime_ns = rows.get(os.path.abspath(path), (None, None, None, None))
+            if size is not None and (size, mtime_ns) != self._stat(path):
+                status = None  # replaced: the recorded queue and GUIDs are of the old content
+            if status == "uploaded" and queue_id is not None:
+                file = item if isinstance(item, File) else File(client, bookid, path, **(file_kwargs or {}))
+                file.queue_id = queue_id
+                to_poll.append(file)
+            elif status == "ocr_done":
+                done.append(path)
+            else:
+                to_upload.append(item)
+        to_download = self.unsaved_guids(client, bookid, done)
+        print(f"Resume: {len(to_upload)} to upload, {len(to_poll)} queues to poll, {len(to_download)} GUIDs to download.")
+        return to_upload, to_poll, to_download
@@ -0,0 +1,141 @@
+"""
+Run metrics: JSON-lines traces and Prometheus text snapshots.
+"""
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+
+class Metrics:
+    """
+    Per-stage timing and counters for a run: request latency and bytes per endpoint, retries,
+    queue wait time, sleep time and file-write time.
+
+    Every observation is appended to an optional JSON-lines trace (one event per line, keyed by
+    file / queue_id / guid where known), so slow batches can be diagnosed afterwards. Aggregates
+    use low-cardinality labels only and are exported by write_prometheus() in the Prometheus text
+    format at the end of a run.
+    """
+    BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300, 600, 1800, 3600)
+    HELP = {
+        "ocr_request_seconds": ("histogram", "API request latency per attempt"),
+        "ocr_request_bytes_sent_total": ("counter", "Request body bytes sent"),
+        "ocr_request_bytes_received_total": ("counter", "Response body bytes received"),
+        "ocr_retries_total": ("counter", "Retried API requests"),
+        "ocr_queue_wait_seconds": ("histogram", "Time from upload to OCR finished"),
+        "ocr_sleep_seconds_total": ("counter", "Time spent waiting (rate limits, backoff, fixed waits)"),
+        "ocr_file_write_seconds": ("histogram", "Time writing result files per GUID"),
+        "ocr_file_write_bytes_total": ("counter", "Bytes of result files written"),
+        "ocr_result_cache_total": ("counter", "Result cache lookups"),
+        "ocr_concurrency_limit": ("gauge", "Requests allowed in flight by the adaptive controller"),
+        "ocr_concurrency_changes_total": ("counter", "Adaptive concurrency changes by reason"),
+    }
+
+    def __init__(self, trace_path=None):
+        self.trace_path = trace_path
+        self._trace = open(trace_path, "a", encoding="utf-8") if trace_path else None
+        self._lock = threading.Lock()
+        self._histograms = {}  # (name, labels) -> [bucket counts..., sum, count]
+        self._counters = {}    # (name, labels) -> value
+        self._gauges = {}      # (name, labels) -> value
+
+    @staticmethod
+    def _key(name, labels):
+        return name, tuple(sorted((labels or {}).items()))
+
+    def _emit(self, event, **fields):
+        if self._trace is None:
+            return
+        line = json.dumps(dict(ts=round(time.time(), 6), event=event, **fields), ensure_ascii=False, default=str)
+        with self._lock:
+            self._trace.write(line + "\n")
+
+    def observe(self, name, seconds, labels=None, **keys):
+        key = self._key(name, labels)
+        with self._lock:
+            hist = self._histograms.setdefault(key, [0] * len(self.BUCKETS) + [0.0, 0])
+            for i, bound in enumerate(self.BUCKETS):
+                if seconds <= bound:
+                    hist[i] += 1
+            hist[-2] += seconds
+            hist[-1] += 1
+        self._emit(name, seconds=round(seconds, 6), **(labels or {}), **keys)
+
+    def inc(self, name, value=1, labels=None, trace=False, **keys):
+        key = self._key(name, labels)
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + value
+        if trace:
+            self._emit(name, value=value, **(labels or {}), **keys)
+
+    def gauge(self, name, value, labels=None):
+        with self._lock:
+            self._gauges[self._key(name, labels)] = value
+
+    def request(self, endpoint, seconds, status, sent=0, received=0, **keys):
+        labels = {"endpoint": endpoint, "status": str(status)}
+        self.inc("ocr_request_bytes_sent_total", sent, {"endpoint": endpoint})
+        self.inc("ocr_request_bytes_received_total", received, {"endpoint": endpoint})
+        self.observe("ocr_request_seconds", seconds, labels, sent=sent, received=received, **keys)
+
+    def retry(self, endpoint, reason, **keys):
+        self.inc("ocr_retries_total", 1, {"endpoint": endpoint, "reason": reason}, trace=True, **keys)
+
+    def sleep(self, reason, seconds, **keys):
+        if seconds > 0:
+            self.inc("ocr_sleep_seconds_total", seconds, {"reason": reason}, trace=True, **keys)
+
+    @contextmanager
+    def timer(self, name, labels=None, **keys):
+        start = time.monotonic()
+        try:
+            yield keys
+        finally:
+            self.observe(name, time.monotonic() - start, labels, **keys)
+
+    @staticmethod
+    def _format_labels(labels, extra=()):
+        items = list(labels) + list(extra)
+        if not items:
+            return ""
+        escaped = (f'{k}="{str(v).replace(chr(92), chr(92) * 2).replace(chr(34), chr(92) + chr(34))}"' for k, v in items)
+        return "{" + ",".join(escaped) + "}"
+
+    def prometheus_text(self):
+        with self._lock:
+            histograms = {k: list(v) for k, v in self._histograms.items()}
+            counters = dict(self._counters)
+            counters.update(self._gauges)
+        lines = []
+        names = sorted({name for name, _ in histograms} | {name for name, _ in counters})
+        for name in names:
+            kind, text = self.HELP.get(name, ("untyped", name))
+            lines.append(f"# HELP {name} {text}")
+            lines.append(f"# TYPE {name} {kind}")
+            for (hname, labels), hist in sorted(histograms.items()):
+                if hname != name:
+                    continue
+                for bound, count in zip(self.BUCKETS, hist):
+                    lines.append(f"{name}_bucket{self._format_labels(labels, [('le', bound)])} {count}")
+                lines.append(f"{name}_bucket{self._format_labels(labels, [('le', '+Inf')])} {hist[-1]}")
+                lines.append(f"{name}_sum{self._format_labels(labels)} {hist[-2]:.6f}")
+                lines.append(f"{name}_count{self._format_labels(labels)} {hist[-1]}")
+            for (cname, labels), value in sorted(counters.items()):
+                if cname == name:
+                    lines.append(f"{name}{self._format_labels(labels)} {value:g}")
+        return "\n".join(lines) + "\n"
+
+    def write_prometheus(self, path):
+        tmp = f"{path}.tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            f.write(self.prometheus_text())
+        os.replace(tmp, path)
+        print(f"Metrics written: {path}" + (f", trace: {self.trace_path}" if self.trace_path else ""))
+
+    def close(self):
+        if self._trace is not None:
+            with self._lock:
+                self._trace.close()
+                self._trace = None
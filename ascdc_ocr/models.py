@@ -0,0 +1,250 @@
+"""
+Book, File and GUID: the objects a run uploads, polls and downloads.
+"""
+import json
+import os
+
+from .columnar import PageResult
+from .config import BOOK_CACHE_FILE, DOWNLOAD_DIR, RESULT_NAME_TEMPLATE
+from .multipart import UploadProgress
+from .naming import ensure_unique_path, find_existing_files_for_guid, render_result_basename
+from .writer import ResultWriter
+
+
+class Book:
+    def __init__(self, client, title=None, author=None, is_public=0, orientation=2, bookid=None,
+                 cache_file=BOOK_CACHE_FILE):
+        self.client = client
+        self.cache_file = cache_file
+        if bookid is not None:
+            self.bookid = int(bookid)
+            self.title = title
+            self.author = author
+            self.public = is_public
+            self.orientation = orientation
+            self.key = f"{title}::{author}" if title and author else None
+            print(f"📕 Using existing book ID: {self.bookid}")
+            if self.key:
+                cache = self._load_cache()
+                if self.key not in cache:
+                    cache[self.key] = self.bookid
+                    self._save_cache(cache)
+                    print(f"📝 Cached manually provided book ID for: {self.key}")
+        else:
+            if not title or not author:
+                raise ValueError("Title and author must be provided if bookid is not specified.")
+            self.title = title
+            self.author = author
+            self.key = f"{title}::{author}"
+            self.bookid = int(self._get_or_create_book(is_public, orientation))
+
+    @staticmethod
+    def cached_id(title, author, cache_file=BOOK_CACHE_FILE):
+        """
+        The book ID cached for title and author, or None. Never contacts the platform.
+        """
+        if not title or not author or not os.path.exists(cache_file):
+            return None
+        with open(cache_file, 'r', encoding='utf-8') as f:
+            bookid = json.load(f).get(f"{title}::{author}")
+        return None if bookid is None else int(bookid)
+
+    def _load_cache(self):
+        if os.path.exists(self.cache_file):
+            with open(self.cache_file, 'r', encoding='utf-8') as f:
+                return json.load(f)
+        return {}
+
+    def _save_cache(self, cache):
+        with open(self.cache_file, 'w', encoding='utf-8') as f:
+            json.dump(cache, f, indent=2)
+
+    def _get_or_create_book(self, is_public, orientation):
+        cache = self._load_cache()
+        if self.key in cache:
+            print(f"Book exists: {self.title}")
+            return cache[self.key]
+
+        data = self.client.create_book(self.title, self.author, is_public, orientation)
+        if data.get("status") == 200:
+            cache[self.key] = data["bookid"]
+            print(f"Book created: {self.title} (ID: {data['bookid']})")
+            self._save_cache(cache)
+            return data["bookid"]
+        raise Exception(f"Book creation failed: {data.get('message')}")
+
+
+class File:
+    def __init__(self, client, bookid, file_name, block_order='TBRL', language=1, orientation=2, correction=-1,
+                 pages_per_img=1, remove_margin=-1, has_mark=False, has_alphabet=False, remove_anno=False, is_inverted=False):
+        self.client = client
+        self.bookid = int(bookid)
+        self.file_name = file_name
+        self.queue_id = None
+        self.guids = []
+        self.members = None  # original files packed into this upload (ZipBatcher), one page each
+        self.source_name = None  # original PDF this upload is a page range of (PdfSplitter)
+        self.page_offset = 0  # pages of source_name before this range
+        self.upload_stats = None
+        self.block_order = block_order.upper()
+        self.language = int(language)
+        self.orientation = int(orientation)
+        self.correction = int(correction)
+        self.pages_per_img = int(pages_per_img)
+        self.remove_margin = int(remove_margin)
+        self.has_mark = bool(has_mark)
+        self.has_alphabet = bool(has_alphabet)
+        self.remove_anno = bool(remove_anno)
+        self.is_inverted = bool(is_inverted)
+
+    def upload(self):
+        # now respects self.block_order (default remains TBRL)
+        name = os.path.basename(self.file_name)
+        progress = UploadProgress(name)
+        data = self.client.upload_file(self.file_name, self.bookid, block_order=self.block_order, progress=progress)
+        self.upload_stats = progress.summary()
+        if data.get("status") == 200:
+            self.queue_id = data["queue_id"]
+            rate = self.upload_stats["bytes_per_sec"] / 1024**2
+            print(f"File uploaded successfully: {name} ({self.upload_stats['bytes'] / 1024**2:.2f} MB, {rate:.2f} MB/s). Queue ID: {self.queue_id}")
+            return self.queue_id
+        raise Exception(f"Upload failed: {data.get('message')}")
+
+    def ocr_params(self):
+        """
+        OCR settings that change the result for identical bytes (used as part of the dedup key).
+        """
+        return {
+            "block_order": self.block_order,
+            "language": self.language,
+            "orientation": self.orientation,
+            "correction": self.correction,
+            "pages_per_img": self.pages_per_img,
+            "remove_margin": self.remove_margin,
+            "has_mark": self.has_mark,
+            "has_alphabet": self.has_alphabet,
+            "remove_anno": self.remove_anno,
+            "is_inverted": self.is_inverted,
+        }
+
+    def reuse_results(self, content_index, key=None):
+        """
+        If a byte-identical file was already OCR'd with the same parameters, take over its GUIDs
+        instead of uploading. Returns True on a hit.
+        """
+        guids_data = content_index.lookup(self, key)
+        if guids_data is None:
+            return False
+        print(f"♻️ Already OCR'd (identical content): {os.path.basename(self.file_name)}")
+        self.resolve_guids(guids_data)
+        return True
+
+    def adopt_guids(self, source):
+        """
+        Take over the GUIDs of an identical file from the same batch (named after this file). Each
+        GUID becomes a copy of the source's one: it is fetched once and written under both names.
+        """
+        guids = self.resolve_guids([{"guid": g.guid} for g in source.guids])
+        for guid, original in zip(guids, source.guids):
+            guid.copy_of = original
+            original.copies.append(guid)
+        return guids
+
+    def wait_for_ocr(self):
+        guids_data = self.client.poll_ocr_queue(self.queue_id)
+        return self.resolve_guids(guids_data)
+
+    def resolve_guids(self, guids_data):
+        # Pass the original filename + index to GUID objects
+        base_name = os.path.splitext(os.path.basename(self.source_name or self.file_name))[0]
+        names = [(base_name, self.page_offset + i + 1) for i in range(len(guids_data))]
+        if self.members:
+            # ZIP batch: page i is member i
+            if len(self.members) == len(guids_data):
+                names = [(os.path.splitext(os.path.basename(m))[0], 1) for m in self.members]
+            else:
+                print(f"⚠️ {os.path.basename(self.file_name)}: {len(guids_data)} pages for {len(self.members)} "
+                      f"packed files; naming results after the archive.")
+        self.guids = [GUID(self.client, guid["guid"], name, index=idx) for guid, (name, idx) in zip(guids_data, names)]
+        print(f"OCR completed: {os.path.basename(self.file_name)}. GUIDs: {[g.guid for g in self.guids]}")
+        return self.guids
+
+
+class GUID:
+    def __init__(self, client, guid, original_filename=None, index=None):
+        self.client = client
+        self.guid = int(guid)
+        self.original_filename = original_filename
+        self.index = index  # 1-based position within a file (if known)
+        self.copies = []      # the same GUID named after identical files (File.adopt_guids)
+        self.copy_of = None   # set on those copies
+
+    def _basename(self, rename_map=None, template=RESULT_NAME_TEMPLATE):
+        return render_result_basename(
+            template,
+            guid=self.guid,
+            original=self.original_filename,
+            index=self.index,
+            rename_map=rename_map
+        )
+
+    def get_page(self):
+        """
+        The result as a compact PageResult (columns instead of one dict per box).
+        """
+        return PageResult.from_json(self.client.get_result(self.guid), self.guid, self.original_filename, self.index)
+
+    def save_results(self, rename_map=None, download_dir=DOWNLOAD_DIR, template=RESULT_NAME_TEMPLATE,
+                     writer=None, done=None):
+        """
+        Fetch the result and write it. With a ResultWriter the files are written (on its thread, in its
+        download_dir and format) and done(guid, error) is called once they are on disk; without one,
+        a .txt and an indented .json are written atomically before returning. The copies of the
+        GUID are written from the same result.
+        """
+        result = self.client.get_result(self.guid)
+        if writer is None:
+            writer = ResultWriter(download_dir, metrics=self.client.metrics, background=False)
+        for guid in [self] + self.copies:
+            writer.submit(guid, guid._basename(rename_map=rename_map, template=template), result, done=done)
+
+    def save_image(self, rename_map=None, download_dir=DOWNLOAD_DIR, template=RESULT_NAME_TEMPLATE):
+        result = self.client.get_image(self.guid)
+        os.makedirs(download_dir, exist_ok=True)
+
+        base = self._basename(rename_map=rename_map, template=template)
+        image_filename = ensure_unique_path(os.path.join(download_dir, f"{base}.jpg"))
+
+        with open(image_filename, 'wb') as f:
+            f.write(result)
+        print(f"Saved image: {image_filename}")
+
+    # Rename already-downloaded files in download_dir (for many GUIDs, BulkRenamer scans the folder once)
+    def rename_existing_downloads(self, rename_map=None, dry_run=False, download_dir=DOWNLOAD_DIR,
+                                  template=RESULT_NAME_TEMPLATE):
+        os.makedirs(download_dir, exist_ok=True)
+
+        base = self._basename(rename_map=rename_map, template=template)
+        candidates = find_existing_files_for_guid(download_dir, self.guid)
+
+        if not candidates:
+            print(f"[rename] No existing files found for GUID {self.guid} in {download_dir}")
+            return []
+
+        renamed = []
+        for src in candidates:
+            ext = os.path.splitext(src)[1].lower()
+            target = os.path.join(download_dir, f"{base}{ext}")
+            if os.path.abspath(src) == os.path.abspath(target):
+                continue
+            dst = ensure_unique_path(target)
+
+            if dry_run:
+                print(f"[dry-run] {src} -> {dst}")
+            else:
+                os.rename(src, dst)
+                print(f"[renamed] {src} -> {dst}")
+
+            renamed.append((src, dst))
+
+        return renamed
@@ -0,0 +1,139 @@
+"""
+Streaming multipart/form-data upload bodies and upload progress tracking.
+"""
+import os
+import time
+import uuid
+
+from .config import UPLOAD_CHUNK_SIZE
+
+
+class MultipartFileStream:
+    """
+    multipart/form-data request body that reads the file from disk in UPLOAD_CHUNK_SIZE blocks
+    while it is being sent, instead of building the whole body in memory like requests' files= does.
+    Peak memory stays constant whatever the file size. The length is known up front (so
+    Content-Length is sent, as before) and the stream can be rewound for a retry.
+
+    Note: read() never returns more than chunk_size bytes, even for read(-1).
+    """
+    def __init__(self, fields, field_name, file_path, mime_type, chunk_size=UPLOAD_CHUNK_SIZE, progress=None):
+        self.boundary = uuid.uuid4().hex
+        self.content_type = f"multipart/form-data; boundary={self.boundary}"
+        head = b"".join(
+            f'--{self.boundary}\r\nContent-Disposition: form-data; name="{name}"\r\n\r\n{value}\r\n'.encode("utf-8")
+            for name, value in fields.items() if value is not None
+        )
+        head += (
+            f'--{self.boundary}\r\nContent-Disposition: form-data; name="{field_name}"; '
+            f'filename="{os.path.basename(file_path)}"\r\nContent-Type: {mime_type}\r\n\r\n'
+        ).encode("utf-8")
+        self._head = head
+        self._tail = f"\r\n--{self.boundary}--\r\n".encode("utf-8")
+        self.path = file_path
+        self.file_size = os.path.getsize(file_path)
+        self.length = len(self._head) + self.file_size + len(self._tail)
+        self.chunk_size = int(chunk_size)
+        self.progress = progress
+        self._file = None
+        self._pos = 0
+
+    def __len__(self):
+        return self.length
+
+    def __iter__(self):
+        while True:
+            chunk = self.read(self.chunk_size)
+            if not chunk:
+                return
+            yield chunk
+
+    def tell(self):
+        return self._pos
+
+    def seek(self, offset, whence=0):
+        if whence == 1:
+            offset += self._pos
+        elif whence == 2:
+            offset += self.length
+        self._pos = max(0, min(int(offset), self.length))
+        return self._pos
+
+    def _read_at(self, pos, size):
+        if pos < len(self._head):
+            return self._head[pos:pos + size]
+        pos -= len(self._head)
+        if pos < self.file_size:
+            if self._file is None:
+                self._file = open(self.path, "rb")
+            self._file.seek(pos)
+            chunk = self._file.read(min(size, self.file_size - pos))
+            if not chunk:
+                raise IOError(f"{self.path} shrank during upload")
+            return chunk
+        pos -= self.file_size
+        return self._tail[pos:pos + size]
+
+    def read(self, size=-1):
+        if size is None or size < 0 or size > self.chunk_size:
+            size = self.chunk_size
+        parts = []
+        while size > 0 and self._pos < self.length:
+            chunk = self._read_at(self._pos, size)
+            parts.append(chunk)
+            self._pos += len(chunk)
+            size -= len(chunk)
+        data = b"".join(parts)
+        if data and self.progress:
+            self.progress(self._pos, self.length)
+        return data
+
+    def close(self):
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+class UploadProgress:
+    """
+    Progress callback for MultipartFileStream. Prints every `step` of the way for files of at least
+    `min_report_bytes`, and keeps the transfer rate of the finished upload.
+    """
+    def __init__(self, name, step=0.25, min_report_bytes=8 * 1024**2):
+        self.name = name
+        self.step = step
+        self.min_report_bytes = min_report_bytes
+        self.started = None
+        self.finished = None
+        self.sent = 0
+        self.total = 0
+        self._next = step
+
+    def __call__(self, sent, total):
+        now = time.monotonic()
+        if self.started is None:
+            self.started = now
+        self.sent, self.total = sent, total
+        self.finished = now
+        if total >= self.min_report_bytes and sent < total and sent / total >= self._next:
+            print(f"  {self.name}: {sent / total:.0%} of {total / 1024**2:.1f} MB ({self.bytes_per_sec() / 1024**2:.2f} MB/s)")
+            while self._next <= sent / total:
+                self._next += self.step
+
+    def seconds(self):
+        if self.started is None:
+            return 0.0
+        return self.finished - self.started
+
+    def bytes_per_sec(self):
+        seconds = self.seconds()
+        return self.sent / seconds if seconds > 0 else 0.0
+
+    def summary(self):
+        return {"bytes": self.sent, "seconds": round(self.seconds(), 3), "bytes_per_sec": round(self.bytes_per_sec())}
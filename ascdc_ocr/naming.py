@@ -0,0 +1,98 @@
+"""
+Result file naming: sanitizing, unique paths, rename maps and name templates.
+"""
+import glob
+import json
+import os
+import re
+
+
+_WINDOWS_RESERVED = {
+    "CON", "PRN", "AUX", "NUL",
+    "COM1", "COM2", "COM3", "COM4", "COM5", "COM6", "COM7", "COM8", "COM9",
+    "LPT1", "LPT2", "LPT3", "LPT4", "LPT5", "LPT6", "LPT7", "LPT8", "LPT9",
+}
+_ILLEGAL_CHARS_RE = re.compile(r'[<>:"/\\|?*\x00-\x1F]')
+
+
+def sanitize_filename(name: str, replacement: str = "_", max_len: int = 150) -> str:
+    """
+    Safe on Windows/macOS/Linux. Keeps Unicode (e.g., Chinese) but removes illegal filesystem chars.
+    """
+    name = _ILLEGAL_CHARS_RE.sub(replacement, name)
+    name = name.strip().rstrip(".")  # Windows hates trailing dots
+    if not name:
+        name = "untitled"
+
+    base = os.path.splitext(name)[0].upper()
+    if base in _WINDOWS_RESERVED:
+        name = "_" + name
+
+    if len(name) > max_len:
+        root, ext = os.path.splitext(name)
+        name = root[: max_len - len(ext)] + ext
+
+    return name
+
+
+def ensure_unique_path(path: str) -> str:
+    """
+    If path exists, append _1, _2, ... before extension.
+    """
+    if not os.path.exists(path):
+        return path
+    root, ext = os.path.splitext(path)
+    k = 1
+    while True:
+        candidate = f"{root}_{k}{ext}"
+        if not os.path.exists(candidate):
+            return candidate
+        k += 1
+
+
+def load_rename_map(path: str) -> dict:
+    if not path or not os.path.exists(path):
+        return {}
+    with open(path, "r", encoding="utf-8") as f:
+        data = json.load(f)
+    # normalize keys to str
+    return {str(k): str(v) for k, v in data.items()}
+
+
+def render_result_basename(template: str, *, guid: int, original: str = None, index: int = None, rename_map: dict = None) -> str:
+    """
+    Priority:
+      1) rename_map[str(guid)] if provided
+      2) template rendered with fields
+      3) fallback to guid only
+    """
+    if rename_map and str(guid) in rename_map and rename_map[str(guid)].strip():
+        base = rename_map[str(guid)].strip()
+    else:
+        original = original or f"guid_{guid}"
+        idx = 1 if index is None else int(index)
+        try:
+            base = template.format(original=original, guid=guid, index=idx)
+        except Exception:
+            base = f"{original}_{guid}"
+
+    return sanitize_filename(base)
+
+
+def find_existing_files_for_guid(download_dir: str, guid: int) -> list[str]:
+    """
+    Find downloaded files likely belonging to this GUID.
+    Matches:
+      - guid_<guid>.<ext>
+      - *_<guid>.<ext>
+      - *_guid<guid>.<ext>
+    """
+    patterns = [
+        os.path.join(download_dir, f"guid_{guid}.*"),
+        os.path.join(download_dir, f"*_{guid}.*"),
+        os.path.join(download_dir, f"*guid{guid}.*"),
+    ]
+    out = []
+    for p in patterns:
+        out.extend(glob.glob(p))
+    return sorted(set(out))
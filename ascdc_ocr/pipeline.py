@@ -0,0 +1,232 @@
+"""
+Streaming upload -> poll -> download pipeline.
+"""
+import json
+import queue
+import random
+import threading
+import time
+
+from .config import DOWNLOAD_DIR, RESULT_NAME_TEMPLATE
+from .models import File
+from .poller import QueuePoller
+from .upload import ConcurrentUploader
+from .ratelimit import TokenBucket
+
+
+class OCRPipeline:
+    """
+    Run upload, OCR polling and download as overlapping stages instead of strict phases.
+    Each file is handed to the QueuePoller as soon as its upload finishes, and each GUID is
+    downloaded as soon as its queue completes. Stages are connected by bounded queues,
+    so memory stays flat however long the input is.
+
+    A result that is not ready yet is retried with backoff instead of fixed sleeps.
+    """
+    _DONE = object()
+
+    def __init__(self, client, bookid, upload_workers=4, upload_rate_limit=2.0,
+                 download_workers=4, download_rate_limit=4.0, queue_size=100,
+                 download=True, rename_map=None, download_retries=5, download_retry_delay=5.0,
+                 poll_kwargs=None, file_kwargs=None, ledger=None, content_index=None,
+                 download_dir=DOWNLOAD_DIR, name_template=RESULT_NAME_TEMPLATE, writer=None):
+        self.client = client
+        self.bookid = bookid
+        self.upload_workers = max(1, int(upload_workers))
+        self.download_workers = max(1, int(download_workers))
+        self.queue_size = max(1, int(queue_size))
+        self.download = download
+        self.rename_map = rename_map
+        self.download_dir = download_dir
+        self.name_template = name_template
+        self.writer = writer  # ResultWriter; None writes each result on the download thread
+        self.download_retries = int(download_retries)
+        self.download_retry_delay = float(download_retry_delay)
+        self.file_kwargs = file_kwargs or {}
+        self.ledger = ledger
+        self.content_index = content_index
+        self.uploader = ConcurrentUploader(client, workers=self.upload_workers, rate_limit=upload_rate_limit,
+                                           on_result=ledger.record_upload_result if ledger else None)
+        self.download_limiter = TokenBucket(download_rate_limit)
+        self.poller = QueuePoller(client, on_complete=self._queue_done, on_error=self._queue_failed, **(poll_kwargs or {}))
+
+        self.uploaded = []          # File objects with a queue_id
+        self.failed_uploads = []    # upload result dicts
+        self.guids = []             # every resolved GUID
+        self.saved = []             # guid ints saved to download_dir
+        self.failed_downloads = {}  # guid -> message
+        self.first_result_after = None
+        self._in_flight = {}  # content key -> identical files waiting on the first upload
+        self._lock = threading.Lock()
+        self._upload_q = None
+        self._download_q = None
+        self._started = None
+
+    # --- stage 1: upload ---
+    def _upload_worker(self):
+        while True:
+            item = self._upload_q.get()
+            if item is self._DONE:
+                return
+            file = item if isinstance(item, File) else File(self.client, self.bookid, item, **self.file_kwargs)
+            if file.queue_id is not None:
+                # resumed: already uploaded, only needs polling
+                self.poller.add(file, delay=0)
+                continue
+            if self.content_index and self._deduplicate(file):
+                continue
+            result = self.uploader.upload_one(file)
+            with self._lock:
+                if result["ok"]:
+                    self.uploaded.append(file)
+                else:
+                    self.failed_uploads.append(result)
+            if result["ok"]:
+                self.poller.add(file)
+            else:
+                self._release_duplicates(file, result["error"])
+
+    def _deduplicate(self, file):
+        """
+        True if the file needs no upload: either its content was OCR'd before, or an identical
+        file from this batch is already in flight (it then gets that file's GUIDs when it finishes).
+        """
+        key = self.content_index.key(file)  # hashes the file: outside the lock
+        with self._lock:
+            if key in self._in_flight:
+                self._in_flight[key].append(file)
+                return True
+            reused = file.reuse_results(self.content_index, key)  # one indexed lookup
+            if not reused:
+                self._in_flight[key] = []
+        if reused:
+            self._queue_done(file)
+        return reused
+
+    def _release_duplicates(self, file, error=None):
+        if not self.content_index:
+            return
+        key = self.content_index.key(file)  # memoized by the upload: one stat
+        if error is None:
+            self.content_index.record(file, key)  # before the claim is released, so no second upload
+        with self._lock:
+            followers = self._in_flight.pop(key, [])
+        for follower in followers:
+            if error is None:
+                follower.adopt_guids(file)
+                self._queue_done(follower)
+            elif self.ledger:
+                self.ledger.record_queue_failed(follower, f"identical file failed: {error}")
+
+    # --- stage 2: poll (runs on the poller's thread) ---
+    def _queue_done(self, file):
+        if self.ledger:
+            self.ledger.record_guids(file)
+        self._release_duplicates(file)
+        with self._lock:
+            self.guids.extend(file.guids)
+        if self.download:
+            for guid in file.guids:
+                if guid.copy_of is None:  # copies are written with the GUID they copy
+                    self._download_q.put(guid)  # blocks when downloaders fall behind
+
+    def _queue_failed(self, file, message):
+        if self.ledger:
+            self.ledger.record_queue_failed(file, message)
+        self._release_duplicates(file, message)
+
+    # --- stage 3: download ---
+    def _save_with_retry(self, guid):
+        delay = self.download_retry_delay
+        cache = self.client.result_cache
+        for attempt in range(self.download_retries + 1):
+            if not (cache and cache.contains(guid.guid)):
+                self.client.metrics.sleep("download_rate_limit", self.download_limiter.acquire(), guid=guid.guid)
+            try:
+                guid.save_results(rename_map=self.rename_map, download_dir=self.download_dir,
+                                  template=self.name_template, writer=self.writer, done=self._saved)
+                return None
+            except Exception as e:
+                if attempt == self.download_retries:
+                    return str(e)
+                print(f"GUID {guid.guid} not ready ({e}); retrying in {delay:.0f}s")
+                pause = delay * random.uniform(0.8, 1.2)
+                time.sleep(pause)
+                self.client.metrics.sleep("download_retry", pause, guid=guid.guid)
+                delay *= 2
+
+    def _saved(self, guid, error):
+        """
+        Called once the results of a GUID are on disk (or could not be written).
+        """
+        if error is None and self.ledger:
+            self.ledger.record_saved(guid)
+        with self._lock:
+            if error is None:
+                self.saved.append(guid.guid)
+                if self.first_result_after is None:
+                    self.first_result_after = time.monotonic() - self._started
+            else:
+                self.failed_downloads[guid.guid] = str(error)
+
+    def _download_worker(self):
+        while True:
+            guid = self._download_q.get()
+            if guid is self._DONE:
+                return
+            error = self._save_with_retry(guid)
+            if error is not None:
+                with self._lock:
+                    self.failed_downloads[guid.guid] = error
+                print(f"❌ Download failed: GUID {guid.guid} ({error})")
+
+    def _feed_downloads(self, guids):
+        for guid in guids:
+            self._download_q.put(guid)
+
+    def run(self, items, guids=()):
+        """
+        items: file paths (or ready-made File objects; those with a queue_id skip the upload).
+        guids: GUID objects that only need downloading (e.g. from JobLedger.plan_resume).
+        Returns a summary dict.
+        """
+        self._started = time.monotonic()
+        self._upload_q = queue.Queue(maxsize=self.queue_size)
+        self._download_q = queue.Queue(maxsize=self.queue_size)
+
+        uploaders = [threading.Thread(target=self._upload_worker, daemon=True) for _ in range(self.upload_workers)]
+        downloaders = [threading.Thread(target=self._download_worker, daemon=True) for _ in range(self.download_workers)]
+        poll_thread = threading.Thread(target=self.poller.run, daemon=True)
+        feeder = threading.Thread(target=self._feed_downloads, args=(list(guids) if self.download else [],), daemon=True)
+        for t in uploaders + downloaders + [poll_thread, feeder]:
+            t.start()
+
+        for item in items:
+            self._upload_q.put(item)
+        for _ in uploaders:
+            self._upload_q.put(self._DONE)
+        for t in uploaders:
+            t.join()
+
+        self.poller.close()
+        poll_thread.join()
+        feeder.join()
+        for _ in downloaders:
+            self._download_q.put(self._DONE)
+        for t in downloaders:
+            t.join()
+        if self.writer:
+            self.writer.flush()
+
+        summary = {
+            "uploaded": len(self.uploaded),
+            "failed_uploads": len(self.failed_uploads),
+            "failed_queues": len(self.poller.errors),
+            "guids": len(self.guids),
+            "saved": len(self.saved),
+            "failed_downloads": len(self.failed_downloads),
+            "first_result_after": self.first_result_after,
+            "elapsed": time.monotonic() - self._started,
+        }
+        print(f"Pipeline finished: {json.dumps(summary)}")
+        return summary
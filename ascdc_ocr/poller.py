@@ -0,0 +1,133 @@
+"""
+Multiplexed queue polling.
+"""
+import heapq
+import itertools
+import os
+import random
+import threading
+import time
+
+from .ratelimit import TokenBucket
+
+
+class QueuePoller:
+    """
+    Track every outstanding queue_id in one scheduler.
+    Each queue is re-checked with its own exponential backoff (initial_delay -> max_delay, with jitter)
+    and all status requests share one global rate limit. A queue resolves to its GUID list
+    (File.guids) as soon as the server reports status 200.
+
+    add() and close() are thread-safe, so files can be fed in while run() is polling.
+    """
+    def __init__(self, client, initial_delay=5.0, max_delay=60.0, factor=1.5, rate_limit=2.0,
+                 max_errors=3, on_complete=None, on_error=None):
+        self.client = client
+        self.initial_delay = float(initial_delay)
+        self.max_delay = float(max_delay)
+        self.factor = float(factor)
+        self.max_errors = int(max_errors)
+        self.limiter = TokenBucket(rate_limit)
+        self.on_complete = on_complete
+        self.on_error = on_error
+        self.results = {}  # queue_id -> [GUID, ...]
+        self.errors = {}   # queue_id -> message
+        self._heap = []    # (due, seq, entry)
+        self._seq = itertools.count()
+        self._cond = threading.Condition()
+        self._closed = False
+
+    def add(self, file, delay=None):
+        entry = {"file": file, "delay": self.initial_delay, "errors": 0, "checks": 0, "added": time.monotonic()}
+        self._schedule(entry, self.initial_delay if delay is None else delay)
+
+    def close(self):
+        """
+        No more files will be added; run() returns once every pending queue is resolved.
+        """
+        with self._cond:
+            self._closed = True
+            self._cond.notify_all()
+
+    def pending(self):
+        with self._cond:
+            return len(self._heap)
+
+    def _schedule(self, entry, delay):
+        with self._cond:
+            heapq.heappush(self._heap, (time.monotonic() + delay, next(self._seq), entry))
+            self._cond.notify()
+
+    def _next_due(self):
+        with self._cond:
+            while True:
+                if not self._heap:
+                    if self._closed:
+                        return None
+                    self._cond.wait()
+                    continue
+                wait = self._heap[0][0] - time.monotonic()
+                if wait <= 0:
+                    return heapq.heappop(self._heap)[2]
+                self._cond.wait(wait)
+
+    def _backoff(self, entry):
+        delay = entry["delay"]
+        entry["delay"] = min(self.max_delay, delay * self.factor)
+        return delay * random.uniform(0.8, 1.2)
+
+    def _fail(self, entry, message):
+        file = entry["file"]
+        self.errors[file.queue_id] = message
+        print(f"❌ OCR queue failed: {os.path.basename(file.file_name)} (queue {file.queue_id}): {message}")
+        if self.on_error:
+            self.on_error(file, message)
+
+    def _check(self, entry):
+        file = entry["file"]
+        self.client.metrics.sleep("poll_rate_limit", self.limiter.acquire(), queue_id=file.queue_id)
+        entry["checks"] += 1
+        try:
+            data = self.client.check_ocr_queue(file.queue_id)
+        except Exception as e:
+            entry["errors"] += 1
+            if entry["errors"] >= self.max_errors:
+                self._fail(entry, str(e))
+            else:
+                self._schedule(entry, self._backoff(entry))
+            return
+
+        entry["errors"] = 0
+        status = data.get("status")
+        if status == 103:
+            self._schedule(entry, self._backoff(entry))
+        elif status == 200:
+            waited = time.monotonic() - entry["added"]
+            self.client.metrics.observe("ocr_queue_wait_seconds", waited,
+                                        file=os.path.basename(file.file_name), queue_id=file.queue_id,
+                                        checks=entry["checks"], pages=len(data["guids"]))
+            if self.client.concurrency is not None:
+                self.client.concurrency.record_queue(waited, len(data["guids"]))
+            self.results[file.queue_id] = file.resolve_guids(data["guids"])
+            if self.on_complete:
+                self.on_complete(file)
+        else:
+            self._fail(entry, data.get("message") or f"status {status}")
+
+    def run(self):
+        """
+        Poll until close() has been called and nothing is pending. Returns {queue_id: [GUID, ...]}.
+        """
+        while True:
+            entry = self._next_due()
+            if entry is None:
+                return self.results
+            self._check(entry)
+
+    def poll_all(self, files):
+        for file in files:
+            self.add(file)
+        self.close()
+        results = self.run()
+        print(f"OCR finished for {len(results)} queues ({len(self.errors)} failed).")
+        return results
@@ -0,0 +1,113 @@
+"""
+Image pre-optimization (requires Pillow).
+"""
+import hashlib
+import mimetypes
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+try:
+    from PIL import Image  # optional: only needed for image optimization (pip install pillow)
+except ImportError:
+    Image = None
+
+from .dedup import ContentIndex
+
+
+def optimize_image(src, dst, long_edge=None, target_dpi=None, quality=85):
+    """
+    Downscale `src` (to at most `long_edge` pixels and/or `target_dpi`) and re-encode it as a
+    metadata-free JPEG at `dst`. Never upscales. Returns (src, dst, source bytes, output bytes).
+    Module-level so it can run in a process pool.
+    """
+    with Image.open(src) as im:
+        scale = 1.0
+        if long_edge:
+            scale = min(scale, long_edge / max(im.size))
+        dpi = im.info.get("dpi")
+        if target_dpi and dpi and dpi[0]:
+            scale = min(scale, target_dpi / float(dpi[0]))
+
+        if im.mode in ("RGBA", "LA", "P"):
+            im = im.convert("RGBA")
+            background = Image.new("RGB", im.size, "white")
+            background.paste(im, mask=im.getchannel("A"))
+            im = background
+        elif im.mode not in ("RGB", "L"):
+            im = im.convert("RGB")
+
+        if scale < 1.0:
+            size = (max(1, round(im.size[0] * scale)), max(1, round(im.size[1] * scale)))
+            im = im.resize(size, Image.LANCZOS)
+
+        os.makedirs(os.path.dirname(dst), exist_ok=True)
+        tmp = f"{dst}.{os.getpid()}.tmp"
+        # no exif/icc_profile arguments: metadata is dropped
+        im.save(tmp, "JPEG", quality=int(quality), optimize=True)
+    os.replace(tmp, dst)
+    return src, dst, os.path.getsize(src), os.path.getsize(dst)
+
+
+class ImageOptimizer:
+    """
+    Optional stage in front of upload_file: shrinks JPG/PNG scans across all cores and caches the
+    outputs under cache_dir by source hash + settings, so they are only built once.
+    The optimized file keeps the original stem (so FILENAME_PATTERN and result naming are unchanged)
+    with a .jpg extension. PDFs, ZIPs and images that would not get smaller are uploaded as they are.
+    """
+    IMAGE_TYPES = {'image/jpeg', 'image/png'}
+
+    def __init__(self, cache_dir="optimized", long_edge=3000, target_dpi=None, quality=85, workers=None,
+                 content_index=None):
+        if Image is None:
+            raise RuntimeError("Image optimization requires Pillow: pip install pillow")
+        self.cache_dir = cache_dir
+        self.long_edge = long_edge
+        self.target_dpi = target_dpi
+        self.quality = quality
+        self.workers = workers or os.cpu_count() or 1
+        self.content_index = content_index
+
+    def _output_path(self, path):
+        source_hash = self.content_index.file_hash(path) if self.content_index else ContentIndex.hash_file(path)
+        settings = f"{source_hash}:{self.long_edge}:{self.target_dpi}:{self.quality}"
+        key = hashlib.sha256(settings.encode("utf-8")).hexdigest()[:16]
+        stem = os.path.splitext(os.path.basename(path))[0]
+        return os.path.join(self.cache_dir, key, f"{stem}.jpg")
+
+    def optimize_all(self, paths):
+        """
+        Returns the list of paths to upload, in input order (optimized copy or the original).
+        """
+        paths = list(paths)
+        out = list(paths)
+        todo = []
+        for i, path in enumerate(paths):
+            if mimetypes.guess_type(path)[0] not in self.IMAGE_TYPES:
+                continue
+            dst = self._output_path(path)
+            if os.path.exists(dst):
+                out[i] = dst
+            else:
+                todo.append((i, path, dst))
+
+        if todo:
+            with ProcessPoolExecutor(max_workers=self.workers) as pool:
+                futures = [
+                    (i, pool.submit(optimize_image, path, dst, self.long_edge, self.target_dpi, self.quality))
+                    for i, path, dst in todo
+                ]
+                for i, future in futures:
+                    try:
+                        out[i] = future.result()[1]
+                    except Exception as e:
+                        print(f"⚠️ Could not optimize {paths[i]} ({e}); uploading the original.")
+
+        before = after = 0
+        for i, path in enumerate(paths):
+            if out[i] != path and os.path.getsize(out[i]) >= os.path.getsize(path):
+                out[i] = path
+            before += os.path.getsize(path)
+            after += os.path.getsize(out[i])
+        print(f"Image optimization: {len(todo)} built, {before / 1024**2:.1f} MB -> {after / 1024**2:.1f} MB to upload.")
+        return out
@@ -0,0 +1,230 @@
+"""
+Bulk rename of already-downloaded results: one directory scan, an in-memory plan, one journaled pass.
+"""
+import json
+import os
+import re
+import time
+
+from .config import RESULT_NAME_TEMPLATE
+from .naming import render_result_basename
+
+# "<anything>guid<n>", "guid_<n>", optionally followed by the "_<k>" that ensure_unique_path adds
+_GUID_NAME_RE = re.compile(r"guid_?(\d+)(?:_\d{1,3})?$")
+# "<anything>_<n>": n is only a candidate GUID, taken if the ledger's name for that GUID matches
+_SUFFIX_NAME_RE = re.compile(r"_(\d+)(?:_\d{1,3})?$")
+# the "_<k>" ensure_unique_path adds
+_UNIQUE_SUFFIX_RE = re.compile(r"_\d{1,3}$")
+
+JOURNAL_PREFIX = ".rename-journal-"
+
+
+def _split_ext(name):
+    """
+    os.path.splitext that keeps compressed JSON suffixes whole: "a.json.gz" -> ("a", ".json.gz").
+    """
+    stem, ext = os.path.splitext(name)
+    if ext.lower() in (".gz", ".zst"):
+        inner_stem, inner_ext = os.path.splitext(stem)
+        if inner_ext.lower() == ".json":
+            return inner_stem, inner_ext + ext
+    return stem, ext
+
+
+class BulkRenamer:
+    """
+    Rename the result files of many GUIDs in download_dir to their current names
+    (rename_map first, then the name template), without per-GUID glob scans.
+
+    - index(): one os.scandir pass, guid -> [file names]. A name belongs to a GUID if it has the
+      guid_<n> / *guid<n> form, or if it is (up to the _1, _2 ... suffixes of ensure_unique_path)
+      the GUID's rename_map name, the target of an earlier rename in a journal, or the name the
+      template gives the GUID the ledger knows. Other numbers in names are never taken for GUIDs.
+    - plan(guids): every rename decided in memory; names already taken on disk or by an earlier
+      rename get the same _1, _2 ... suffixes as ensure_unique_path
+    - apply(plan): the whole plan is written to a journal file first, then applied in one pass;
+      rollback(journal) undoes a finished or interrupted run
+
+    Files that already have their target name (or a _k variant of it) are left alone, so running
+    it again is a no-op.
+    """
+    def __init__(self, download_dir, rename_map=None, template=RESULT_NAME_TEMPLATE, ledger=None):
+        self.download_dir = download_dir
+        self.rename_map = rename_map or {}
+        self.template = template
+        self.ledger = ledger
+        self._names = None
+        self._by_guid = None
+        self._planned = {}  # src -> guid of the last plan, recorded in the journal
+
+    @staticmethod
+    def _key(name):
+        return os.path.normcase(name)
+
+    def index(self):
+        """
+        Scan download_dir once. Returns {guid: [file names]}.
+        """
+        names, by_guid, candidates = set(), {}, {}
+        if os.path.isdir(self.download_dir):
+            vouched = self._vouched_names()
+            with os.scandir(self.download_dir) as entries:
+                for entry in entries:
+                    if entry.name.startswith(".") or not entry.is_file():
+                        continue
+                    names.add(self._key(entry.name))
+                    stem = _split_ext(entry.name)[0]
+                    match = _GUID_NAME_RE.search(stem)
+                    if match:
+                        guid = int(match.group(1))
+                    else:
+                        guid = vouched.get(self._key(stem), vouched.get(self._key(_UNIQUE_SUFFIX_RE.sub("", stem))))
+                    if guid is not None:
+                        by_guid.setdefault(guid, []).append(entry.name)
+                    elif self.ledger and _SUFFIX_NAME_RE.search(stem):
+                        candidates.setdefault(int(_SUFFIX_NAME_RE.search(stem).group(1)), []).append(entry.name)
+        if candidates:
+            for guid in self.ledger.known_guids(None, candidates):
+                base = self._key(render_result_basename(self.template, guid=guid.guid,
+                                                        original=guid.original_filename, index=guid.index))
+                for name in candidates[guid.guid]:
+                    stem = self._key(_split_ext(name)[0])
+                    if stem == base or _UNIQUE_SUFFIX_RE.sub("", stem) == base:
+                        by_guid.setdefault(guid.guid, []).append(name)
+        self._names, self._by_guid = names, by_guid
+        return by_guid
+
+    def _vouched_names(self):
+        """
+        {name stem: guid} for the names rename_map gives, and the targets of journaled renames.
+        """
+        vouched = {}
+        with os.scandir(self.download_dir) as entries:
+            journals = sorted(e.path for e in entries if e.name.startswith(JOURNAL_PREFIX) and e.name.endswith(".jsonl"))
+        for path in journals:
+            with open(path, "r", encoding="utf-8") as f:
+                for line in f:
+                    try:
+                        entry = json.loads(line)
+                    except ValueError:
+                        continue  # torn last line of an interrupted run
+                    if "dst" not in entry:
+                        continue
+                    guid = entry.get("guid")
+                    if guid is None:  # journals written before the GUID was recorded
+                        match = _GUID_NAME_RE.search(_split_ext(entry["src"])[0])
+                        guid = match.group(1) if match else None
+                    if guid is not None:
+                        vouched[self._key(_split_ext(entry["dst"])[0])] = int(guid)
+        for guid, name in self.rename_map.items():
+            if name.strip() and guid.isdigit():
+                vouched[self._key(render_result_basename(self.template, guid=int(guid),
+                                                         rename_map=self.rename_map))] = int(guid)
+        return vouched
+
+    def _unique(self, name, taken):
+        if self._key(name) not in taken:
+            return name
+        root, ext = _split_ext(name)
+        k = 1
+        while self._key(f"{root}_{k}{ext}") in taken:
+            k += 1
+        return f"{root}_{k}{ext}"
+
+    def plan(self, guids):
+        """
+        Decide every rename for the given GUID objects. Returns a list of (src, dst) file names.
+        """
+        if self._by_guid is None:
+            self.index()
+        taken = set(self._names)  # files being moved keep their names reserved, so no rename chains
+        renames = []
+        for guid in guids:
+            files = self._by_guid.get(guid.guid)
+            if not files:
+                continue
+            base = render_result_basename(self.template, guid=guid.guid, original=guid.original_filename,
+                                          index=guid.index, rename_map=self.rename_map)
+            already_named = re.compile(rf"{re.escape(base)}(?:_\d+)?")
+            for src in sorted(files):
+                stem, src_ext = _split_ext(src)
+                ext = src_ext.lower()
+                if ext == src_ext and already_named.fullmatch(stem):
+                    continue  # target name, or a _k variant of it from an earlier collision
+                dst = self._unique(f"{base}{ext}", taken)
+                taken.add(self._key(dst))
+                renames.append((src, dst))
+                self._planned[src] = guid.guid
+        return renames
+
+    def apply(self, renames, journal_path=None):
+        """
+        Write the journal (fsynced), then rename. Returns the journal path.
+        """
+        if not renames:
+            print("[rename] Nothing to rename.")
+            return None
+        journal_path = journal_path or os.path.join(
+            self.download_dir, f"{JOURNAL_PREFIX}{time.strftime('%Y%m%d-%H%M%S')}-{os.getpid()}.jsonl")
+        with open(journal_path, "w", encoding="utf-8") as journal:
+            journal.write(json.dumps({"dir": os.path.abspath(self.download_dir), "count": len(renames)}) + "\n")
+            for src, dst in renames:
+                entry = {"src": src, "dst": dst}
+                if src in self._planned:
+                    entry["guid"] = self._planned[src]
+                journal.write(json.dumps(entry, ensure_ascii=False) + "\n")
+            journal.flush()
+            os.fsync(journal.fileno())
+
+        done = 0
+        for src, dst in renames:
+            os.rename(os.path.join(self.download_dir, src), os.path.join(self.download_dir, dst))
+            done += 1
+        with open(journal_path, "a", encoding="utf-8") as journal:
+            journal.write(json.dumps({"committed": done}) + "\n")
+        print(f"[rename] {done} files renamed. Undo with: python -m ascdc_ocr rename --rollback {journal_path}")
+        return journal_path
+
+    def run(self, guids, dry_run=False):
+        renames = self.plan(guids)
+        if dry_run:
+            for src, dst in renames:
+                print(f"[dry-run] {src} -> {dst}")
+            print(f"[dry-run] {len(renames)} files would be renamed.")
+            return renames
+        self.apply(renames)
+        return renames
+
+
+def latest_journal(download_dir):
+    """
+    The most recent rename journal in download_dir, or None.
+    """
+    if not os.path.isdir(download_dir):
+        return None
+    with os.scandir(download_dir) as entries:
+        journals = sorted(e.name for e in entries if e.name.startswith(JOURNAL_PREFIX) and e.name.endswith(".jsonl"))
+    return os.path.join(download_dir, journals[-1]) if journals else None
+
+
+def rollback_renames(journal_path):
+    """
+    Undo the renames recorded in a journal, newest first. Renames that never happened (an
+    interrupted run) and files changed since are skipped. Returns the number of files restored.
+    """
+    with open(journal_path, "r", encoding="utf-8") as f:
+        header = json.loads(f.readline())
+        entries = [json.loads(line) for line in f if line.strip()]
+    directory = header["dir"]
+    restored = 0
+    for entry in reversed(entries):
+        if "src" not in entry:
+            continue
+        src = os.path.join(directory, entry["src"])
+        dst = os.path.join(directory, entry["dst"])
+        if os.path.exists(dst) and not os.path.exists(src):
+            os.rename(dst, src)
+            restored += 1
+    os.replace(journal_path, journal_path + ".rolledback")
+    print(f"[rename] Rolled back {restored} of {sum(1 for e in entries if 'src' in e)} renames from {journal_path}")
+    return restored
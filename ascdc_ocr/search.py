@@ -0,0 +1,393 @@
+"""
+Full-text search over downloaded results: an inverted index of character bigrams, kept in
+memory-mapped segment files that are added as results are saved.
+"""
+import array
+import bisect
+import math
+import os
+import re
+import threading
+
+from .columnar import _ArrayFile, _Spill, _write_columns
+
+SEGMENT_MAGIC = b"OCRIDX01"
+_SEGMENT_NAME = re.compile(r"seg-(\d{6})\.idx$")
+_UNIGRAM = 0x1FFFFF  # above every code point, so "a" alone never collides with a bigram "a?"
+
+BOX_COLUMNS = ("box_x", "box_y", "box_w", "box_h", "box_len")
+
+
+def _term(a, b=None):
+    return ord(a) << 21 | (ord(b) if b is not None else _UNIGRAM)
+
+
+def _line_terms(text):
+    terms = {_term(c) for c in text}
+    terms.update(_term(a, b) for a, b in zip(text, text[1:]))
+    return terms
+
+
+def _result_lines(result):
+    """
+    [(line_id, text, [(x, y, width, height, characters)])] of a get_result payload, one per line_id run.
+    """
+    lines, texts, boxes, last = [], [], [], None
+    for entry in result:
+        line_id = entry.get("line_id", -1)
+        if texts and line_id != last:
+            lines.append((last, "".join(texts), boxes))
+            texts, boxes = [], []
+        text = entry.get("text", "")
+        texts.append(text)
+        boxes.append((entry.get("x", 0), entry.get("y", 0), entry.get("width", 0), entry.get("height", 0), len(text)))
+        last = line_id
+    if texts:
+        lines.append((last, "".join(texts), boxes))
+    return lines
+
+
+class _SegmentBuilder:
+    """
+    Pages added since the last commit, held as arrays until they are written as one segment.
+    """
+    def __init__(self):
+        self.page_guid = array.array("q")
+        self.page_index = array.array("i")
+        self.page_line_start = array.array("q", [0])
+        self.originals = []
+        self.line_id = array.array("i")
+        self.texts = []
+        self.line_box_start = array.array("q", [0])
+        self.boxes = {name: array.array("i") for name in BOX_COLUMNS}
+        self.postings = {}  # term -> array of line numbers, ascending
+
+    def __len__(self):
+        return len(self.page_guid)
+
+    @property
+    def lines(self):
+        return len(self.texts)
+
+    def add_page(self, guid, original, index, lines):
+        self.page_guid.append(int(guid))
+        self.page_index.append(int(index) if index is not None else -1)
+        self.originals.append(original or "")
+        postings = self.postings
+        for line_id, text, boxes in lines:
+            line = len(self.texts)
+            self.line_id.append(int(line_id))
+            self.texts.append(text)
+            for box in boxes:
+                for name, value in zip(BOX_COLUMNS, box):
+                    self.boxes[name].append(int(value))
+            self.line_box_start.append(len(self.boxes["box_len"]))
+            for term in _line_terms(text):
+                posting = postings.get(term)
+                if posting is None:
+                    posting = postings[term] = array.array("I")
+                posting.append(line)
+        self.page_line_start.append(len(self.texts))
+
+    def write(self, path):
+        directory = os.path.dirname(path)
+        spills = {}
+
+        def column(name, typecode, values):
+            spills[name] = _Spill(directory, typecode)
+            spills[name].extend(values)
+
+        def strings(name, values):
+            encoded = [value.encode("utf-8") for value in values]
+            offsets, total = [0], 0
+            for data in encoded:
+                total += len(data)
+                offsets.append(total)
+            column(name, "B", b"".join(encoded))
+            column(f"{name}_offsets", "q", offsets)
+
+        column("page_guid", "q", self.page_guid)
+        column("page_index", "i", self.page_index)
+        column("page_line_start", "q", self.page_line_start)
+        strings("page_original", self.originals)
+        column("line_id", "i", self.line_id)
+        strings("text", self.texts)
+        column("line_box_start", "q", self.line_box_start)
+        for name in BOX_COLUMNS:
+            column(name, "i", self.boxes[name])
+        terms = sorted(self.postings)
+        starts, postings = array.array("q", [0]), array.array("I")
+        for term in terms:
+            postings.extend(self.postings[term])
+            starts.append(len(postings))
+        column("term", "q", terms)
+        column("term_start", "q", starts)
+        column("posting", "I", postings)
+        _write_columns(path, spills, {"pages": len(self), "lines": self.lines, "terms": len(terms)}, SEGMENT_MAGIC)
+
+
+class _Segment(_ArrayFile):
+    MAGIC = SEGMENT_MAGIC
+    KIND = "search index segment"
+
+    def __init__(self, path, number):
+        super().__init__(path)
+        self.number = number
+
+    def guids(self):
+        return self.column("page_guid").tolist()
+
+    def postings(self, term):
+        terms = self.column("term")
+        i = bisect.bisect_left(terms, term)
+        if i == len(terms) or terms[i] != term:
+            return None
+        starts = self.column("term_start")
+        return self.column("posting")[starts[i]:starts[i + 1]]
+
+    def page_of_line(self, line):
+        return bisect.bisect_right(self.column("page_line_start"), line) - 1
+
+    def line_text(self, line):
+        return self._strings("text", line, line + 1)[0]
+
+    def page_lines(self, page):
+        """
+        The lines of a page as (line_id, text, boxes), e.g. to copy them into a merged segment.
+        """
+        starts, box_starts = self.column("page_line_start"), self.column("line_box_start")
+        first, last = starts[page], starts[page + 1]
+        texts = self._strings("text", first, last)
+        columns = [self.column(name) for name in BOX_COLUMNS]
+        lines = []
+        for line, text in zip(range(first, last), texts):
+            rows = range(box_starts[line], box_starts[line + 1])
+            lines.append((self.column("line_id")[line], text, [tuple(c[row] for c in columns) for row in rows]))
+        return lines
+
+    def page_info(self, page):
+        index = self.column("page_index")[page]
+        return (self.column("page_guid")[page], self._strings("page_original", page, page + 1)[0] or None,
+                index if index >= 0 else None)
+
+    def bbox(self, line, offset, length):
+        """
+        [x0, y0, x1, y1] around the boxes holding characters offset..offset+length-1 of the line.
+        """
+        box_starts = self.column("line_box_start")
+        xs, ys, ws, hs, lens = (self.column(name) for name in BOX_COLUMNS)
+        x0 = y0 = x1 = y1 = None
+        position = 0
+        for row in range(box_starts[line], box_starts[line + 1]):
+            end = position + lens[row]
+            if end > offset and position < offset + length:
+                x0 = xs[row] if x0 is None else min(x0, xs[row])
+                y0 = ys[row] if y0 is None else min(y0, ys[row])
+                x1 = xs[row] + ws[row] if x1 is None else max(x1, xs[row] + ws[row])
+                y1 = ys[row] + hs[row] if y1 is None else max(y1, ys[row] + hs[row])
+            position = end
+        return [x0, y0, x1, y1] if x0 is not None else None
+
+
+def _contains(posting, line):
+    i = bisect.bisect_left(posting, line)
+    return i < len(posting) and posting[i] == line
+
+
+class SearchIndex:
+    """
+    Inverted index of the text of saved results, stored in index_dir as segment files
+    (seg-000001.idx, ...). Each line of a page (a run of boxes with one line_id) is a document,
+    indexed by its characters and character bigrams, so CJK text needs no word segmentation.
+    A query is looked up by its bigrams and then checked against the line text, and every hit
+    maps back to the GUID, original file name, line_id and the bounding box of the match.
+
+    add() buffers pages; commit() writes them as a new segment (also done every segment_lines
+    lines and on close). Segments are memory-mapped, so opening the index and answering a query
+    read only the pages of the files they touch. A GUID added again replaces its earlier text.
+
+    Segments are tiered by size (a factor of merge_factor lines per tier): once the newest
+    merge_factor segments are in the same tier, commit() merges them into one, so frequent small
+    commits (one per download flush) leave O(log n) segments. optimize() merges all segments
+    into one. Merged segments are closed and deleted once no search() is reading them.
+    """
+    def __init__(self, index_dir="search_index", segment_lines=200_000, merge_factor=10):
+        self.index_dir = index_dir
+        self.segment_lines = segment_lines
+        self.merge_factor = max(2, int(merge_factor))
+        self._lock = threading.RLock()
+        self._segments = []
+        self._live = {}  # guid -> number of the segment with its current text
+        self._live_shared = False  # a search() holds self._live: copy it before changing it
+        self._builder = _SegmentBuilder()
+        self._pending = set()
+        self._readers = 0   # search() calls reading segments outside the lock
+        self._retired = []  # segments replaced by a merge, deleted once there are no readers
+        os.makedirs(index_dir, exist_ok=True)
+        for name in sorted(os.listdir(index_dir)):
+            match = _SEGMENT_NAME.match(name)
+            if match:
+                self._open_segment(os.path.join(index_dir, name), int(match.group(1)))
+
+    def _open_segment(self, path, number):
+        segment = _Segment(path, number)
+        self._segments.append(segment)
+        if self._live_shared:
+            self._live, self._live_shared = dict(self._live), False
+        for guid in segment.guids():
+            self._live[guid] = number
+        return segment
+
+    def __contains__(self, guid):
+        return int(guid) in self._live or int(guid) in self._pending
+
+    def __len__(self):
+        return len(self._live.keys() | self._pending)
+
+    def add(self, guid, result, original=None, index=None):
+        """
+        Index the result (a get_result payload) of one GUID. Searchable after the next commit().
+        """
+        lines = _result_lines(result)
+        with self._lock:
+            if int(guid) in self._pending:
+                self.commit()  # so the newer text ends up in a newer segment
+            self._builder.add_page(guid, original, index, lines)
+            self._pending.add(int(guid))
+            if self._builder.lines >= self.segment_lines:
+                self.commit()
+
+    def commit(self):
+        """
+        Write the buffered pages as a new segment, then merge the newest segments if merge_factor
+        of them are in the same tier. Returns the path written (None if nothing was buffered).
+        """
+        with self._lock:
+            path = self._write_segment()
+            if path is not None:
+                print(f"[search] Indexed {self._segments[-1].header['pages']} pages into {path}")
+                while len(self._segments) >= self.merge_factor:
+                    tail = self._segments[-self.merge_factor:]
+                    if len({self._tier(segment) for segment in tail}) != 1:
+                        break
+                    self._merge(tail)
+            return path
+
+    def _write_segment(self):
+        if not len(self._builder):
+            return None
+        number = self._segments[-1].number + 1 if self._segments else 1
+        path = os.path.join(self.index_dir, f"seg-{number:06d}.idx")
+        self._builder.write(path)
+        self._builder = _SegmentBuilder()
+        self._pending = set()
+        self._open_segment(path, number)
+        return path
+
+    def _tier(self, segment):
+        return int(math.log(max(1, segment.header["lines"]), self.merge_factor))
+
+    def _merge(self, segments):
+        """
+        Replace `segments` (the newest ones, the builder empty) by one segment with their live pages.
+        """
+        for segment in segments:
+            for page in range(segment.header["pages"]):
+                guid, original, index = segment.page_info(page)
+                if self._live.get(guid) == segment.number:
+                    self._builder.add_page(guid, original, index, segment.page_lines(page))
+        written = self._write_segment()  # numbered after every segment, merged ones included
+        old = set(map(id, segments))
+        self._segments = [segment for segment in self._segments if id(segment) not in old]
+        self._retire(segments)
+        return self._segments[-1] if written else None
+
+    def _retire(self, segments):
+        self._retired.extend(segments)
+        if not self._readers:
+            for segment in self._retired:
+                segment.close()
+                os.remove(segment.path)
+            self._retired = []
+
+    def search(self, query, limit=100):
+        """
+        Lines containing `query`, as dicts with guid, original, index, line_id, text, offset (of the
+        match in the line) and bbox ([x0, y0, x1, y1] of the matching boxes), newest segment first.
+        """
+        query = query.strip()
+        if not query:
+            return []
+        terms = [_term(query)] if len(query) == 1 else sorted({_term(a, b) for a, b in zip(query, query[1:])})
+        with self._lock:
+            segments, live = list(reversed(self._segments)), self._live  # one consistent view
+            self._live_shared = True
+            self._readers += 1
+        try:
+            return self._search(segments, live, query, terms, limit)
+        finally:
+            with self._lock:
+                self._readers -= 1
+                self._retire([])
+
+    def _search(self, segments, live, query, terms, limit):
+        hits = []
+        for segment in segments:
+            postings = [segment.postings(term) for term in terms]
+            if any(p is None for p in postings):
+                continue
+            postings.sort(key=len)
+            first, rest = postings[0], postings[1:]
+            for line in first:
+                if rest and not all(_contains(p, line) for p in rest):
+                    continue
+                text = segment.line_text(line)
+                offset = text.find(query)
+                if offset < 0:
+                    continue  # has every bigram, but not in this order
+                page = segment.page_of_line(line)
+                guid, original, index = segment.page_info(page)
+                if live.get(guid) != segment.number:
+                    continue  # replaced by a newer segment
+                hits.append({
+                    "guid": guid, "original": original, "index": index,
+                    "line_id": segment.column("line_id")[line], "text": text, "offset": offset,
+                    "bbox": segment.bbox(line, offset, len(query)),
+                })
+                if len(hits) >= limit:
+                    return hits
+        return hits
+
+    def optimize(self):
+        """
+        Merge every segment into one, dropping text replaced by newer segments.
+        """
+        with self._lock:
+            self._write_segment()
+            if len(self._segments) < 2:
+                return
+            old = list(self._segments)
+            merged = self._merge(old)
+            print(f"[search] Merged {len(old)} segments into {merged.path if merged else 'nothing'}")
+
+    def clear(self):
+        """
+        Delete every segment (and anything buffered).
+        """
+        with self._lock:
+            self._retire(self._segments)
+            self._segments, self._live, self._live_shared = [], {}, False
+            self._builder, self._pending = _SegmentBuilder(), set()
+
+    def close(self):
+        with self._lock:
+            self.commit()
+            for segment in self._segments:
+                segment.close()
+            self._segments = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
@@ -0,0 +1,142 @@
+"""
+Client-side splitting of large PDFs into page ranges (requires pypdf).
+"""
+import hashlib
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+try:
+    from pypdf import PdfReader, PdfWriter  # optional: only needed for PDF splitting (pip install pypdf)
+except ImportError:
+    PdfReader = PdfWriter = None
+
+from .dedup import ContentIndex
+from .models import File
+
+
+def write_pdf_pages(src, dst, start, stop):
+    """
+    Copy pages start..stop-1 (0-based) of the PDF `src` into a new PDF at `dst`. The source is
+    read through an open file (pypdf would load a whole file given by path), so only the
+    cross-reference table, the page tree and the objects of this range are read.
+    Module-level so it can run in a process pool. Returns dst.
+    """
+    os.makedirs(os.path.dirname(dst), exist_ok=True)
+    tmp = f"{dst}.{os.getpid()}.tmp"
+    with open(src, "rb") as f:
+        reader = PdfReader(f)
+        writer = PdfWriter()
+        for page in range(start, stop):
+            writer.add_page(reader.pages[page])
+        with open(tmp, "wb") as out:
+            writer.write(out)
+    os.replace(tmp, dst)
+    return dst
+
+
+def count_pdf_pages(path):
+    with open(path, "rb") as f:
+        return len(PdfReader(f).pages)
+
+
+class PdfSplitter:
+    """
+    Cut PDFs of more than min_pages pages into chunks of pages_per_chunk pages, uploaded as
+    separate Files to the same book. The server then OCRs the chunks as parallel queues, and the
+    results of the first pages arrive while the rest of the document is still being processed.
+
+    Each chunk File carries the original file (source_name) and the number of pages before it
+    (page_offset), so resolve_guids names its GUIDs after the original PDF with their page number
+    in the whole document: {original} and {index} in RESULT_NAME_TEMPLATE, the ledger and the
+    search index look as if the PDF had been uploaded in one piece.
+
+    Chunks are built across all cores and cached under out_dir by source hash + chunk size
+    (<stem>.p0051-0100.pdf), so re-runs (and resume) reuse the same files.
+    """
+    def __init__(self, out_dir="pdf_chunks", pages_per_chunk=50, min_pages=100, workers=None, content_index=None):
+        if PdfReader is None:
+            raise RuntimeError("PDF splitting requires pypdf: pip install pypdf")
+        self.out_dir = out_dir
+        self.pages_per_chunk = max(1, int(pages_per_chunk))
+        self.min_pages = max(self.pages_per_chunk, int(min_pages))
+        self.workers = workers or os.cpu_count() or 1
+        self.content_index = content_index
+
+    def _chunk_dir(self, path):
+        source_hash = self.content_index.file_hash(path) if self.content_index else ContentIndex.hash_file(path)
+        key = hashlib.sha256(f"{source_hash}:{self.pages_per_chunk}".encode("utf-8")).hexdigest()[:16]
+        return os.path.join(self.out_dir, key)
+
+    def plan(self, path):
+        """
+        [(chunk path, start, stop)] for a PDF to split, or None to upload it as it is.
+        """
+        if not path.lower().endswith(".pdf"):
+            return None
+        try:
+            pages = count_pdf_pages(path)
+        except Exception as e:
+            print(f"⚠️ Could not read {os.path.basename(path)} ({e}); uploading it whole.")
+            return None
+        if pages <= self.min_pages:
+            return None
+        directory, stem = self._chunk_dir(path), os.path.splitext(os.path.basename(path))[0]
+        width = max(4, len(str(pages)))
+        return [
+            (os.path.join(directory, f"{stem}.p{start + 1:0{width}d}-{min(start + self.pages_per_chunk, pages):0{width}d}.pdf"),
+             start, min(start + self.pages_per_chunk, pages))
+            for start in range(0, pages, self.pages_per_chunk)
+        ]
+
+    def split(self, client, bookid, items, **file_kwargs):
+        """
+        Returns upload items in input order: a File per chunk of every large PDF (with source_name
+        and page_offset set, in page order) and the other items (paths or File objects) as they are.
+        """
+        paths = list(items)
+        if int(file_kwargs.get("pages_per_img", 1)) != 1:
+            return paths  # two pages per image would break the GUID -> page mapping
+        plans = {path: self.plan(path) for path in paths if isinstance(path, str)}
+        todo = [(path, chunk) for path, chunks in plans.items() if chunks
+                for chunk in chunks if not os.path.exists(chunk[0])]
+        failed = set()
+        if todo:
+            with ProcessPoolExecutor(max_workers=min(self.workers, len(todo))) as pool:
+                futures = [(path, pool.submit(write_pdf_pages, path, *chunk)) for path, chunk in todo]
+                for path, future in futures:
+                    try:
+                        future.result()
+                    except Exception as e:
+                        if path not in failed:
+                            print(f"⚠️ Could not split {os.path.basename(path)} ({e}); uploading it whole.")
+                        failed.add(path)
+
+        items, split = [], 0
+        for path in paths:
+            chunks = plans.get(path) if isinstance(path, str) else None
+            if not chunks or path in failed:
+                items.append(path)
+                continue
+            for chunk_path, start, _ in chunks:
+                file = File(client, bookid, chunk_path, **file_kwargs)
+                file.source_name = path
+                file.page_offset = start
+                items.append(file)
+            split += 1
+        if split:
+            print(f"PDF splitting: {split} PDFs into {len(items) - (len(paths) - split)} chunks of up to "
+                  f"{self.pages_per_chunk} pages ({len(todo)} built).")
+        return items
+
+    @staticmethod
+    def stitch(files):
+        """
+        Put the chunks of each split PDF back in page order (they may finish in any order),
+        leaving every other File where it is.
+        """
+        files = list(files)
+        slots = [i for i, f in enumerate(files) if f.source_name is not None]
+        ordered = sorted((files[i] for i in slots), key=lambda f: (f.source_name, f.page_offset))
+        for i, file in zip(slots, ordered):
+            files[i] = file
+        return files
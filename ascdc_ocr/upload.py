@@ -0,0 +1,47 @@
+"""
+Concurrent uploads.
+"""
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+from .ratelimit import TokenBucket
+
+
+class ConcurrentUploader:
+    """
+    Upload many File objects at once over the client's shared session.
+    `workers` uploads run in parallel and `rate_limit` caps upload requests per second,
+    which replaces the wait_random pause between sequential uploads.
+    """
+    def __init__(self, client, workers=4, rate_limit=2.0, burst=None, on_result=None):
+        self.client = client
+        self.workers = max(1, int(workers))
+        self.limiter = TokenBucket(rate_limit, burst)
+        self.on_result = on_result
+
+    def upload_one(self, file):
+        self.client.metrics.sleep("upload_rate_limit", self.limiter.acquire(), file=os.path.basename(file.file_name))
+        try:
+            queue_id = file.upload()
+            result = {"file": file, "ok": True, "queue_id": queue_id, "error": None}
+        except Exception as e:
+            print(f"❌ Upload failed: {os.path.basename(file.file_name)} ({e})")
+            result = {"file": file, "ok": False, "queue_id": None, "error": str(e)}
+        if self.on_result:
+            self.on_result(result)
+        return result
+
+    def upload_all(self, files):
+        """
+        Returns one dict per file, in input order:
+          {"file": File, "ok": bool, "queue_id": int or None, "error": str or None}
+        """
+        files = list(files)
+        with ThreadPoolExecutor(max_workers=self.workers) as pool:
+            results = list(pool.map(self.upload_one, files))
+
+        failed = [r for r in results if not r["ok"]]
+        print(f"Uploaded {len(results) - len(failed)}/{len(results)} files.")
+        for r in failed:
+            print(f"  failed: {r['file'].file_name} -> {r['error']}")
+        return results
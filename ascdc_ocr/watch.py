@@ -0,0 +1,269 @@
+"""
+Watch-folder mode: feed files into the run as they land in a folder tree.
+"""
+import os
+import threading
+import time
+
+from .config import LEDGER_FILE
+from .ledger import _SQLiteStore
+
+# A directory modified this recently is listed again: a file added within the same mtime tick
+# as the last listing would not change the directory's mtime.
+_MTIME_SLACK_NS = 2_000_000_000
+
+
+class WatchState(_SQLiteStore):
+    """
+    The watcher's cursor, in the ledger database:
+
+    watched_files: one row per file handed to the run, with the size and mtime it had, status
+                   'queued' (not finished yet), 'done' or 'failed' (given up after max_attempts),
+                   and the number of passes in which the run failed on it
+    watched_dirs:  the mtime of every directory whose files have all been handled, so a restart
+                   skips directories that did not change
+    """
+    _SCHEMA = """
+        CREATE TABLE IF NOT EXISTS watched_files (
+            path       TEXT PRIMARY KEY,
+            size       INTEGER NOT NULL,
+            mtime_ns   INTEGER NOT NULL,
+            status     TEXT NOT NULL,
+            attempts   INTEGER NOT NULL DEFAULT 0,
+            updated_at REAL NOT NULL
+        );
+        CREATE INDEX IF NOT EXISTS watched_files_status ON watched_files (status);
+        CREATE TABLE IF NOT EXISTS watched_dirs (
+            path     TEXT PRIMARY KEY,
+            mtime_ns INTEGER NOT NULL
+        );
+    """
+
+    _COLUMNS = {"watched_files": {"attempts": "INTEGER NOT NULL DEFAULT 0"}}
+
+    def __init__(self, path=LEDGER_FILE, timeout=30.0):
+        super().__init__(path, timeout)
+
+    def file_state(self, path):
+        row = self._conn().execute("SELECT size, mtime_ns, status FROM watched_files WHERE path=?", (path,)).fetchone()
+        return None if row is None else {"size": row[0], "mtime_ns": row[1], "status": row[2]}
+
+    def mark(self, files, status):
+        """
+        files: (path, size, mtime_ns) tuples.
+        """
+        now = time.time()
+        with self._tx() as conn:
+            conn.executemany(
+                "INSERT INTO watched_files (path, size, mtime_ns, status, updated_at) VALUES (?, ?, ?, ?, ?) "
+                "ON CONFLICT (path) DO UPDATE SET size=excluded.size, mtime_ns=excluded.mtime_ns, "
+                "status=excluded.status, attempts=0, updated_at=excluded.updated_at",
+                [(path, size, mtime_ns, status, now) for path, size, mtime_ns in files],
+            )
+
+    def retry(self, files, max_attempts):
+        """
+        Count a failed pass for each of files (path, size, mtime_ns), keeping it queued until it
+        has failed max_attempts times, then parking it as 'failed'. Returns the paths parked.
+        """
+        if not files:
+            return []
+        now = time.time()
+        paths = [path for path, _, _ in files]
+        with self._tx() as conn:
+            conn.executemany(
+                "UPDATE watched_files SET attempts=attempts + 1, updated_at=?, "
+                "status=CASE WHEN attempts + 1 >= ? THEN 'failed' ELSE status END WHERE path=?",
+                [(now, int(max_attempts), path) for path in paths],
+            )
+            parked = conn.execute(
+                f"SELECT path FROM watched_files WHERE status='failed' AND path IN ({','.join('?' * len(paths))})",
+                paths,
+            ).fetchall()
+        return [row[0] for row in parked]
+
+    def queued(self, limit=None):
+        return self._conn().execute(
+            "SELECT path, size, mtime_ns FROM watched_files WHERE status='queued' ORDER BY updated_at, path LIMIT ?",
+            (-1 if limit is None else int(limit),),
+        ).fetchall()
+
+    def dir_mtimes(self, root):
+        prefix = os.path.join(root, "")
+        rows = self._conn().execute(
+            "SELECT path, mtime_ns FROM watched_dirs WHERE path=? OR substr(path, 1, ?)=?",
+            (root, len(prefix), prefix),
+        )
+        return dict(rows)
+
+    def record_dirs(self, dirs):
+        if not dirs:
+            return
+        with self._tx() as conn:
+            conn.executemany(
+                "INSERT INTO watched_dirs (path, mtime_ns) VALUES (?, ?) "
+                "ON CONFLICT (path) DO UPDATE SET mtime_ns=excluded.mtime_ns",
+                dirs.items(),
+            )
+
+
+class FolderWatcher:
+    """
+    Poll a folder tree and hand new files to `handler(paths)` once they are completely written.
+
+    Every `interval` seconds each directory is stat'ed; only directories whose mtime changed are
+    listed again (adding or renaming a file changes it), and only the files still being written
+    are stat'ed on their own. A file counts as written once its size and mtime have not changed
+    for `settle` seconds. Memory holds the directory tree and the files in flight, never the
+    list of files already handled: that is the WatchState in the ledger database, so a restart
+    neither reprocesses files nor lists unchanged directories. A file replaced by a new one
+    (renamed over or re-created, which changes its directory) is handled again; a file rewritten
+    in place is noticed only once something else in its directory changes.
+
+    accept(name) decides which file names to consider. Files are handed over at most batch_size
+    at a time. handler returns the paths it handled (None: all of them); those are marked done,
+    the others stay queued for the next pass until they have failed max_attempts times, then are
+    parked as failed (replacing the file queues it again). If handler raises (e.g. the platform
+    is down), the batch is handed over again next pass without counting an attempt.
+    """
+    def __init__(self, folder, handler, state, accept=None, interval=5.0, settle=10.0, batch_size=50,
+                 max_attempts=3, clock=time.monotonic):
+        self.folder = os.path.abspath(folder)
+        self.handler = handler
+        self.state = state
+        self.accept = accept or (lambda name: True)
+        self.interval = float(interval)
+        self.settle = float(settle)
+        self.batch_size = max(1, int(batch_size))
+        self.max_attempts = max(1, int(max_attempts))
+        self.clock = clock
+        self.handled = 0
+        self._dirs = {}      # dir -> (mtime_ns, [subdirs]) as last listed
+        self._pending = {}   # path -> [size, mtime_ns, unchanged since]
+        self._cursor = None  # dir -> mtime_ns from the state (loaded on the first scan)
+
+    def _list(self, directory, mtime_ns, check_files):
+        subdirs = []
+        try:
+            with os.scandir(directory) as entries:
+                for entry in entries:
+                    if entry.name.startswith("."):
+                        continue
+                    try:
+                        if entry.is_dir(follow_symlinks=False):
+                            subdirs.append(entry.path)
+                        elif check_files and entry.is_file() and self.accept(entry.name):
+                            self._consider(entry.path, entry.stat())
+                    except OSError:
+                        continue  # vanished while listing
+        except OSError:
+            return None
+        self._dirs[directory] = (mtime_ns, subdirs)
+        return subdirs
+
+    def _consider(self, path, stat):
+        if path in self._pending:
+            return
+        known = self.state.file_state(path)
+        if known and known["size"] == stat.st_size and known["mtime_ns"] == stat.st_mtime_ns:
+            return  # done, or queued (picked up from the state)
+        self._pending[path] = [stat.st_size, stat.st_mtime_ns, self.clock()]
+
+    def scan(self):
+        """
+        One pass over the tree. Files that finished writing are marked queued in the state.
+        Returns the number of files queued.
+        """
+        if self._cursor is None:
+            self._cursor = self.state.dir_mtimes(self.folder)
+        listed, visited = {}, set()
+        stack = [self.folder]
+        while stack:
+            directory = stack.pop()
+            visited.add(directory)
+            try:
+                mtime_ns = os.stat(directory).st_mtime_ns
+            except OSError:
+                continue
+            recent = time.time_ns() - mtime_ns < _MTIME_SLACK_NS
+            cached = self._dirs.get(directory)
+            if cached and cached[0] == mtime_ns and not recent:
+                subdirs = cached[1]
+            else:
+                # the cursor says whether the files of a directory not listed yet were all handled before
+                check_files = recent or self._cursor.pop(directory, None) != mtime_ns
+                subdirs = self._list(directory, mtime_ns, check_files)
+                if subdirs is None:
+                    continue
+                if not recent:
+                    listed[directory] = mtime_ns
+            stack.extend(subdirs)
+        for directory in self._dirs.keys() - visited:
+            del self._dirs[directory]  # removed since the last pass
+
+        now = self.clock()
+        ready = []
+        for path, pending in list(self._pending.items()):
+            try:
+                stat = os.stat(path)
+            except OSError:
+                del self._pending[path]  # deleted or moved away before it settled
+                continue
+            if (stat.st_size, stat.st_mtime_ns) != (pending[0], pending[1]):
+                self._pending[path] = [stat.st_size, stat.st_mtime_ns, now]
+            elif stat.st_size > 0 and now - pending[2] >= self.settle:
+                ready.append((path, stat.st_size, stat.st_mtime_ns))
+                del self._pending[path]
+        if ready:
+            self.state.mark(ready, "queued")
+
+        busy = {os.path.dirname(path) for path in self._pending}
+        self.state.record_dirs({d: m for d, m in listed.items() if d not in busy})
+        return len(ready)
+
+    def drain(self):
+        """
+        Hand every file queued at the start of this pass to the handler, batch_size at a time
+        (files failing again wait for the next pass). Returns the number handled.
+        """
+        handled = 0
+        queued = self.state.queued()
+        for start in range(0, len(queued), self.batch_size):
+            batch = queued[start:start + self.batch_size]
+            present = [row for row in batch if os.path.exists(row[0])]
+            done = [row for row in batch if row not in present]  # deleted since: nothing left to do
+            if present:
+                print(f"[watch] {len(present)} new files: {', '.join(os.path.basename(r[0]) for r in present[:5])}"
+                      f"{' ...' if len(present) > 5 else ''}")
+                result = self.handler([row[0] for row in present])
+                ok = None if result is None else set(result)
+                failed = [row for row in present if ok is not None and row[0] not in ok]
+                done += [row for row in present if row not in failed]
+                parked = self.state.retry(failed, self.max_attempts)
+                for path in parked:
+                    print(f"❌ [watch] {os.path.basename(path)} failed {self.max_attempts} times; giving up on it")
+                if len(failed) > len(parked):
+                    print(f"⚠️ [watch] {len(failed) - len(parked)} files failed; retrying them next pass")
+                handled += len(present) - len(failed)
+                self.handled += len(present) - len(failed)
+            self.state.mark(done, "done")
+        return handled
+
+    def run(self, stop=None, once=False):
+        """
+        Scan and hand over files until `stop` (a threading.Event) is set, or one pass with once=True
+        (after waiting for files still being written to settle).
+        """
+        stop = stop or threading.Event()
+        print(f"[watch] Watching {self.folder} (every {self.interval:g}s, files settle after {self.settle:g}s)")
+        while not stop.is_set():
+            try:
+                self.scan()
+                self.drain()
+            except Exception as e:  # e.g. the platform is down: the queued files are retried next pass
+                print(f"❌ [watch] {type(e).__name__}: {e}; retrying in {self.interval:g}s")
+            if once and not self._pending:
+                break
+            stop.wait(self.interval)
+        print(f"[watch] Stopped after {self.handled} files.")
+        return self.handled
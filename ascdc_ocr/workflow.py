@@ -0,0 +1,555 @@
+"""
+The end-to-end run (upload -> OCR -> download / rename) shared by sinica_apitest.py and the CLI.
+Every component is created on first use, so a command only pays for what it touches.
+"""
+import os
+
+from .config import ALLOWED_MIME_TYPES, FILENAME_PATTERN, Settings, guess_mime_type
+
+
+def is_uploadable(name):
+    """
+    Whether a file name has an allowed type and matches FILENAME_PATTERN.
+    """
+    return guess_mime_type(name) in ALLOWED_MIME_TYPES and bool(FILENAME_PATTERN.match(name))
+
+
+def scan_upload_folder(folder):
+    """
+    Uploadable files (allowed type and file name) directly inside `folder`, sorted by name.
+    A missing folder yields an empty list instead of an error.
+    """
+    if not os.path.isdir(folder):
+        print(f"⚠️ Upload folder not found: {folder}")
+        return []
+    with os.scandir(folder) as entries:
+        return sorted(entry.path for entry in entries if entry.is_file() and is_uploadable(entry.name))
+
+
+class Workflow:
+    """
+    One run over a Settings object. The client, result cache, ledger, content index and metrics are
+    built lazily; call close() at the end to write the metrics snapshot.
+    """
+    def __init__(self, settings=None, **overrides):
+        self.settings = settings if settings is not None else Settings()
+        self.settings.update(**overrides)
+        self._client = None
+        self._result_cache = None
+        self._ledger = None
+        self._content_index = None
+        self._metrics = None
+        self._rename_map = None
+        self._book = None
+        self._writer = None
+        self._search_index = None
+        self._concurrency = None
+        self.failed_paths = []  # inputs of the last upload() whose upload or OCR failed
+        self.failed_downloads = {}  # guid -> message, for the last download()
+
+    # --- lazily created components ---
+    @property
+    def metrics(self):
+        if self._metrics is None:
+            from .metrics import Metrics
+            self._metrics = Metrics(self.settings.metrics_trace_file)
+        return self._metrics
+
+    @property
+    def result_cache(self):
+        s = self.settings
+        if self._result_cache is None and s.use_result_cache:
+            from .cache import ResultCache
+            self._result_cache = ResultCache(s.result_cache_dir, s.result_cache_max_bytes)
+        return self._result_cache
+
+    @property
+    def concurrency(self):
+        s = self.settings
+        if self._concurrency is None and s.adaptive_concurrency:
+            from .concurrency import AdaptiveConcurrency
+            self._concurrency = AdaptiveConcurrency(initial=s.adaptive_initial_concurrency,
+                                                    max_limit=s.adaptive_max_concurrency, metrics=self.metrics)
+        return self._concurrency
+
+    def _workers(self, workers):
+        # with the adaptive limit, threads only need to be able to use what it allows
+        s = self.settings
+        return max(workers, s.adaptive_max_concurrency) if s.adaptive_concurrency else workers
+
+    def _rate(self, rate):
+        # the adaptive limit replaces the fixed request rates
+        return 0 if self.settings.adaptive_concurrency else rate
+
+    @property
+    def client(self):
+        if self._client is None:
+            from .client import ASCDCOCRClient
+            s = self.settings
+            self._client = ASCDCOCRClient(
+                s.account, s.password, result_cache=self.result_cache, metrics=self.metrics,
+                pool_size=self._workers(max(s.upload_workers, s.download_workers)) + 2, max_retries=s.max_retries,
+                base_url=s.base_url, token_file=s.token_file, concurrency=self.concurrency,
+            )
+        return self._client
+
+    @property
+    def ledger(self):
+        if self._ledger is None and self.settings.use_ledger:
+            from .ledger import JobLedger
+            self._ledger = JobLedger(self.settings.ledger_file)
+        return self._ledger
+
+    @property
+    def content_index(self):
+        if self._content_index is None and self.settings.deduplicate:
+            from .dedup import ContentIndex
+            self._content_index = ContentIndex(self.settings.ledger_file)
+        return self._content_index
+
+    @property
+    def rename_map(self):
+        if self._rename_map is None:
+            from .naming import load_rename_map
+            self._rename_map = load_rename_map(self.settings.rename_map_file)
+        return self._rename_map
+
+    @property
+    def book(self):
+        if self._book is None:
+            from .models import Book
+            s = self.settings
+            self._book = Book(self.client, title=s.book_title, author=s.book_author, bookid=s.book_id,
+                              cache_file=s.book_cache_file)
+            if s.book_id is None:
+                self.client.wait_random(label="after book")
+        return self._book
+
+    def _book_id(self):
+        """
+        The ID of the run's book: the one in use, book_id, or the cached book of book_title /
+        book_author (without creating it). None when there is no book yet.
+        """
+        from .models import Book
+        s = self.settings
+        if self._book is not None:
+            return self._book.bookid
+        if s.book_id is not None:
+            return int(s.book_id)
+        return Book.cached_id(s.book_title, s.book_author, s.book_cache_file)
+
+    @property
+    def writer(self):
+        """
+        Background ResultWriter for every download of the run. The jsonl layout writes one shard
+        per book (book_<id>, see _book_id), or "results" when there is no book.
+        """
+        if self._writer is None:
+            from .writer import ResultWriter
+            s = self.settings
+            book_id = self._book_id()
+            self._writer = ResultWriter(s.download_dir, fmt=s.result_format, layout=s.result_layout,
+                                        shard=f"book_{book_id}" if book_id is not None else "results",
+                                        queue_size=s.writer_queue_size, fsync=s.result_fsync, metrics=self.metrics,
+                                        search_index=self.search_index if s.search_index else None)
+        return self._writer
+
+    @property
+    def search_index(self):
+        if self._search_index is None:
+            from .search import SearchIndex
+            self._search_index = SearchIndex(self.settings.search_index_dir)
+        return self._search_index
+
+    def _on_ocr_done(self, file):
+        if self.ledger:
+            self.ledger.record_guids(file)
+        if self.content_index:
+            self.content_index.record(file)
+
+    def _poller(self):
+        from .poller import QueuePoller
+        s = self.settings
+        return QueuePoller(self.client, initial_delay=s.poll_initial_delay, max_delay=s.poll_max_delay,
+                           rate_limit=s.poll_rate_limit, on_complete=self._on_ocr_done,
+                           on_error=self.ledger.record_queue_failed if self.ledger else None)
+
+    # --- steps ---
+    def upload(self, paths):
+        """
+        Optimize / batch / deduplicate `paths`, upload them and wait for OCR. Returns the GUID objects
+        still to download (empty in pipeline mode with downloads on: those are saved as they finish).
+        """
+        from .models import File
+        s = self.settings
+        client, ledger, content_index = self.client, self.ledger, self.content_index
+        bookid = self.book.bookid
+        paths = list(paths)
+        self.failed_paths = []
+        if not paths:
+            return []
+
+        inputs = {}  # upload path -> input path (they differ for optimized copies)
+        if s.optimize_images:
+            from .preprocess import ImageOptimizer
+            optimizer = ImageOptimizer(s.optimized_dir, long_edge=s.optimize_long_edge, target_dpi=s.optimize_dpi,
+                                       quality=s.optimize_quality, content_index=content_index)
+            optimized = optimizer.optimize_all(paths)
+            inputs = dict(zip(optimized, paths))
+            paths = optimized
+
+        upload_items = paths
+        if s.zip_batching:
+            from .batching import ZipBatcher
+            batcher = ZipBatcher(s.zip_batch_dir, max_bytes=s.zip_batch_max_bytes, max_files=s.zip_batch_max_files)
+            upload_items = batcher.pack(client, bookid, paths)
+        if s.split_pdfs:
+            from .split import PdfSplitter
+            splitter = PdfSplitter(s.split_pdf_dir, pages_per_chunk=s.split_pdf_pages,
+                                   min_pages=s.split_pdf_min_pages, content_index=content_index)
+            upload_items = splitter.split(client, bookid, upload_items)
+
+        guids = []
+        uploaded_files = []
+        to_upload, to_poll, resumed_guids = upload_items, [], []
+        if s.resume and ledger:
+            to_upload, to_poll, resumed_guids = ledger.plan_resume(client, upload_items, bookid)
+        to_upload = [item if isinstance(item, File) else File(client, bookid, item) for item in to_upload]
+        pending = to_upload + to_poll  # every File here ends up with GUIDs, or failed
+
+        if s.pipeline_mode:
+            from .pipeline import OCRPipeline
+            pipeline = OCRPipeline(
+                client, bookid,
+                upload_workers=self._workers(s.upload_workers), upload_rate_limit=self._rate(s.upload_rate_limit),
+                download_workers=self._workers(s.download_workers),
+                download_rate_limit=self._rate(s.download_rate_limit),
+                download=s.download_results, rename_map=self.rename_map, ledger=ledger, content_index=content_index,
+                poll_kwargs={"initial_delay": s.poll_initial_delay, "max_delay": s.poll_max_delay,
+                             "rate_limit": s.poll_rate_limit},
+                download_dir=s.download_dir, name_template=s.result_name_template, writer=self.writer,
+            )
+            pipeline.run(to_poll + to_upload, guids=resumed_guids)
+            self._record_failures(pending, inputs)
+            if not s.download_results:
+                guids.extend(pipeline.guids + resumed_guids)
+            return guids
+
+        duplicates = []
+        if content_index:
+            reused, to_upload, duplicates = content_index.plan(to_upload)
+            for file in reused:
+                self._on_ocr_done(file)
+            uploaded_files.extend(reused)
+        if self._workers(s.upload_workers) > 1:
+            from .upload import ConcurrentUploader
+            uploader = ConcurrentUploader(client, workers=self._workers(s.upload_workers),
+                                          rate_limit=self._rate(s.upload_rate_limit),
+                                          on_result=ledger.record_upload_result if ledger else None)
+            results = uploader.upload_all(to_upload)
+            uploaded_files.extend(r["file"] for r in results if r["ok"])
+        else:
+            for file in to_upload:
+                name = os.path.basename(file.file_name)
+                try:
+                    file.upload()
+                except Exception as e:  # like ConcurrentUploader: one bad file never stops the batch
+                    print(f"❌ Upload failed: {name} ({e})")
+                    if ledger:
+                        ledger.record_upload_result({"file": file, "ok": False, "queue_id": None, "error": str(e)})
+                    continue
+                if ledger:
+                    ledger.record_upload(file)
+                uploaded_files.append(file)
+                client.wait_random(label=f"uploaded: {name}")
+        uploaded_files.extend(to_poll)
+        self._poller().poll_all([f for f in uploaded_files if not f.guids])
+        for file, first in duplicates:
+            if first.guids:
+                file.adopt_guids(first)
+                self._on_ocr_done(file)
+                uploaded_files.append(file)
+        self._record_failures(pending, inputs)
+        guids.extend(resumed_guids)
+        if s.split_pdfs:
+            uploaded_files = PdfSplitter.stitch(uploaded_files)
+        for file in uploaded_files:
+            guids.extend(file.guids)
+
+        if s.fixed_waits and s.download_results:
+            # off by default: poll_all above only returns once the queues are done
+            # if there are many GUIDs, wait longer to ensure all results are ready
+            client.wait_random(min_sec=10, max_sec=10, label="to make sure uploaded files are ready")
+            if len(guids) > 4:
+                client.wait_random(min_sec=30, max_sec=30, label="to make sure all GUIDs are ready")
+        return guids
+
+    def _record_failures(self, files, inputs):
+        failed = set()
+        for file in files:
+            if not file.guids:
+                sources = file.members or [file.source_name or file.file_name]
+                failed.update(inputs.get(path, path) for path in sources)
+        self.failed_paths = sorted(failed)
+
+    def ingest(self, paths):
+        """
+        Upload `paths`, wait for OCR and download the results (when download_results is on).
+        """
+        guids = self.upload(paths)
+        if self.settings.download_results and guids:
+            self.download(guids)
+        return guids
+
+    def watch(self, folder, stop=None, once=False):
+        """
+        Run as a daemon: ingest new uploadable files anywhere under `folder` once they are completely
+        written, until `stop` (a threading.Event) is set. Handled files are remembered in the ledger
+        database, so a restart continues where the last run stopped. Always resumes from the ledger
+        (on a copy of the settings), so files of a batch that was interrupted are not uploaded twice.
+        Files whose upload or OCR failed are retried in later passes, watch_max_attempts times at most.
+        """
+        from .watch import FolderWatcher, WatchState
+        s = self.settings
+        if not self.ledger:
+            raise ValueError("❌ Watch mode needs the ledger (use_ledger) to remember which files were handled.")
+
+        def handler(paths):
+            self.ingest(paths)
+            failed = set(self.failed_paths)
+            return [path for path in paths if path not in failed]
+
+        state = WatchState(s.ledger_file)
+        watcher = FolderWatcher(folder, handler, state, accept=is_uploadable, interval=s.watch_interval,
+                                settle=s.watch_settle_seconds, batch_size=s.watch_batch_size,
+                                max_attempts=s.watch_max_attempts)
+        self.settings = Settings(**s.as_dict()).update(resume=True)
+        try:
+            return watcher.run(stop, once=once)
+        finally:
+            self.settings = s
+            state.close()
+
+    def poll(self, queue_ids=None):
+        """
+        Wait for queues and return their GUIDs: the given queue_ids, or every queue the ledger
+        still has open (for settings.book_id, or all books if it is None).
+        """
+        from .models import File
+        client, bookid = self.client, self.settings.book_id
+        files = self.ledger.open_queues(client, bookid, queue_ids) if self.ledger else []
+        known = {file.queue_id for file in files}
+        for queue_id in queue_ids or ():
+            if int(queue_id) not in known:
+                # Not in the ledger: results are named after the queue
+                file = File(client, bookid or 0, f"queue_{queue_id}")
+                file.queue_id = int(queue_id)
+                files.append(file)
+        if not files:
+            print("No open queues.")
+            return []
+        self._poller().poll_all(files)
+        return [guid for file in files for guid in file.guids]
+
+    def guids(self, numbers):
+        from .models import GUID
+        return [GUID(self.client, guid) for guid in numbers]
+
+    def pending_guids(self):
+        """
+        GUIDs recorded in the ledger (for settings.book_id, or all books) whose results are not saved yet.
+        """
+        if not self.ledger:
+            raise ValueError("❌ No GUIDs given and the ledger is disabled.")
+        return self.ledger.unsaved_guids(self.client, self.settings.book_id)
+
+    def _saved(self, guid, error):
+        if error is not None:
+            self.failed_downloads[guid.guid] = str(error)
+            print(f"❌ Could not save GUID {guid.guid} ({error})")
+        elif self.ledger:
+            self.ledger.record_saved(guid)
+
+    def download(self, guids):
+        """
+        Fetch the results of `guids`, one by one with pauses, or in parallel within the adaptive
+        concurrency limit; the writer saves them in the background. A GUID that fails is reported
+        and kept in failed_downloads (the ledger still has it unsaved, so resume fetches it again);
+        the others go on. Returns the number fetched.
+        """
+        s = self.settings
+        cache = self.result_cache
+        writer = self.writer  # created here: fetch threads racing to create it would each get their own
+        self.failed_downloads = {}
+
+        def fetch(guid):
+            try:
+                guid.save_results(rename_map=self.rename_map, download_dir=s.download_dir,
+                                  template=s.result_name_template, writer=writer, done=self._saved)
+            except Exception as e:  # one bad GUID never stops the others
+                self.failed_downloads[guid.guid] = str(e)
+                print(f"❌ Download failed: GUID {guid.guid} ({e})")
+                return False
+            return True
+
+        guids = list(guids)
+        listed = {id(guid) for guid in guids}
+        # a copy (File.adopt_guids) is written with the GUID it copies, from one fetch
+        guids = [guid for guid in guids if guid.copy_of is None or id(guid.copy_of) not in listed]
+        if s.adaptive_concurrency:
+            from concurrent.futures import ThreadPoolExecutor, as_completed
+            with ThreadPoolExecutor(max_workers=self._workers(s.download_workers)) as pool:
+                fetched = sum(future.result() for future in as_completed([pool.submit(fetch, g) for g in guids]))
+        else:
+            fetched = 0
+            for guid in guids:
+                print()
+                if not (cache and cache.contains(guid.guid)):
+                    self.client.wait_random(min_sec=1, max_sec=2, label=f"before GUID {guid.guid}")
+                fetched += fetch(guid)
+        writer.flush()
+        if self.failed_downloads:
+            print(f"❌ {len(self.failed_downloads)} of {len(guids)} GUIDs were not saved.")
+        return fetched
+
+    def export(self, numbers, manifest_path=None, retry_missing=False):
+        """
+        Download the results of GUID numbers (e.g. a range) in parallel within download_rate_limit,
+        recording each outcome in a manifest. Returns the RangeExporter summary.
+        """
+        from .export import RangeExporter
+        s = self.settings
+        numbers = [int(n) for n in numbers]
+        known = [g.guid for g in self.ledger.known_guids(None, numbers)] if self.ledger else None
+        exporter = RangeExporter(self.client, download_dir=s.download_dir, workers=self._workers(s.download_workers),
+                                 rate_limit=self._rate(s.download_rate_limit), manifest_path=manifest_path,
+                                 rename_map=self.rename_map, template=s.result_name_template,
+                                 retry_missing=retry_missing, writer=self.writer, known=known, ledger=self.ledger)
+        return exporter.run(numbers)
+
+    def downloaded_results(self, numbers=None):
+        """
+        Yield (guid, result, original, index) for the results in download_dir: JSONL shards first,
+        then per-GUID .json / .json.gz / .json.zst files by GUID, each GUID once. `numbers` limits
+        it to those GUIDs. Original names and indexes the files lack are taken from the ledger.
+        """
+        from .rename import BulkRenamer
+        from .writer import read_result_file, read_shard
+        s = self.settings
+        wanted = {int(n) for n in numbers} if numbers is not None else None
+        shards = []
+        if os.path.isdir(s.download_dir):
+            with os.scandir(s.download_dir) as entries:
+                shards = sorted(e.path for e in entries if not e.name.startswith(".") and
+                                e.name.endswith((".jsonl", ".jsonl.gz", ".jsonl.zst")))
+        files = {
+            guid: sorted(n for n in names if n.endswith((".json", ".json.gz", ".json.zst")))
+            for guid, names in BulkRenamer(s.download_dir, rename_map=self.rename_map, template=s.result_name_template,
+                                           ledger=self.ledger).index().items()
+            if wanted is None or guid in wanted
+        }
+        files = {guid: names[0] for guid, names in files.items() if names}
+        known = {}
+        if self.ledger:
+            known = {g.guid: g for g in self.ledger.known_guids(None, sorted(wanted or files))}
+
+        seen = set()
+        for path in shards:
+            for record in read_shard(path):
+                guid = record.get("guid")
+                if "result" not in record or guid in seen or (wanted is not None and guid not in wanted):
+                    continue  # e.g. export_manifest.jsonl
+                seen.add(guid)
+                yield guid, record["result"], record.get("original"), record.get("index")
+        for guid in sorted(files):
+            if guid in seen:
+                continue
+            seen.add(guid)
+            ledger_guid = known.get(guid)
+            yield (guid, read_result_file(os.path.join(s.download_dir, files[guid])),
+                   ledger_guid.original_filename if ledger_guid else None,
+                   ledger_guid.index if ledger_guid else None)
+
+    def export_book(self, output=None, numbers=None):
+        """
+        Merge the downloaded results (see downloaded_results) into one columnar file that
+        BookColumns memory-maps. Returns the path written.
+        """
+        from .columnar import FILE_SUFFIX, ColumnarWriter
+        s = self.settings
+        book_id = self._book_id()
+        name = f"book_{book_id}" if book_id is not None else "results"
+        output = output or os.path.join(s.download_dir, f"{name}{FILE_SUFFIX}")
+        with ColumnarWriter(output, metadata={"book_id": book_id}) as writer:
+            for guid, result, original, index in self.downloaded_results(numbers):
+                writer.add(guid, result, original, index)
+        return output
+
+    def index_results(self, rebuild=False, optimize=False):
+        """
+        Add the downloaded results that are not in the search index yet (all of them with
+        rebuild=True). Returns the number of GUIDs added.
+        """
+        index = self.search_index
+        if rebuild:
+            index.clear()
+        added = 0
+        for guid, result, original, page_index in self.downloaded_results():
+            if guid not in index:
+                index.add(guid, result, original, page_index)
+                added += 1
+        index.commit()
+        if optimize:
+            index.optimize()
+        print(f"[search] {added} GUIDs added; {len(index)} GUIDs in {self.settings.search_index_dir}")
+        return added
+
+    def search(self, query, limit=50):
+        return self.search_index.search(query, limit)
+
+    def rename(self, guids=None, dry_run=False):
+        """
+        Rename downloaded results of `guids` (default: every GUID found in download_dir that the
+        ledger knows) in one journaled pass. Original names missing on the GUID objects are taken
+        from the ledger. Returns the (src, dst) renames.
+        """
+        from .rename import BulkRenamer
+        s = self.settings
+        renamer = BulkRenamer(s.download_dir, rename_map=self.rename_map, template=s.result_name_template,
+                              ledger=self.ledger)
+        on_disk = renamer.index()
+        if guids is None:
+            if not self.ledger:
+                raise ValueError("❌ No GUIDs given and the ledger is disabled.")
+            guids = self.ledger.known_guids(None, on_disk)
+        elif self.ledger:
+            unnamed = [g.guid for g in guids if g.original_filename is None and g.guid in on_disk]
+            known = {g.guid: g for g in self.ledger.known_guids(None, unnamed)}
+            guids = [known.get(g.guid, g) if g.original_filename is None else g for g in guids]
+        print(f"[rename] {len(on_disk)} GUIDs found in {s.download_dir}; renaming files of {len(guids)}.")
+        return renamer.run(guids, dry_run=dry_run)
+
+    def rollback_rename(self, journal_path=None):
+        from .rename import latest_journal, rollback_renames
+        journal_path = journal_path or latest_journal(self.settings.download_dir)
+        if not journal_path:
+            print(f"[rename] No rename journal in {self.settings.download_dir}")
+            return 0
+        return rollback_renames(journal_path)
+
+    def close(self):
+        if self._concurrency is not None:
+            print(f"Adaptive concurrency: {self._concurrency.stats()}")
+        if self._writer is not None:
+            self._writer.close()
+        if self._search_index is not None:
+            self._search_index.close()
+        if self._result_cache:
+            print(f"Result cache: {self._result_cache.stats()}")
+        if self._metrics is not None:
+            if self.settings.metrics_file:
+                self._metrics.write_prometheus(self.settings.metrics_file)
+            self._metrics.close()
+        for store in (self._ledger, self._content_index):
+            if store is not None:
+                store.close()
@@ -0,0 +1,405 @@
+"""
+Result writer: atomic, optionally compressed output, written on a background thread.
+"""
+import gzip
+import json
+import mmap
+import os
+import queue
+import threading
+import time
+import zlib
+
+from .config import DOWNLOAD_DIR
+from .naming import ensure_unique_path
+
+
+class ResultWriter:
+    """
+    Write OCR results to disk. With background=True, fetchers hand results over through a bounded
+    queue and a writer thread does the disk work in batches, so network work never waits on a slow
+    disk (submit only blocks when the queue is full).
+
+    fmt:     pretty   .txt + indented .json (the classic output)
+             compact  .txt + .json without whitespace
+             gzip     .txt + .json.gz (compact JSON)
+             zstd     .txt + .json.zst (compact JSON; requires zstandard: pip install zstandard)
+    layout:  files    files per GUID, each written to a temp file and renamed into place, so a crash
+                      never leaves half-written JSON
+             jsonl    one line per GUID ({"guid", "name", "original", "index", "result"}) appended to
+                      <download_dir>/<shard>.jsonl (.jsonl.gz / .jsonl.zst when compressed), one write
+                      per batch. No .txt files. A crash can only leave a torn last line (or a
+                      truncated last compressed member): the next writer cuts a torn line off before
+                      appending, and starts a new shard (<shard>-2.jsonl.gz, ...) after a damaged
+                      compressed one. read_shard skips whatever is damaged.
+    fsync:   flush every file (and every shard batch) to the disk before it counts as written, so
+             this also holds across a power loss. The writes happen on the writer thread, so this
+             costs downloads nothing unless the disk cannot keep up.
+    """
+    FORMATS = ("pretty", "compact", "gzip", "zstd")
+    LAYOUTS = ("files", "jsonl")
+    _DONE = object()
+
+    def __init__(self, download_dir=DOWNLOAD_DIR, fmt="pretty", layout="files", shard="results",
+                 queue_size=256, batch_size=64, fsync=True, metrics=None, background=True, search_index=None):
+        if fmt not in self.FORMATS:
+            raise ValueError(f"❌ Unknown result format: {fmt}. Choose from: {', '.join(self.FORMATS)}")
+        if layout not in self.LAYOUTS:
+            raise ValueError(f"❌ Unknown result layout: {layout}. Choose from: {', '.join(self.LAYOUTS)}")
+        self._zstd = None
+        if fmt == "zstd":
+            try:
+                import zstandard
+            except ImportError:
+                raise RuntimeError("zstd output requires zstandard: pip install zstandard") from None
+            self._zstd = zstandard.ZstdCompressor(level=3)
+        self.download_dir = download_dir
+        self.fmt = fmt
+        self.layout = layout
+        self.shard = shard
+        self.batch_size = max(1, int(batch_size))
+        self.fsync = fsync
+        self.metrics = metrics
+        self.search_index = search_index  # SearchIndex that every written result is added to
+        self.written = 0
+        self.errors = []  # (guid, message)
+        self._shards = {}
+        self._queue = queue.Queue(maxsize=max(1, int(queue_size))) if background else None
+        self._thread = None
+        if background:
+            self._thread = threading.Thread(target=self._run, name="result-writer", daemon=True)
+            self._thread.start()
+
+    # --- encoding ---
+    def _encode_json(self, result):
+        if self.fmt == "pretty":
+            data = json.dumps(result, ensure_ascii=False, indent=2).encode("utf-8")
+        else:
+            data = json.dumps(result, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+        return self._compress(data)
+
+    def _compress(self, data):
+        if self.fmt == "gzip":
+            return gzip.compress(data, compresslevel=6)
+        if self.fmt == "zstd":
+            return self._zstd.compress(data)
+        return data
+
+    @property
+    def json_suffix(self):
+        return {"gzip": ".json.gz", "zstd": ".json.zst"}.get(self.fmt, ".json")
+
+    @property
+    def shard_suffix(self):
+        return {"gzip": ".jsonl.gz", "zstd": ".jsonl.zst"}.get(self.fmt, ".jsonl")
+
+    @property
+    def shard_path(self):
+        return os.path.join(self.download_dir, f"{self.shard}{self.shard_suffix}")
+
+    # --- writing ---
+    def _atomic_write(self, path, data):
+        tmp = f"{path}.tmp-{os.getpid()}-{threading.get_ident()}"
+        with open(tmp, "wb") as f:
+            f.write(data)
+            if self.fsync:
+                f.flush()
+                os.fsync(f.fileno())
+        os.replace(tmp, path)
+
+    def _unique_json_path(self, base):
+        # like ensure_unique_path, but "_1" goes before the whole ".json.gz" suffix
+        root, suffix = os.path.join(self.download_dir, base), self.json_suffix
+        path, k = f"{root}{suffix}", 1
+        while os.path.exists(path):
+            path, k = f"{root}_{k}{suffix}", k + 1
+        return path
+
+    def _write_files(self, guid, base, result):
+        text = "".join(line["text"] + "\n" for line in result).encode("utf-8")
+        txt_filename = ensure_unique_path(os.path.join(self.download_dir, f"{base}.txt"))
+        json_filename = self._unique_json_path(base)
+        data = self._encode_json(result)
+        self._atomic_write(txt_filename, text)
+        print(f"Saved text: {txt_filename}")
+        self._atomic_write(json_filename, data)
+        print(f"Saved JSON: {json_filename}")
+        return len(text) + len(data)
+
+    def _append_shard(self, items):
+        lines = "".join(
+            json.dumps({"guid": guid.guid, "name": base, "original": guid.original_filename,
+                        "index": guid.index, "result": result},
+                       ensure_ascii=False, separators=(",", ":")) + "\n"
+            for guid, base, result, _ in items
+        ).encode("utf-8")
+        data = self._compress(lines)  # one gzip member / zstd frame per batch
+        path = self.shard_path
+        f = self._shards.get(path)
+        if f is None:
+            f = self._shards[path] = self._open_shard(path)
+        f.write(data)
+        f.flush()
+        if self.fsync:
+            os.fsync(f.fileno())
+        print(f"Appended {len(items)} results to {f.name}")
+        return len(data)
+
+    def _open_shard(self, path):
+        """
+        Open a shard for appending after whatever an earlier (possibly crashed) run left in it.
+        """
+        if self.fmt in ("pretty", "compact"):
+            f = open(path, "a+b")
+            intact = _complete_lines_length(f)
+            if intact < f.tell():
+                print(f"⚠️ Cutting off a torn last record of {path} ({f.tell() - intact} bytes)")
+                f.truncate(intact)
+            return f
+        # compressed: a damaged member cannot be cut off without decoding the whole shard again,
+        # and records after it would go with it, so leave the shard as it is and start a new one
+        k = 1
+        while os.path.exists(path) and not _shard_intact(path):
+            k += 1
+            path = os.path.join(self.download_dir, f"{self.shard}-{k}{self.shard_suffix}")
+        if k > 1:
+            print(f"⚠️ {self.shard_path} ends in a damaged record; appending to {path} instead")
+        return open(path, "ab")
+
+    def _write_batch(self, items):
+        """
+        Write a list of (guid, base, result, done) and call each done(guid, error).
+        """
+        os.makedirs(self.download_dir, exist_ok=True)
+        start = time.monotonic()
+        outcomes = []
+        if self.layout == "jsonl":
+            try:
+                written = self._append_shard(items)
+                outcomes = [(item, None) for item in items]
+            except Exception as e:
+                written = 0
+                outcomes = [(item, e) for item in items]
+        else:
+            written = 0
+            for item in items:
+                item_start = time.monotonic()
+                try:
+                    size = self._write_files(*item[:3])
+                except Exception as e:
+                    outcomes.append((item, e))
+                    continue
+                written += size
+                outcomes.append((item, None))
+                if self.metrics:
+                    self.metrics.observe("ocr_file_write_seconds", time.monotonic() - item_start,
+                                         guid=item[0].guid, file=item[0].original_filename, bytes=size)
+        if self.metrics:
+            self.metrics.inc("ocr_file_write_bytes_total", written)
+            if self.layout == "jsonl":
+                self.metrics.observe("ocr_file_write_seconds", time.monotonic() - start,
+                                     shard=self.shard, guids=len(items), bytes=written)
+
+        for (guid, _, result, done), error in outcomes:
+            if error is None:
+                self.written += 1
+                self._index(guid, result)
+            else:
+                self.errors.append((guid.guid, str(error)))
+                print(f"❌ Could not write results of GUID {guid.guid}: {error}")
+            if done is not None:
+                done(guid, error)
+            elif error is not None and self._thread is None:
+                raise error
+
+    def _index(self, guid, result):
+        if self.search_index is None:
+            return
+        try:
+            self.search_index.add(guid.guid, result, guid.original_filename, guid.index)
+        except Exception as e:  # the results are saved; `python -m ascdc_ocr index` can catch up later
+            print(f"⚠️ Could not index GUID {guid.guid}: {e}")
+
+    def _run(self):
+        while True:
+            item = self._queue.get()
+            if item is self._DONE:
+                self._queue.task_done()
+                return
+            batch = [item]
+            stop = False
+            while len(batch) < self.batch_size:
+                try:
+                    item = self._queue.get_nowait()
+                except queue.Empty:
+                    break
+                if item is self._DONE:
+                    stop = True
+                    break
+                batch.append(item)
+            try:
+                self._write_batch(batch)
+            except Exception as e:  # a failing done() callback must not kill the writer
+                print(f"❌ Result writer: {e}")
+            for _ in range(len(batch) + stop):
+                self._queue.task_done()
+            if stop:
+                return
+
+    # --- public API ---
+    def submit(self, guid, base, result, done=None):
+        """
+        Queue the result of a GUID object for writing under the basename `base`. done(guid, error)
+        is called once it is on disk (error is None) or failed. Without a background thread the
+        write happens here, and a failure raises unless `done` is given.
+        """
+        item = (guid, base, result, done)
+        if self._thread is None:
+            self._write_batch([item])
+        else:
+            self._queue.put(item)  # blocks while the writer is queue_size results behind
+
+    def flush(self):
+        """
+        Block until everything submitted so far is written (and searchable, with a search_index).
+        """
+        if self._thread is not None:
+            self._queue.join()
+        for f in self._shards.values():
+            f.flush()
+        if self.search_index is not None:
+            self.search_index.commit()
+
+    def close(self):
+        if self._thread is not None:
+            self._queue.put(self._DONE)
+            self._thread.join()
+            self._thread = None
+        for f in self._shards.values():
+            f.close()
+        self._shards = {}
+        if self.search_index is not None:
+            self.search_index.commit()
+        if self.errors:
+            print(f"⚠️ {len(self.errors)} results could not be written.")
+        return self.written
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def _complete_lines_length(f):
+    """
+    Length of a file opened for reading up to and including its last newline (seeks to the end).
+    """
+    end = f.seek(0, os.SEEK_END)
+    position = end
+    while position > 0:
+        start = max(0, position - 64 * 1024)
+        f.seek(start)
+        block = f.read(position - start)
+        newline = block.rfind(b"\n")
+        if newline >= 0:
+            f.seek(end)
+            return start + newline + 1
+        position = start
+    f.seek(end)
+    return 0
+
+
+def _members(path):
+    """
+    Yield (start, end, data) for each gzip member / zstd frame of a compressed shard, data being
+    None for a damaged one: the reader then resumes at the next member header after it. A torn
+    last member ends the iteration with end == -1.
+    """
+    if path.endswith(".gz"):
+        magic, errors = b"\x1f\x8b\x08", (zlib.error, EOFError)
+
+        def decompressor():
+            return zlib.decompressobj(31)
+    else:
+        try:
+            import zstandard
+        except ImportError:
+            raise RuntimeError("Reading .zst results requires zstandard: pip install zstandard") from None
+        magic, errors = b"\x28\xb5\x2f\xfd", (zstandard.ZstdError, EOFError)
+
+        def decompressor():
+            return zstandard.ZstdDecompressor().decompressobj()
+    with open(path, "rb") as f:
+        size = os.fstat(f.fileno()).st_size
+        if not size:
+            return
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            start = 0
+            while 0 <= start < size:
+                d, position, parts = decompressor(), start, []
+                try:
+                    while not d.eof and position < size:
+                        chunk = mm[position:position + 256 * 1024]
+                        position += len(chunk)
+                        parts.append(d.decompress(chunk))
+                except errors:
+                    yield start, None, None
+                    start = mm.find(magic, start + 1)
+                    continue
+                if not d.eof:
+                    yield start, -1, None
+                    return
+                end = position - len(d.unused_data)
+                yield start, end, b"".join(parts)
+                start = end
+
+
+def _shard_intact(path):
+    """
+    Whether a compressed shard consists of complete, undamaged members only.
+    """
+    try:
+        return all(data is not None for _, _, data in _members(path))
+    except OSError:
+        return False
+
+
+def read_shard(path):
+    """
+    Iterate over the records of a JSONL shard written by ResultWriter (plain, .gz or .zst),
+    skipping damaged records: a torn line, or a torn or corrupt compressed member.
+    """
+    if path.endswith((".gz", ".zst")):
+        blocks = (data for _, _, data in _members(path) if data is not None)
+    else:
+        def blocks():
+            with open(path, "rb") as f:
+                yield from f
+        blocks = blocks()
+    for block in blocks:
+        for line in block.splitlines():
+            try:
+                yield json.loads(line)
+            except ValueError:  # also UnicodeDecodeError
+                continue
+
+
+def read_result_file(path):
+    """
+    Load a result file written by ResultWriter (.json, .json.gz or .json.zst).
+    """
+    if path.endswith(".gz"):
+        with gzip.open(path, "rb") as f:
+            data = f.read()
+    elif path.endswith(".zst"):
+        try:
+            import zstandard
+        except ImportError:
+            raise RuntimeError("Reading .zst results requires zstandard: pip install zstandard") from None
+        with open(path, "rb") as f:
+            data = zstandard.ZstdDecompressor().stream_reader(f).read()
+    else:
+        with open(path, "rb") as f:
+            data = f.read()
+    return json.loads(data)
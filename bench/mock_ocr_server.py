@@ -0,0 +1,310 @@
+"""
+Local stand-in for the ocr.ascdc.tw web API, for load tests and benchmarks.
+
+Implements the endpoints the client calls (auth.php, create_book.php, upload.php, queue.php,
+query.php, get_image.php) with configurable queue latency, error rates and payload sizes.
+Page counts follow the upload: 1 for JPG/PNG, one per member for ZIP, one per "/Type /Page"
+object for PDF.
+
+Run standalone:
+    python bench/mock_ocr_server.py --port 8000 --queue-latency 5 --error-rate 0.05
+then point the client at it:
+    ASCDCOCRClient(account, password, base_url="http://127.0.0.1:8000")
+"""
+import argparse
+import base64
+import io
+import itertools
+import json
+import random
+import re
+import threading
+import time
+import urllib.parse
+import zipfile
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+_PDF_PAGE_RE = re.compile(rb"/Type\s*/Page\b(?!s)")
+_FILENAME_RE = re.compile(rb'filename="([^"]*)"')
+
+
+class MockConfig:
+    def __init__(self, queue_latency=2.0, queue_latency_per_page=0.05, request_latency=0.0,
+                 error_rate=0.0, drop_rate=0.0, not_ready_rate=0.0, lines_per_page=200,
+                 image_bytes=50_000, token_ttl=None, capacity=None, forbidden_rate=0.0, seed=None):
+        self.queue_latency = queue_latency                    # seconds from upload to OCR done
+        self.queue_latency_per_page = queue_latency_per_page  # extra seconds per page in the upload
+        self.request_latency = request_latency                # added to every request (network RTT)
+        self.error_rate = error_rate                          # fraction of requests answered with HTTP 503
+        self.drop_rate = drop_rate                            # fraction of connections closed without a response
+        self.not_ready_rate = not_ready_rate                  # fraction of GUIDs answering "processing" (103) once
+        self.lines_per_page = lines_per_page                  # result entries per page (payload size)
+        self.image_bytes = image_bytes                        # get_image payload size
+        self.token_ttl = token_ttl                            # seconds a token stays valid (None: forever)
+        self.capacity = capacity                              # requests served at full speed (None: unlimited);
+                                                              # above it latency grows, above 2x it HTTP 503
+        self.forbidden_rate = forbidden_rate                  # fraction of GUIDs owned by another account (HTTP 403)
+        self.seed = seed
+
+
+class MockState:
+    def __init__(self, config):
+        self.config = config
+        self.random = random.Random(config.seed)
+        self.lock = threading.Lock()
+        self.tokens = {}   # token -> expires_at
+        self.books = {}
+        self.queues = {}   # queue_id -> (ready_at, [guid, ...])
+        self.pages = {}    # guid -> (file name, page number)
+        self.not_ready_once = set()
+        self._ids = itertools.count(1)
+        self._guids = itertools.count(1_000_000)
+        self.counters = {}
+        self.in_flight = 0
+
+    def count(self, key):
+        with self.lock:
+            self.counters[key] = self.counters.get(key, 0) + 1
+
+    def roll(self, rate):
+        with self.lock:
+            return rate > 0 and self.random.random() < rate
+
+    def new_token(self):
+        token = f"mock-{next(self._ids)}-{self.random.getrandbits(32):08x}"
+        expires = time.time() + self.config.token_ttl if self.config.token_ttl else float("inf")
+        with self.lock:
+            self.tokens[token] = expires
+        return token
+
+    def token_ok(self, token):
+        with self.lock:
+            return token is not None and self.tokens.get(token, 0) > time.time()
+
+    def add_upload(self, name, pages):
+        cfg = self.config
+        with self.lock:
+            queue_id = next(self._ids)
+            guids = [next(self._guids) for _ in range(pages)]
+            for i, guid in enumerate(guids, start=1):
+                self.pages[guid] = (name, i)
+            latency = cfg.queue_latency + cfg.queue_latency_per_page * pages
+            self.queues[queue_id] = (time.monotonic() + latency * self.random.uniform(0.8, 1.2), guids)
+        return queue_id
+
+    def result(self, guid):
+        name, page = self.pages[guid]
+        rng = random.Random(guid)
+        entries = []
+        for i in range(self.config.lines_per_page):
+            ch = chr(0x4E00 + rng.randrange(0x5000))
+            entries.append({
+                "id": i, "text": ch, "line_id": i // 20, "line_group_id": i // 20, "block_id": 0, "vertical": 1,
+                "x": 20 + (i // 20) * 40, "y": 20 + (i % 20) * 35, "width": 30, "height": 32,
+                "options": [[ch, 1.0]],
+            })
+        return entries
+
+
+def count_pages(name, data):
+    lower = name.lower()
+    if lower.endswith(".zip"):
+        try:
+            with zipfile.ZipFile(io.BytesIO(data)) as zf:
+                return max(1, sum(1 for info in zf.infolist() if not info.is_dir()))
+        except zipfile.BadZipFile:
+            return 1
+    if lower.endswith(".pdf"):
+        return max(1, len(_PDF_PAGE_RE.findall(data)))
+    return 1
+
+
+def parse_multipart(content_type, body):
+    """
+    Minimal multipart/form-data parser: returns (fields, file_name, file_bytes).
+    """
+    boundary = content_type.split("boundary=", 1)[1].strip('"').encode("latin-1")
+    fields, file_name, file_bytes = {}, None, b""
+    for part in body.split(b"--" + boundary):
+        if not part or part.startswith(b"--"):
+            continue
+        head, _, data = part.partition(b"\r\n\r\n")
+        data = data[:-2] if data.endswith(b"\r\n") else data
+        name = re.search(rb'name="([^"]*)"', head)
+        filename = _FILENAME_RE.search(head)
+        if filename:
+            file_name, file_bytes = filename.group(1).decode("utf-8"), data
+        elif name:
+            fields[name.group(1).decode("utf-8")] = data.decode("utf-8")
+    return fields, file_name, file_bytes
+
+
+class MockHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    state = None  # set by make_server
+
+    def log_message(self, *args):
+        pass
+
+    def _reply(self, payload, code=200):
+        body = json.dumps(payload).encode("utf-8")
+        self.send_response(code)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _token(self, fields):
+        auth = self.headers.get("Authorization", "")
+        if auth.startswith("Bearer "):
+            return auth[len("Bearer "):]
+        return fields.get("token")
+
+    def do_POST(self):
+        state, cfg = self.state, self.state.config
+        endpoint = self.path.rsplit("/", 1)[-1].split("?", 1)[0]
+        length = int(self.headers.get("Content-Length", 0))
+        body = self.rfile.read(length) if length else b""
+        state.count(endpoint)
+        with state.lock:
+            state.in_flight += 1
+            load = state.in_flight / cfg.capacity if cfg.capacity else 1.0
+        try:
+            self._handle(state, cfg, endpoint, body, load)
+        finally:
+            with state.lock:
+                state.in_flight -= 1
+
+    def _handle(self, state, cfg, endpoint, body, load):
+        if load > 2:
+            state.count("overloaded")
+            self._reply({"status": 108, "message": "mock overload"}, code=503)
+            return
+        if cfg.request_latency:
+            time.sleep(cfg.request_latency * max(1.0, load) * state.random.uniform(0.5, 1.5))
+        if state.roll(cfg.drop_rate):
+            state.count("dropped")
+            self.close_connection = True
+            self.connection.close()
+            return
+        if state.roll(cfg.error_rate):
+            state.count("errors")
+            self._reply({"status": 108, "message": "mock overload"}, code=503)
+            return
+
+        ctype = self.headers.get("Content-Type", "")
+        if ctype.startswith("multipart/form-data"):
+            fields, file_name, file_bytes = parse_multipart(ctype, body)
+        else:
+            fields = {k: v[0] for k, v in urllib.parse.parse_qs(body.decode("utf-8")).items()}
+            file_name, file_bytes = None, b""
+
+        if endpoint == "auth.php":
+            if not fields.get("account"):
+                self._reply({"status": 102, "message": "wrong credentials"})
+            else:
+                self._reply({"status": 200, "access_token": state.new_token()})
+            return
+
+        if not state.token_ok(self._token(fields)):
+            self._reply({"status": 401, "message": "invalid or expired token"}, code=401)
+            return
+
+        if endpoint == "create_book.php":
+            with state.lock:
+                bookid = len(state.books) + 1
+                state.books[bookid] = (fields.get("title"), fields.get("author"))
+            self._reply({"status": 200, "bookid": bookid})
+        elif endpoint == "upload.php":
+            if not file_name:
+                self._reply({"status": 102, "message": "no file"})
+                return
+            queue_id = state.add_upload(file_name, count_pages(file_name, file_bytes))
+            self._reply({"status": 200, "queue_id": queue_id})
+        elif endpoint == "queue.php":
+            entry = state.queues.get(int(fields.get("queue_id", 0)))
+            if entry is None:
+                self._reply({"status": 102, "message": "no such queue"})
+            elif time.monotonic() < entry[0]:
+                self._reply({"status": 103})
+            else:
+                self._reply({"status": 200, "guids": [{"guid": g} for g in entry[1]]})
+        elif endpoint in ("query.php", "get_image.php"):
+            guid = int(fields.get("guid", 0))
+            if cfg.forbidden_rate and random.Random(guid).random() < cfg.forbidden_rate:
+                state.count("forbidden")
+                self._reply({"status": 403, "message": "permission denied"}, code=403)
+            elif guid not in state.pages:
+                self._reply({"status": 102, "message": "no such GUID"})
+            elif endpoint == "get_image.php":
+                self._reply({"status": 200, "result": base64.b64encode(random.Random(guid).randbytes(cfg.image_bytes)).decode()})
+            else:
+                with state.lock:
+                    first_time = guid not in state.not_ready_once
+                    state.not_ready_once.add(guid)
+                if first_time and state.roll(cfg.not_ready_rate):
+                    self._reply({"status": 103, "message": "processing"})
+                else:
+                    self._reply({"status": 200, "result": state.result(guid)})
+        else:
+            self._reply({"status": 404, "message": f"unknown endpoint {endpoint}"}, code=404)
+
+
+def make_server(config=None, host="127.0.0.1", port=0):
+    """
+    Build a ThreadingHTTPServer bound to host:port (0 = any free port); its .state holds counters.
+    """
+    state = MockState(config or MockConfig())
+    handler = type("BoundMockHandler", (MockHandler,), {"state": state})
+    server = ThreadingHTTPServer((host, port), handler)
+    server.daemon_threads = True
+    server.state = state
+    return server
+
+
+def start_in_thread(config=None, host="127.0.0.1", port=0):
+    """
+    Start a mock server in a daemon thread. Returns (server, base_url).
+    """
+    server = make_server(config, host, port)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f"http://{host}:{server.server_address[1]}"
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Mock ASCDC OCR API server")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8000)
+    parser.add_argument("--queue-latency", type=float, default=2.0)
+    parser.add_argument("--queue-latency-per-page", type=float, default=0.05)
+    parser.add_argument("--request-latency", type=float, default=0.0)
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--drop-rate", type=float, default=0.0)
+    parser.add_argument("--not-ready-rate", type=float, default=0.0)
+    parser.add_argument("--lines-per-page", type=int, default=200)
+    parser.add_argument("--image-bytes", type=int, default=50_000)
+    parser.add_argument("--token-ttl", type=float, default=None)
+    parser.add_argument("--capacity", type=int, default=None)
+    parser.add_argument("--forbidden-rate", type=float, default=0.0)
+    parser.add_argument("--seed", type=int, default=None)
+    args = parser.parse_args()
+
+    config = MockConfig(
+        queue_latency=args.queue_latency, queue_latency_per_page=args.queue_latency_per_page,
+        request_latency=args.request_latency, error_rate=args.error_rate, drop_rate=args.drop_rate,
+        not_ready_rate=args.not_ready_rate, lines_per_page=args.lines_per_page,
+        image_bytes=args.image_bytes, token_ttl=args.token_ttl, capacity=args.capacity,
+        forbidden_rate=args.forbidden_rate, seed=args.seed,
+    )
+    server = make_server(config, args.host, args.port)
+    print(f"Mock OCR API listening on http://{args.host}:{server.server_address[1]}", flush=True)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        print(json.dumps(server.state.counters))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,339 @@
+"""
+End-to-end benchmarks of the OCR client against the local mock server (bench/mock_ocr_server.py).
+
+Each scenario generates its input files, starts a mock server in a subprocess, runs the client
+(pipeline mode or the settings script's phased flow) and reports pages/minute, per-stage latency
+percentiles and the client's peak memory (RSS).
+
+    python bench/run_bench.py                         # every scenario, pipeline mode
+    python bench/run_bench.py small-images --scale 0.1
+    python bench/run_bench.py flaky --mode phased --json results.jsonl
+
+Each scenario runs in its own process, so peak memory is not shared between scenarios.
+"""
+import argparse
+import json
+import os
+import resource
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.dirname(HERE))
+
+import ascdc_ocr  # noqa: E402  (needs the repo root on sys.path)
+
+SCENARIOS = {
+    "small-images": {
+        "description": "1k small page images",
+        "files": 1000, "kind": "png", "size": 60_000,
+        "server": {"queue_latency": 3.0},
+    },
+    "huge-pdfs": {
+        "description": "a few huge multi-page PDFs",
+        "files": 3, "kind": "pdf", "size": 150 * 1024**2, "pages": 300,
+        "server": {"queue_latency": 5.0, "queue_latency_per_page": 0.02},
+    },
+    "zip-batched": {
+        "description": "small page images packed into ZIP uploads",
+        "files": 1000, "kind": "png", "size": 60_000, "zip_batching": True,
+        "server": {"queue_latency": 3.0, "queue_latency_per_page": 0.01},
+    },
+    "flaky": {
+        "description": "small images over a slow, lossy network",
+        "files": 200, "kind": "png", "size": 60_000,
+        "server": {"queue_latency": 3.0, "request_latency": 0.05, "error_rate": 0.05,
+                   "drop_rate": 0.01, "not_ready_rate": 0.2},
+    },
+}
+
+
+# ------------------------------
+# Fixtures
+# ------------------------------
+
+def write_random_file(path, size, chunk=1024 * 1024):
+    with open(path, "wb") as f:
+        remaining = size
+        while remaining > 0:
+            n = min(chunk, remaining)
+            f.write(os.urandom(n))
+            remaining -= n
+
+
+def write_fake_pdf(path, size, pages, chunk=1024 * 1024):
+    """
+    Not a renderable PDF: a header, `pages` page objects and random padding up to `size` bytes,
+    which is all the mock server needs to count pages.
+    """
+    with open(path, "wb") as f:
+        f.write(b"%PDF-1.4\n")
+        for i in range(pages):
+            f.write(f"{i + 3} 0 obj << /Type /Page /Parent 2 0 R >> endobj\n".encode("ascii"))
+        f.write(b"stream\n")
+        remaining = size - f.tell()
+        while remaining > 0:
+            n = min(chunk, remaining)
+            f.write(os.urandom(n))
+            remaining -= n
+        f.write(b"\nendstream\n%%EOF\n")
+
+
+def make_fixtures(scenario, workdir, scale):
+    folder = os.path.join(workdir, "uploads")
+    os.makedirs(folder, exist_ok=True)
+    count = max(1, int(round(scenario["files"] * scale)))
+    paths = []
+    for i in range(count):
+        path = os.path.join(folder, f"page_{i:05d}.{scenario['kind']}")
+        if scenario["kind"] == "pdf":
+            pages = max(1, int(round(scenario["pages"] * scale)))
+            write_fake_pdf(path, max(1024, int(scenario["size"] * scale)), pages)
+        else:
+            write_random_file(path, scenario["size"])
+        paths.append(path)
+    return paths
+
+
+# ------------------------------
+# Mock server
+# ------------------------------
+
+def start_server(options):
+    cmd = [sys.executable, os.path.join(HERE, "mock_ocr_server.py"), "--port", "0", "--seed", "1"]
+    for key, value in options.items():
+        cmd += [f"--{key.replace('_', '-')}", str(value)]
+    proc = subprocess.Popen(cmd, stdout=subprocess.PIPE, text=True)
+    line = proc.stdout.readline()
+    return proc, line.strip().rsplit(" ", 1)[-1]
+
+
+# ------------------------------
+# Measurements
+# ------------------------------
+
+class StageTimer:
+    """
+    Wraps client/GUID methods to collect per-stage latencies (seconds).
+    """
+    def __init__(self):
+        self.samples = {}
+        self.upload_done = {}
+        self._lock = threading.Lock()
+
+    def add(self, stage, seconds):
+        with self._lock:
+            self.samples.setdefault(stage, []).append(seconds)
+
+    def wrap(self, obj, name, stage, after=None):
+        original = getattr(obj, name)
+
+        def timed(*args, **kwargs):
+            start = time.monotonic()
+            result = original(*args, **kwargs)
+            self.add(stage, time.monotonic() - start)
+            if after:
+                after(args, result)
+            return result
+
+        setattr(obj, name, timed)
+
+    def install(self, client):
+        def uploaded(args, data):
+            if isinstance(data, dict) and data.get("status") == 200:
+                self.upload_done[data["queue_id"]] = time.monotonic()
+
+        def checked(args, data):
+            if isinstance(data, dict) and data.get("status") == 200 and args[0] in self.upload_done:
+                self.add("queue_wait", time.monotonic() - self.upload_done.pop(args[0]))
+
+        self.wrap(client, "upload_file", "upload", uploaded)
+        self.wrap(client, "check_ocr_queue", "queue_status", checked)
+        self.wrap(client, "get_result", "get_result")
+        original_save = ascdc_ocr.GUID.save_results
+        timer = self
+
+        def save_results(guid, *args, **kwargs):
+            start = time.monotonic()
+            result = original_save(guid, *args, **kwargs)
+            timer.add("save_results", time.monotonic() - start)
+            return result
+
+        ascdc_ocr.GUID.save_results = save_results
+
+    @staticmethod
+    def percentile(values, q):
+        values = sorted(values)
+        if not values:
+            return None
+        k = (len(values) - 1) * q
+        lo, hi = int(k), min(int(k) + 1, len(values) - 1)
+        return values[lo] + (values[hi] - values[lo]) * (k - lo)
+
+    def summary(self):
+        out = {}
+        for stage, values in sorted(self.samples.items()):
+            out[stage] = {
+                "n": len(values),
+                "p50": round(self.percentile(values, 0.50), 4),
+                "p90": round(self.percentile(values, 0.90), 4),
+                "p99": round(self.percentile(values, 0.99), 4),
+                "max": round(max(values), 4),
+            }
+        return out
+
+
+def peak_rss_mb():
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return rss / 1024**2 if sys.platform == "darwin" else rss / 1024
+
+
+# ------------------------------
+# Runs
+# ------------------------------
+
+def run_phased(client, book, items, args):
+    """
+    The script's default flow: sequential uploads with random waits, one poller, fixed waits,
+    then one download at a time.
+    """
+    files = []
+    for item in items:
+        file = item if isinstance(item, ascdc_ocr.File) else ascdc_ocr.File(client, book.bookid, item)
+        file.upload()
+        files.append(file)
+        client.wait_random(label="uploaded")
+    poller = ascdc_ocr.QueuePoller(client, initial_delay=args.poll_initial_delay, rate_limit=args.poll_rate)
+    poller.poll_all(files)
+    guids = [g for f in files for g in f.guids]
+    client.wait_random(min_sec=10, max_sec=10, label="to make sure uploaded files are ready")
+    if len(guids) > 4:
+        client.wait_random(min_sec=30, max_sec=30, label="to make sure all GUIDs are ready")
+    saved = 0
+    for guid in guids:
+        client.wait_random(min_sec=1, max_sec=2, label=f"before GUID {guid.guid}")
+        guid.save_results()
+        saved += 1
+    return saved, None
+
+
+def run_pipeline(client, book, items, args):
+    pipeline = ascdc_ocr.OCRPipeline(
+        client, book.bookid,
+        upload_workers=args.upload_workers, upload_rate_limit=args.upload_rate,
+        download_workers=args.download_workers, download_rate_limit=args.download_rate,
+        download_retry_delay=1.0,
+        poll_kwargs={"initial_delay": args.poll_initial_delay, "max_delay": 30, "rate_limit": args.poll_rate},
+    )
+    summary = pipeline.run(items)
+    return summary["saved"], summary["first_result_after"]
+
+
+def run_scenario(name, args):
+    scenario = SCENARIOS[name]
+    workdir = tempfile.mkdtemp(prefix=f"ocr-bench-{name}-")
+    paths = make_fixtures(scenario, workdir, args.scale)
+    proc, base_url = start_server(scenario["server"])
+    cwd = os.getcwd()
+    try:
+        os.chdir(workdir)  # token/book caches and downloads stay in the scratch dir
+        pool = max(args.upload_workers, args.download_workers) + 2
+        metrics = ascdc_ocr.Metrics(os.path.join(workdir, "metrics_trace.jsonl"))
+        client = ascdc_ocr.ASCDCOCRClient("bench", "bench", base_url=base_url, pool_size=pool, backoff=0.2,
+                                          metrics=metrics)
+        book = ascdc_ocr.Book(client, title=f"bench-{name}", author="bench")
+        timer = StageTimer()
+        timer.install(client)
+        items = paths
+        if scenario.get("zip_batching"):
+            batcher = ascdc_ocr.ZipBatcher(os.path.join(workdir, "zip_batches"), max_files=50)
+            items = batcher.pack(client, book.bookid, paths)  # archive Files + the unbatched paths
+
+        sys.stdout.flush()
+        quiet = open(os.devnull, "w") if not args.verbose else None
+        real_stdout = sys.stdout
+        if quiet:
+            sys.stdout = quiet
+        start = time.monotonic()
+        try:
+            run = run_pipeline if args.mode == "pipeline" else run_phased
+            saved, first_result = run(client, book, items, args)
+        finally:
+            elapsed = time.monotonic() - start
+            sys.stdout = real_stdout
+            if quiet:
+                quiet.close()
+        metrics.write_prometheus(os.path.join(workdir, "metrics.prom"))
+        metrics.close()
+    finally:
+        os.chdir(cwd)
+        proc.terminate()
+        proc.wait()
+
+    return {
+        "scenario": name,
+        "mode": args.mode,
+        "files": len(paths),
+        "input_mb": round(sum(os.path.getsize(p) for p in paths) / 1024**2, 1),
+        "pages_saved": saved,
+        "elapsed_s": round(elapsed, 2),
+        "pages_per_min": round(saved / elapsed * 60, 1) if elapsed else None,
+        "first_result_s": round(first_result, 2) if first_result is not None else None,
+        "peak_rss_mb": round(peak_rss_mb(), 1),
+        "stages": timer.summary(),
+    }
+
+
+def print_report(result):
+    print(f"\n== {result['scenario']} ({result['mode']}) ==")
+    for key in ("files", "input_mb", "pages_saved", "elapsed_s", "pages_per_min", "first_result_s", "peak_rss_mb"):
+        print(f"  {key:<15} {result[key]}")
+    print(f"  {'stage':<15} {'n':>6} {'p50':>9} {'p90':>9} {'p99':>9} {'max':>9}")
+    for stage, s in result["stages"].items():
+        print(f"  {stage:<15} {s['n']:>6} {s['p50']:>9.3f} {s['p90']:>9.3f} {s['p99']:>9.3f} {s['max']:>9.3f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the OCR client against the mock server")
+    parser.add_argument("scenarios", nargs="*", metavar="scenario",
+                        help=f"scenarios to run: {', '.join(SCENARIOS)} (default: all)")
+    parser.add_argument("--mode", choices=["pipeline", "phased"], default="pipeline")
+    parser.add_argument("--scale", type=float, default=1.0, help="shrink/grow file counts and sizes")
+    parser.add_argument("--upload-workers", type=int, default=8)
+    parser.add_argument("--download-workers", type=int, default=8)
+    parser.add_argument("--upload-rate", type=float, default=20.0)
+    parser.add_argument("--download-rate", type=float, default=50.0)
+    parser.add_argument("--poll-rate", type=float, default=20.0)
+    parser.add_argument("--poll-initial-delay", type=float, default=1.0)
+    parser.add_argument("--json", help="append one JSON line per scenario to this file")
+    parser.add_argument("--verbose", action="store_true", help="show the client's own output")
+    parser.add_argument("--in-process", action="store_true", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    names = args.scenarios or list(SCENARIOS)
+    unknown = [n for n in names if n not in SCENARIOS]
+    if unknown:
+        parser.error(f"unknown scenario(s): {', '.join(unknown)}")
+    if args.in_process:
+        result = run_scenario(names[0], args)
+        print(json.dumps(result))
+        return
+
+    for name in names:
+        # one process per scenario so peak RSS is measured per scenario
+        cmd = [sys.executable, os.path.abspath(__file__), name, "--in-process"] + [
+            a for a in sys.argv[1:] if a not in SCENARIOS
+        ]
+        out = subprocess.run(cmd, stdout=subprocess.PIPE, text=True, check=True).stdout
+        result = json.loads(out.strip().splitlines()[-1])
+        print_report(result)
+        if args.json:
+            with open(args.json, "a", encoding="utf-8") as f:
+                f.write(json.dumps(result) + "\n")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,69 @@
+"""
+Shared fixtures: an in-process mock OCR server (bench/mock_ocr_server.py) and a scratch working
+directory, so the token / book caches, the ledger and the downloads of a test stay in tmp_path.
+"""
+import os
+import sys
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path[:0] = [ROOT, os.path.join(ROOT, "bench")]
+
+from mock_ocr_server import MockConfig, start_in_thread  # noqa: E402
+
+from ascdc_ocr.config import Settings  # noqa: E402
+from ascdc_ocr.workflow import Workflow  # noqa: E402
+
+EXAMPLE_IMAGE = os.path.join(ROOT, "example.png")
+
+
+@pytest.fixture
+def workdir(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    return tmp_path
+
+
+@pytest.fixture
+def mock_config():
+    return MockConfig(queue_latency=0.2, queue_latency_per_page=0.0, lines_per_page=20, seed=1)
+
+
+@pytest.fixture
+def mock_server(mock_config):
+    server, base_url = start_in_thread(mock_config)
+    server.base_url = base_url
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+@pytest.fixture
+def settings(mock_server, workdir):
+    # adaptive concurrency drops the random pauses between requests, which would only slow tests down
+    return Settings(account="test", password="test", base_url=mock_server.base_url, book_title="Tests",
+                    book_author="pytest", adaptive_concurrency=True, poll_initial_delay=0.1, poll_max_delay=0.5,
+                    use_result_cache=False, result_fsync=False)
+
+
+@pytest.fixture
+def workflow(settings):
+    workflow = Workflow(settings)
+    yield workflow
+    workflow.close()
+
+
+def make_images(folder, count, seed=0):
+    """
+    `count` distinct PNG files (example.png with different trailing bytes) in folder. Returns their paths.
+    """
+    os.makedirs(folder, exist_ok=True)
+    with open(EXAMPLE_IMAGE, "rb") as f:
+        data = f.read()
+    paths = []
+    for i in range(count):
+        path = os.path.join(folder, f"page{i + 1:03d}.png")
+        with open(path, "wb") as f:
+            f.write(data + f"{seed}:{i}".encode("ascii"))
+        paths.append(path)
+    return paths
@@ -0,0 +1,82 @@
+import json
+import random
+import threading
+import time
+
+import pytest
+
+from ascdc_ocr.client import ASCDCOCRClient, OCRAPIError
+
+
+@pytest.fixture
+def mock_config(mock_config):
+    mock_config.token_ttl = 0.5
+    mock_config.forbidden_rate = 0.3
+    return mock_config
+
+
+def _add_pages(server, count):
+    state = server.state
+    with state.lock:
+        guids = [next(state._guids) for _ in range(count)]
+        for guid in guids:
+            state.pages[guid] = ("page.png", 1)
+    return guids
+
+
+def _forbidden(server, guids):
+    # the mock decides by the GUID alone, see MockHandler
+    rate = server.state.config.forbidden_rate
+    return {guid for guid in guids if random.Random(guid).random() < rate}
+
+
+def _client(server):
+    return ASCDCOCRClient("test", "test", base_url=server.base_url, backoff=0.05)
+
+
+def test_expired_tokens_are_replaced_under_traffic(mock_server, workdir):
+    guids = _add_pages(mock_server, 200)
+    allowed = [guid for guid in guids if guid not in _forbidden(mock_server, guids)]
+    client = _client(mock_server)
+    errors, fetched = [], []
+    deadline = time.monotonic() + 2.0
+
+    def worker(mine):
+        while time.monotonic() < deadline:
+            for guid in mine:
+                try:
+                    fetched.append(len(client.get_result(guid)))
+                except Exception as e:
+                    errors.append(e)
+
+    threads = [threading.Thread(target=worker, args=(allowed[i::8],)) for i in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert errors == []
+    assert fetched
+    logins = mock_server.state.counters["auth.php"]
+    assert 3 <= logins <= 2.0 / 0.5 + 2  # about one per expiry, not one per worker
+
+
+def test_cached_expired_token_logs_in_again(mock_server, workdir):
+    guids = _add_pages(mock_server, 20)
+    guid = min(set(guids) - _forbidden(mock_server, guids))
+    with open("token_cache.json", "w", encoding="utf-8") as f:
+        json.dump({"token": "revoked", "expires_at": time.time() + 3600}, f)
+    assert _client(mock_server).get_result(guid)
+    assert mock_server.state.counters["auth.php"] == 1
+
+
+def test_forbidden_guid_does_not_log_in_again(mock_server, workdir):
+    guids = _add_pages(mock_server, 20)
+    forbidden = sorted(_forbidden(mock_server, guids))
+    assert forbidden
+    client = _client(mock_server)
+    client.ensure_token()
+    for guid in forbidden:
+        with pytest.raises(OCRAPIError) as error:
+            client.get_result(guid)
+        assert error.value.http_status == 403
+    assert mock_server.state.counters["auth.php"] == 1
@@ -0,0 +1,73 @@
+import os
+import threading
+
+from conftest import make_images
+
+from ascdc_ocr.ledger import JobLedger
+from ascdc_ocr.models import GUID, File
+
+
+def _uploads(server):
+    return server.state.counters.get("upload.php", 0)
+
+
+def test_resume_skips_finished_files(mock_server, workflow, workdir):
+    paths = make_images(workdir / "in", 3)
+    workflow.settings.resume = True
+    guids = workflow.ingest(paths)
+    assert len(guids) == 3
+    assert _uploads(mock_server) == 3
+    assert len(os.listdir(workflow.settings.download_dir)) == 6  # .txt + .json per GUID
+
+    workflow.ingest(paths)
+    assert _uploads(mock_server) == 3
+
+
+def test_resume_uploads_replaced_file(mock_server, workflow, workdir):
+    paths = make_images(workdir / "in", 3)
+    workflow.settings.resume = True
+    workflow.ingest(paths)
+
+    # a new version saved under a temporary name and renamed over the old one
+    replacement = make_images(workdir / "new", 1, seed=1)[0]
+    os.replace(replacement, paths[0])
+    workflow.ingest(paths)
+    assert _uploads(mock_server) == 4
+
+
+def test_resume_only_downloads_the_batch(mock_server, workflow, workdir):
+    first, second = make_images(workdir / "a", 1), make_images(workdir / "b", 1, seed=1)
+    workflow.settings.update(resume=True, download_results=False)
+    workflow.upload(first)  # OCR'd, never downloaded
+    workflow.settings.download_results = True
+    queries = mock_server.state.counters.get("query.php", 0)
+    workflow.ingest(second)
+    assert mock_server.state.counters.get("query.php", 0) - queries == 1
+    assert len(workflow.ledger.unsaved_guids(None)) == 1  # the first file's GUID waits for `download`
+
+
+def test_identical_files_record_both_names(workdir):
+    ledger = JobLedger(str(workdir / "ledger.sqlite3"))
+    first, copy = File(None, 1, str(workdir / "a.png")), File(None, 1, str(workdir / "b.png"))
+    first.guids = [GUID(None, 7, "a", index=1)]
+    copy.guids = [GUID(None, 7, "b", index=1)]
+    ledger.record_guids(first)
+    ledger.record_guids(copy)
+    assert sorted(g.original_filename for g in ledger.unsaved_guids(None)) == ["a", "b"]
+
+    ledger.record_saved(copy.guids[0])
+    assert [g.original_filename for g in ledger.unsaved_guids(None)] == ["a"]
+    ledger.close()
+
+
+def test_close_closes_every_thread_connection(workdir):
+    ledger = JobLedger(str(workdir / "ledger.sqlite3"))
+    threads = [threading.Thread(target=ledger.file_status, args=("x", 1)) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+        thread.join()
+    assert len(ledger._conns) <= 2  # connections of threads that ended are closed on the next open
+    ledger.close()
+    assert ledger._conns == {}
+    assert ledger.file_status("x", 1) is None  # reopens
+    ledger.close()
@@ -0,0 +1,46 @@
+import os
+
+from conftest import make_images
+
+from ascdc_ocr.rename import latest_journal
+
+
+def _results(workflow):
+    return sorted(n for n in os.listdir(workflow.settings.download_dir) if not n.startswith("."))
+
+
+def test_rename_apply_rerun_and_rollback(workflow, workdir):
+    workflow.ingest(make_images(workdir / "in", 3))
+    before = _results(workflow)
+    assert len(before) == 6 and all("_guid" in name for name in before)
+
+    # a template without the GUID: the second pass can only find the files through the journal
+    workflow.settings.result_name_template = "{original}_p{index}"
+    renames = workflow.rename()
+    assert len(renames) == 6
+    after = _results(workflow)
+    assert not any("_guid" in name for name in after)
+    assert len(after) == 6
+
+    assert workflow.rename() == []  # already named
+    assert _results(workflow) == after
+
+    assert workflow.rollback_rename() == 6
+    assert _results(workflow) == before
+    assert latest_journal(workflow.settings.download_dir) is None
+
+
+def test_rename_leaves_unrelated_numbered_files_alone(workflow, workdir):
+    workflow.ingest(make_images(workdir / "in", 1))
+    (guid,) = workflow.ledger.known_guids(None)
+    download_dir = workflow.settings.download_dir
+    # named like a GUID's result with a trailing number, but not the name the ledger renders for it
+    unrelated = f"scan_{guid.guid}.json"
+    with open(os.path.join(download_dir, unrelated), "w") as f:
+        f.write("{}")
+
+    workflow.settings.result_name_template = "{original}_p{index}"
+    renames = workflow.rename()
+    assert len(renames) == 2
+    assert unrelated not in {src for src, _ in renames}
+    assert os.path.exists(os.path.join(download_dir, unrelated))
@@ -0,0 +1,97 @@
+import os
+import threading
+
+from conftest import make_images
+
+from ascdc_ocr.search import SearchIndex
+
+
+def _result(text, line_id=0):
+    return [{"text": ch, "line_id": line_id, "x": 10, "y": 10 + 30 * i, "width": 30, "height": 30}
+            for i, ch in enumerate(text)]
+
+
+def _segment_files(index_dir):
+    return sorted(n for n in os.listdir(index_dir) if n.endswith(".idx"))
+
+
+def test_downloads_are_searchable(settings, workflow, workdir):
+    settings.search_index = True
+    workflow.ingest(make_images(workdir / "in", 2))
+    workflow.writer.flush()
+    guid, result, original, _ = next(workflow.downloaded_results())
+    query = "".join(entry["text"] for entry in result[3:6])
+    hits = workflow.search(query)
+    assert hits and hits[0]["guid"] == guid and hits[0]["original"] == original
+
+
+def test_replaced_text_is_no_longer_found(workdir):
+    with SearchIndex(str(workdir / "index")) as index:
+        index.add(1, _result("天地玄黃"), "a.png", 1)
+        index.add(2, _result("宇宙洪荒"), "b.png", 1)
+        index.commit()
+        index.add(1, _result("日月盈昃"), "a.png", 1)
+        index.commit()
+        assert index.search("玄黃") == []
+        assert [hit["guid"] for hit in index.search("盈昃")] == [1]
+        assert len(index) == 2
+
+
+def test_optimize_keeps_live_text_only(workdir):
+    index_dir = str(workdir / "index")
+    index = SearchIndex(index_dir)
+    for guid, text in enumerate(["天地玄黃", "宇宙洪荒", "日月盈昃"], start=1):
+        index.add(guid, _result(text), f"{guid}.png", 1)
+        index.commit()
+    index.add(2, _result("辰宿列張"), "2.png", 1)
+    index.optimize()
+    assert len(_segment_files(index_dir)) == 1
+    assert index.search("洪荒") == []
+    assert [hit["guid"] for hit in index.search("列張")] == [2]
+    index.close()
+
+    with SearchIndex(index_dir) as reopened:
+        assert len(reopened) == 3
+        assert [hit["guid"] for hit in reopened.search("玄黃")] == [1]
+
+
+def test_small_commits_are_merged(workdir):
+    index_dir = str(workdir / "index")
+    with SearchIndex(index_dir, merge_factor=4) as index:
+        for guid in range(1, 101):
+            index.add(guid, _result(f"第{guid}頁"), f"{guid}.png", 1)
+            index.commit()
+        assert len(_segment_files(index_dir)) < 10
+        assert len(index._segments) == len(_segment_files(index_dir))
+        assert [hit["guid"] for hit in index.search("第37頁")] == [37]
+
+
+def test_search_during_optimize(workdir):
+    index = SearchIndex(str(workdir / "index"), merge_factor=1000)
+    for guid in range(1, 41):
+        index.add(guid, _result(f"第{guid}頁天地"), f"{guid}.png", 1)
+        index.commit()
+    stop, errors, counts = threading.Event(), [], []
+
+    def searcher():
+        while not stop.is_set():
+            try:
+                counts.append(len(index.search("天地")))
+            except Exception as e:  # a segment closed under the reader
+                errors.append(e)
+                return
+
+    threads = [threading.Thread(target=searcher) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    for round_ in range(5):
+        for guid in range(1, 41):
+            index.add(guid, _result(f"第{guid}頁天地{round_}"), f"{guid}.png", 1)
+            index.commit()
+        index.optimize()
+    stop.set()
+    for thread in threads:
+        thread.join()
+    index.close()
+    assert errors == []
+    assert counts and all(count == 40 for count in counts)
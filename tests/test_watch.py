@@ -0,0 +1,105 @@
+import os
+import sqlite3
+
+from conftest import make_images
+
+from ascdc_ocr.watch import FolderWatcher, WatchState
+
+
+class FlakyHandler:
+    """
+    Fails on the paths in `failing` (raises instead while `down` is set) and records every batch.
+    """
+    def __init__(self, failing=()):
+        self.failing = set(failing)
+        self.down = False
+        self.batches = []
+
+    def __call__(self, paths):
+        self.batches.append(sorted(paths))
+        if self.down:
+            raise ConnectionError("platform unreachable")
+        return [path for path in paths if path not in self.failing]
+
+
+def _pass(watcher):
+    watcher.scan()
+    return watcher.drain()
+
+
+def _status(state, path):
+    return state.file_state(path)["status"]
+
+
+def test_failed_file_is_retried_then_parked(workdir):
+    paths = make_images(workdir / "in", 3)
+    handler = FlakyHandler(failing=[paths[0]])
+    state = WatchState(str(workdir / "ledger.sqlite3"))
+    watcher = FolderWatcher(str(workdir / "in"), handler, state, settle=0, max_attempts=3)
+
+    assert _pass(watcher) == 2
+    assert _status(state, paths[0]) == "queued"
+    assert [_status(state, path) for path in paths[1:]] == ["done", "done"]
+    assert _pass(watcher) == 0
+    assert _pass(watcher) == 0
+    assert _status(state, paths[0]) == "failed"
+    assert handler.batches == [sorted(paths), [paths[0]], [paths[0]]]
+
+    assert _pass(watcher) == 0
+    assert len(handler.batches) == 3  # parked: not handed over again
+
+    # a new version of the file is queued again, with a fresh count of attempts
+    replacement = make_images(workdir / "new", 1, seed=1)[0]
+    os.replace(replacement, paths[0])
+    handler.failing.clear()
+    assert _pass(watcher) == 1
+    assert _status(state, paths[0]) == "done"
+    state.close()
+
+
+def test_handler_error_does_not_count_an_attempt(workdir):
+    paths = make_images(workdir / "in", 2)
+    handler = FlakyHandler()
+    handler.down = True
+    state = WatchState(str(workdir / "ledger.sqlite3"))
+    watcher = FolderWatcher(str(workdir / "in"), handler, state, settle=0, max_attempts=1)
+
+    for _ in range(3):
+        try:
+            _pass(watcher)
+        except ConnectionError:
+            pass
+    assert [_status(state, path) for path in paths] == ["queued", "queued"]
+
+    handler.down = False
+    assert _pass(watcher) == 2
+    assert [_status(state, path) for path in paths] == ["done", "done"]
+    state.close()
+
+
+def test_state_without_attempts_column_is_migrated(workdir):
+    db = str(workdir / "ledger.sqlite3")
+    conn = sqlite3.connect(db)
+    conn.execute("CREATE TABLE watched_files (path TEXT PRIMARY KEY, size INTEGER NOT NULL, "
+                 "mtime_ns INTEGER NOT NULL, status TEXT NOT NULL, updated_at REAL NOT NULL)")
+    conn.execute("INSERT INTO watched_files VALUES ('a.png', 1, 1, 'queued', 0)")
+    conn.commit()
+    conn.close()
+
+    state = WatchState(db)
+    assert state.retry([("a.png", 1, 1)], max_attempts=2) == []
+    assert state.retry([("a.png", 1, 1)], max_attempts=2) == ["a.png"]
+    assert state.queued() == []
+    state.close()
+
+
+def test_watch_ingests_new_files_once(mock_server, settings, workflow, workdir):
+    settings.update(watch_settle_seconds=0, watch_interval=0.1)
+    make_images(workdir / "in", 2)
+    workflow.watch(str(workdir / "in"), once=True)
+    assert mock_server.state.counters["upload.php"] == 2
+    assert len(os.listdir(settings.download_dir)) == 4
+
+    make_images(workdir / "in" / "more", 1, seed=1)
+    workflow.watch(str(workdir / "in"), once=True)
+    assert mock_server.state.counters["upload.php"] == 3
@@ -0,0 +1,52 @@
+import gzip
+import os
+
+from conftest import make_images
+
+from ascdc_ocr.models import GUID
+from ascdc_ocr.workflow import Workflow
+from ascdc_ocr.writer import ResultWriter, read_shard
+
+RESULT = [{"text": "一", "line_id": 1, "x": 0, "y": 0, "width": 10, "height": 10}]
+
+
+def _shard(download_dir):
+    (name,) = [n for n in os.listdir(download_dir) if ".jsonl" in n]
+    return os.path.join(download_dir, name)
+
+
+def test_jsonl_shard_cuts_off_a_torn_tail(settings, workdir):
+    settings.update(resume=True, result_layout="jsonl", result_format="compact")
+    with_torn_tail = Workflow(settings)
+    with_torn_tail.ingest(make_images(workdir / "a", 2))
+    with_torn_tail.close()
+    shard = _shard(settings.download_dir)
+    with open(shard, "ab") as f:
+        f.write(b'{"guid":999999,"name":"torn","res')  # a crash in the middle of a batch
+
+    workflow = Workflow(settings)
+    workflow.ingest(make_images(workdir / "b", 2, seed=1))
+    workflow.close()
+    with open(shard, "rb") as f:
+        lines = f.read().splitlines()
+    assert all(line.endswith(b"}") for line in lines)
+    records = list(read_shard(shard))
+    assert len(records) == 4
+    assert 999999 not in {r["guid"] for r in records}
+
+
+def test_gzip_shard_starts_a_new_shard_after_a_damaged_member(workdir):
+    download_dir = str(workdir / "out")
+    writer = ResultWriter(download_dir, fmt="gzip", layout="jsonl", fsync=False, background=False)
+    writer.submit(GUID(None, 1, "a.png", index=1), "a", RESULT)
+    writer.close()
+    with open(writer.shard_path, "ab") as f:
+        f.write(gzip.compress(b'{"guid":2}\n')[:-6])  # truncated member
+
+    writer = ResultWriter(download_dir, fmt="gzip", layout="jsonl", fsync=False, background=False)
+    writer.submit(GUID(None, 3, "c.png", index=1), "c", RESULT)
+    writer.close()
+    shards = sorted(os.listdir(download_dir))
+    assert shards == ["results-2.jsonl.gz", "results.jsonl.gz"]
+    records = [r for name in shards for r in read_shard(os.path.join(download_dir, name))]
+    assert sorted(r["guid"] for r in records) == [1, 3]